@@ -15,6 +15,27 @@ const getImageUrl = (path) => {
   return `${rootDomain}${cleanPath}`;
 };
 
+const JOB_POLL_INTERVAL_MS = 2000;
+// Stop polling after this long; the job may still finish and show up in the fort's history.
+const JOB_MAX_WAIT_MS = 10 * 60 * 1000;
+
+// Analyses are queued by the backend (202 Accepted); poll the job until a worker finishes it.
+const waitForAnalysisJob = async (queued) => {
+  const deadline = Date.now() + JOB_MAX_WAIT_MS;
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const response = await apiFetch(`/structural-analyses/jobs/${queued.job_id}/`);
+    const job = await response.json();
+    if (!response.ok || job.status === 'failed') {
+      throw new Error(job.error || 'Analysis failed');
+    }
+    if (job.status === 'done') {
+      return { ...queued, analysis: job.analysis };
+    }
+  }
+  throw new Error('Analysis is taking longer than expected. Refresh the dashboard later to see the result.');
+};
+
 const Stage2Dashboard = ({ setActiveStage }) => {
   const navigate = useNavigate();
   const [fortsData, setFortsData] = useState([]);
@@ -137,13 +158,15 @@ const Stage2Dashboard = ({ setActiveStage }) => {
         throw new Error(data.error || data.message || 'Upload failed');
       }
 
-      setUploadResult(data);
+      const result = response.status === 202 && data.job_id ? await waitForAnalysisJob(data) : data;
+
+      setUploadResult(result);
       await fetchData();
 
       setSelectedFile(null);
       setPreview(null);
 
-      if (data.is_first_upload || data.analysis) {
+      if (result.is_first_upload || result.analysis) {
         setTimeout(() => {
           setShowUpload(false);
           setUploadResult(null);
@@ -66,6 +66,7 @@ INSTALLED_APPS = [
 # -----------------------------
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # MUST BE FIRST
+    'home.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
 
@@ -188,4 +189,133 @@ EMAIL_USE_TLS = True
 # CUSTOM
 # -----------------------------
 NVIDIA_API_KEY = os.getenv('NVIDIA_API_KEY')
-ADMIN_REGISTRATION_SECRET = os.getenv('ADMIN_REGISTRATION_SECRET', 'durgsetu_admin_2026')
\ No newline at end of file
+ADMIN_REGISTRATION_SECRET = os.getenv('ADMIN_REGISTRATION_SECRET', 'durgsetu_admin_2026')
+
+# -----------------------------
+# STRUCTURAL DETECTOR
+# -----------------------------
+# 'inference' loads the detector (torch, ResNet trunk) when Django starts;
+# any other role defers it to the first analysis.
+PROCESS_ROLE = os.getenv('PROCESS_ROLE', 'web')
+
+# Default detection profile ('fast', 'balanced' or 'accurate'); forts and
+# individual requests can pick another one.
+DETECTION_PROFILE = os.getenv('DETECTION_PROFILE', 'accurate')
+
+# Truncated trunk weights written by `manage.py build_backbone_bundle`
+# (e.g. resnet50_layer2.pt); without a bundle the detector downloads the
+# full torchvision model.
+BACKBONE_WEIGHTS_DIR = os.getenv('BACKBONE_WEIGHTS_DIR', os.path.join(BASE_DIR, 'home', 'weights'))
+
+# Trunk execution backend: 'eager' (fp32), 'torchscript' (traced + frozen) or
+# 'int8' (static quantization written to BACKBONE_WEIGHTS_DIR by
+# `manage.py calibrate_int8_backbone`).
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'eager')
+
+# Longest side (px) analyses run at; 0 keeps native resolution.  Larger
+# JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale and area-resized,
+# which cuts decode time and memory for 12-48 MP uploads (e.g. 2048).
+ANALYSIS_MAX_SIDE = int(os.getenv('ANALYSIS_MAX_SIDE', 0))
+
+# Register every image once to its fort's reference image and compose the
+# stored homographies per analysis instead of matching each pair.
+ALIGNMENT_REGISTRATION = os.getenv('ALIGNMENT_REGISTRATION', 'True') == 'True'
+
+# Pairwise alignment tries these tiers cheapest first ('phase' correlation,
+# 'orb', 'akaze' keypoints) and stops at the first that passes its gate;
+# keypoint tiers need ALIGNMENT_MIN_INLIERS RANSAC inliers making up
+# ALIGNMENT_MIN_INLIER_RATIO of their ratio-test matches.
+ALIGNMENT_TIERS = [t.strip() for t in os.getenv('ALIGNMENT_TIERS', 'phase,orb,akaze').split(',') if t.strip()]
+ALIGNMENT_MIN_INLIERS = int(os.getenv('ALIGNMENT_MIN_INLIERS', 30))
+ALIGNMENT_MIN_INLIER_RATIO = float(os.getenv('ALIGNMENT_MIN_INLIER_RATIO', 0.3))
+
+# Aligned pairs whose low-resolution statistics stay below (1 - PRESCREEN_MARGIN)
+# of what the smallest detectable change produces are reported SAFE
+# without the deep difference (see home/prescreen.py).  Opt-in: the floors are
+# calibrated on synthetic pairs only, so validate them on the deployment's own
+# fort pairs (e.g. with `manage.py evaluate_detector`) before enabling.
+PRESCREEN_ENABLED = os.getenv('PRESCREEN_ENABLED', 'False') == 'True'
+PRESCREEN_MARGIN = float(os.getenv('PRESCREEN_MARGIN', 0.5))
+
+# Compare the adaptive threshold's diff statistics on the 0-1 scale of its
+# min/max bounds, so k_factor moves it.  Off by default: the original 0-255
+# statistics nearly always clamp to the max bound, and switching changes what
+# gets flagged, so compare `manage.py evaluate_detector` reports with and
+# without --scaled-threshold on the deployment's fort pairs before enabling.
+ADAPTIVE_THRESHOLD_SCALED = os.getenv('ADAPTIVE_THRESHOLD_SCALED', 'False') == 'True'
+
+# The reported SSIM is computed with the longest side at SSIM_MAX_SIDE px
+# (0 = native resolution), with a uniform 7x7 or Gaussian (SSIM_GAUSSIAN) window.
+# Downscaling is much faster but averages out noise, so scores run higher
+# than native ones; keep it fixed within a deployment's history.
+SSIM_MAX_SIDE = int(os.getenv('SSIM_MAX_SIDE', 0))
+SSIM_GAUSSIAN = os.getenv('SSIM_GAUSSIAN', 'False') == 'True'
+
+# Annotated result images: lossless png (large: 10-30 MB for 12 MP frames),
+# or jpeg or webp at ANNOTATION_QUALITY (1-100), shrunk to at most
+# ANNOTATION_MAX_SIDE px on the longest side (0 = analysis resolution).
+# png is what analyses stored before the option existed.
+ANNOTATION_FORMAT = os.getenv('ANNOTATION_FORMAT', 'png')
+ANNOTATION_QUALITY = int(os.getenv('ANNOTATION_QUALITY', 90))
+ANNOTATION_MAX_SIDE = int(os.getenv('ANNOTATION_MAX_SIDE', 0))
+
+# Native-resolution deep difference for frames larger than the profile's
+# input size: overlapping tiles encoded DEEP_DIFF_TILE_BATCH at a time
+# (bounds memory), at most DEEP_DIFF_MAX_TILES per frame (bounds latency).
+DEEP_DIFF_TILING = os.getenv('DEEP_DIFF_TILING', 'False') == 'True'
+DEEP_DIFF_TILE_SIZE = int(os.getenv('DEEP_DIFF_TILE_SIZE', 1024))
+DEEP_DIFF_TILE_OVERLAP = int(os.getenv('DEEP_DIFF_TILE_OVERLAP', 128))
+DEEP_DIFF_TILE_BATCH = int(os.getenv('DEEP_DIFF_TILE_BATCH', 2))
+DEEP_DIFF_MAX_TILES = int(os.getenv('DEEP_DIFF_MAX_TILES', 64))
+
+# Whole-fort GeoTIFF orthomosaics (.tif/.tiff FortImages) are memory-mapped
+# and analysed in tile pairs of this size; the annotated image is an overview
+# with ORTHOMOSAIC_OVERVIEW_SIZE as its longest side.
+ORTHOMOSAIC_TILE_SIZE = int(os.getenv('ORTHOMOSAIC_TILE_SIZE', 2048))
+ORTHOMOSAIC_TILE_OVERLAP = int(os.getenv('ORTHOMOSAIC_TILE_OVERLAP', 256))
+ORTHOMOSAIC_OVERVIEW_SIZE = int(os.getenv('ORTHOMOSAIC_OVERVIEW_SIZE', 2048))
+
+# Per-image layer2 feature maps reused when an image becomes the "previous"
+# image of the next analysis (fp16 on disk, ~16 MB per image).
+FEATURE_CACHE_ENABLED = os.getenv('FEATURE_CACHE_ENABLED', 'True') == 'True'
+FEATURE_CACHE_DIR = os.getenv('FEATURE_CACHE_DIR', os.path.join(BASE_DIR, 'feature_cache'))
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv('FEATURE_CACHE_MAX_ENTRIES', 256))
+FEATURE_CACHE_MAX_BYTES = int(os.getenv('FEATURE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Micro-batch concurrent CNN forward passes (useful with threaded workers).
+INFERENCE_BATCHING = os.getenv('INFERENCE_BATCHING', 'False') == 'True'
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 5.0))
+
+# Analyses run in `manage.py run_analysis_worker` processes; the analyze
+# endpoint returns 202 with a job id.  Set ANALYSIS_ASYNC=False to analyse
+# inside the request (e.g. local runserver without a worker).
+ANALYSIS_ASYNC = os.getenv('ANALYSIS_ASYNC', 'True') == 'True'
+ANALYSIS_WORKER_PROCESSES = int(os.getenv('ANALYSIS_WORKER_PROCESSES', 1))
+ANALYSIS_WORKER_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', 1))  # jobs per process sharing one model
+ANALYSIS_JOB_POLL_INTERVAL = float(os.getenv('ANALYSIS_JOB_POLL_INTERVAL', 1.0))
+ANALYSIS_JOB_TIMEOUT = int(os.getenv('ANALYSIS_JOB_TIMEOUT', 600))  # seconds without a heartbeat before a RUNNING job is presumed lost
+ANALYSIS_JOB_HEARTBEAT_INTERVAL = float(os.getenv('ANALYSIS_JOB_HEARTBEAT_INTERVAL', 30))  # seconds between heartbeats of a running job
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', 2))
+
+# Byte-identical re-uploads (SHA-256) reuse the fort's stored image, and an
+# analysis of an already analysed (previous, current, configuration)
+# triple is served from the AnalysisMemo table.
+UPLOAD_DEDUPLICATION = os.getenv('UPLOAD_DEDUPLICATION', 'True') == 'True'
+ANALYSIS_MEMO = os.getenv('ANALYSIS_MEMO', 'True') == 'True'
+
+# Per-stage timings of every analysis (decode, alignment, CNN, SSIM, blob
+# filtering, clustering, rendering, encoding) in analysis_results['timings']
+# and a per-process summary.  ANALYSIS_TRACE_FILE appends each analysis as
+# Chrome trace events (open in Perfetto or speedscope for a flame graph).
+ANALYSIS_TIMINGS = os.getenv('ANALYSIS_TIMINGS', 'True') == 'True'
+ANALYSIS_TRACE_FILE = os.getenv('ANALYSIS_TRACE_FILE', '')
+
+# Prometheus metrics at /metrics (request and stage latency, analyses by
+# risk level, cache hits, report outcomes, in-flight analyses, model state).
+# Set PROMETHEUS_MULTIPROC_DIR in the environment to aggregate every
+# gunicorn and analysis worker process (start.sh does).  Scrapers send
+# METRICS_TOKEN as "Authorization: Bearer <token>"; /metrics answers 404
+# until a token is set.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
@@ -0,0 +1,13 @@
+"""
+Offline performance benchmarks for the structural analysis pipeline.
+
+Run from the backend/ directory, e.g.::
+
+    python -m benchmarks.bench_inference_batching
+
+Benchmarks use randomly initialised weights where accuracy is irrelevant,
+so they never need network access.  `bench_detector` times every detector
+stage on the synthetic pairs of `synthetic.py` and compares two runs for
+regressions; the other modules each compare one optimization with the code
+it replaced.
+"""
@@ -0,0 +1,174 @@
+"""
+Pairwise alignment: the tiered engine (alignment.py) against the previous
+single path (CLAHE + AKAZE, brute-force knnMatch, Python ratio-test loop,
+RANSAC).
+
+Synthetic stone-wall pairs at --megapixels, one per scenario:
+
+  reshoot     same viewpoint, small shift, missing stones + vegetation
+  drift       0.3-0.8 deg rotation, 1 % scale, shift (tripod / ortho tile)
+  rotated     2-4 deg rotation, 3 % scale, mild perspective
+  lighting    `rotated` with exposure and contrast changes
+
+For each engine reports the median time over --repeat runs (decoded frames,
+pyramid levels built inside the timed region as in an analysis), the tier
+that answered and the max error (px) of the 10 %/90 % frame corners against
+the true homography.  Also times descriptor matching alone (BFMatcher +
+loop vs ratio_matches: FLANN LSH or exact batchDistance, vectorised ratio
+test) on the rotated pair's ORB and AKAZE descriptors.
+
+    python -m benchmarks.bench_alignment --megapixels 2 12
+"""
+import argparse
+import json
+import statistics
+import time
+
+SCENARIOS = ('reshoot', 'drift', 'rotated', 'lighting')
+
+
+def legacy_homography(past, current):
+    """The pre-tiered estimate_homography, kept here as the baseline."""
+    import cv2
+    import numpy as np
+
+    def features(img):
+        scale = 1000.0 / max(img.shape[:2])
+        small = cv2.resize(img, (0, 0), fx=scale, fy=scale) if scale < 1 else img
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        l, a, b = cv2.split(cv2.cvtColor(small, cv2.COLOR_BGR2LAB))
+        processed = cv2.cvtColor(cv2.merge((clahe.apply(l), a, b)), cv2.COLOR_LAB2BGR)
+        kps, des = cv2.AKAZE_create().detectAndCompute(processed, None)
+        size = (small.shape[1], small.shape[0])
+        return np.float32([kp.pt for kp in kps]).reshape(-1, 2) / np.float32(size), des
+
+    (pts1, des1), (pts2, des2) = features(past), features(current)
+    good = legacy_matches(des1, des2)
+    if len(good) < 10:
+        return None
+    size = np.float32([past.shape[1], past.shape[0]])
+    src = (pts1[[m.queryIdx for m in good]] * size).reshape(-1, 1, 2)
+    dst = (pts2[[m.trainIdx for m in good]] * size).reshape(-1, 1, 2)
+    M, _ = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+    return M
+
+
+def legacy_matches(des1, des2):
+    import cv2
+
+    good = []
+    for pair in cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(des1, des2, k=2):
+        if len(pair) == 2 and pair[0].distance < 0.75 * pair[1].distance:
+            good.append(pair[0])
+    return good
+
+
+def make_scenario(name, ground, rng):
+    import cv2
+    import numpy as np
+
+    from .synthetic import add_missing_stone, add_vegetation
+
+    height, width = ground.shape[:2]
+    shift = [rng.uniform(-0.02, 0.02) * width, rng.uniform(-0.02, 0.02) * height]
+    if name == 'reshoot':
+        angle, scale, tilt = 0.0, 1.0, (0.0, 0.0)
+    elif name == 'drift':
+        angle, scale, tilt = rng.choice([-1, 1]) * rng.uniform(0.3, 0.8), rng.uniform(0.99, 1.01), (0.0, 0.0)
+    else:
+        angle, scale = rng.choice([-1, 1]) * rng.uniform(2, 4), rng.uniform(0.97, 1.03)
+        tilt = tuple(rng.uniform(-8e-6, 8e-6, 2) * 1000 / width)
+    A = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+    H = np.array([[A[0, 0], A[0, 1], A[0, 2] + shift[0]], [A[1, 0], A[1, 1], A[1, 2] + shift[1]], [*tilt, 1.0]])
+    current = cv2.warpPerspective(ground, H, (width, height))
+    if name == 'reshoot':
+        for _ in range(4):
+            add_missing_stone(current, rng)
+        add_vegetation(current, rng)
+    if name == 'lighting':
+        current = cv2.convertScaleAbs(current, alpha=0.65, beta=45)
+    return current, H
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[2, 12])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    import cv2
+    import numpy as np
+
+    from home.alignment import AlignmentConfig, estimate_tiered, ratio_matches
+    from home.image_pyramid import ImagePyramid
+    from home.structural_detector import StructuralChangeDetector
+
+    from .synthetic import stone_wall
+
+    # Alignment only: the CNN trunk is never run, so skip loading one.
+    detector = StructuralChangeDetector.__new__(StructuralChangeDetector)
+    detector.alignment = AlignmentConfig()
+
+    def timed(fn):
+        runs, out = [], None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = fn()
+            runs.append(time.perf_counter() - start)
+        return statistics.median(runs) * 1000, out
+
+    results = []
+    for mp in args.megapixels:
+        width = int(round((mp * 1e6 * 4 / 3) ** 0.5))
+        height = width * 3 // 4
+        ground = cv2.resize(stone_wall(height // 2, width // 2, seed=5), (width, height),
+                            interpolation=cv2.INTER_CUBIC)
+        corners = np.float32([[[0.1 * width, 0.1 * height]], [[0.9 * width, 0.1 * height]],
+                              [[0.9 * width, 0.9 * height]], [[0.1 * width, 0.9 * height]]])
+
+        def corner_error(M, expected):
+            if M is None:
+                return float('inf')
+            return float(np.abs(cv2.perspectiveTransform(corners, M) - cv2.perspectiveTransform(corners, expected)).max())
+
+        rng = np.random.default_rng(0)
+        for scenario in SCENARIOS:
+            current, expected = make_scenario(scenario, ground, rng)
+            legacy_ms, M_legacy = timed(lambda: legacy_homography(ground, current))
+            tiered_ms, (M, report) = timed(
+                lambda: estimate_tiered(detector, ImagePyramid(ground), ImagePyramid(current), detector.alignment))
+            r = {
+                'megapixels': mp, 'scenario': scenario,
+                'legacy_ms': legacy_ms, 'legacy_error_px': corner_error(M_legacy, expected),
+                'tiered_ms': tiered_ms, 'tiered_error_px': corner_error(M, expected),
+                'tier': report['tier'], 'passed': report['passed'],
+            }
+            results.append(r)
+            print(
+                f"{mp:4.0f} MP {scenario:>9}: legacy {legacy_ms:6.0f} ms ({r['legacy_error_px']:5.2f} px)  "
+                f"tiered {tiered_ms:6.0f} ms ({r['tiered_error_px']:5.2f} px, {r['tier']})"
+            )
+
+    # Matching alone, on the last size's rotated pair
+    from home.alignment import orb_features
+
+    current, _ = make_scenario('rotated', ground, np.random.default_rng(1))
+    matching = []
+    for name, extract in (('orb', orb_features), ('akaze', detector.alignment_features)):
+        _, des1, _ = extract(ground)
+        _, des2, _ = extract(current)
+        bf_ms, good = timed(lambda: legacy_matches(des1, des2))
+        new_ms, (query, _) = timed(lambda: ratio_matches(des1, des2))
+        matching.append({'features': name, 'descriptors': [len(des1), len(des2)], 'bf_loop_ms': bf_ms,
+                         'bf_matches': len(good), 'ratio_matches_ms': new_ms, 'matches': len(query)})
+        print(f"matching {len(des1)} x {len(des2)} {name} descriptors: BFMatcher + loop {bf_ms:.1f} ms "
+              f"({len(good)} matches), ratio_matches {new_ms:.1f} ms ({len(query)} matches)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'pairs': results, 'matching': matching}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
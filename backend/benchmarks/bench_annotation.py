@@ -0,0 +1,110 @@
+"""
+Annotated images: the previous visualize_results (a full-frame copy and
+blend per detection) with a lossless PNG against home/annotation.py's
+single-pass renderer and each --encodings.
+
+A synthetic stone-wall frame of --megapixels carries 10, 100 and 1000
+random detections (--counts).  Reports the median render and encode time
+over --repeat runs and the encoded size.  Encodings are format:quality
+with an optional :max_side, e.g. jpeg:90, webp:80, png, jpeg:85:2048.
+
+    python -m benchmarks.bench_annotation --megapixels 12 --counts 10 100 1000
+"""
+import argparse
+import json
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from home.annotation import AnnotationConfig, encode, render
+
+from .synthetic import stone_wall
+
+
+def legacy_visualize(current_img, results):
+    """StructuralChangeDetector.visualize_results before annotation.py."""
+    out = current_img.copy()
+    colors = {'SAFE': (0, 255, 0), 'LOW': (0, 255, 255), 'MEDIUM': (0, 165, 255), 'HIGH': (0, 0, 255),
+              'CRITICAL': (0, 0, 128)}
+    level = results['risk_assessment']['level']
+    color = colors.get(level, (0, 255, 0))
+    for i, det in enumerate(results['detections']):
+        x, y, w, h = det['bbox']
+        overlay = out.copy()
+        cv2.rectangle(overlay, (x, y), (x + w, y + h), color, -1)
+        cv2.addWeighted(overlay, 0.3, out, 0.7, 0, out)
+        cv2.rectangle(out, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(out, f"#{i+1} Conf:{det['confidence']:.2f}", (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    cv2.rectangle(out, (0, 0), (300, 100), (0, 0, 0), -1)
+    cv2.putText(out, f"Risk: {level}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    cv2.putText(out, f"Changes: {results['total_changes']}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    cv2.putText(out, f"Global Score: {results['cnn_distance']:.2f}", (10, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                (200, 200, 200), 1)
+    return out
+
+
+def make_results(count, width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(20, max(21, width // 20), (count, 2))
+    corners = rng.integers(0, np.array([width, height]) - sizes)
+    return {
+        'detections': [{'bbox': (x, y, w, h), 'confidence': c}
+                       for (x, y), (w, h), c in zip(corners.tolist(), sizes.tolist(), rng.uniform(0.1, 1, count).tolist())],
+        'total_changes': count, 'risk_assessment': {'level': 'HIGH'}, 'cnn_distance': 0.42,
+    }
+
+
+def parse_encoding(text):
+    parts = text.split(':')
+    return AnnotationConfig(parts[0], int(parts[1]) if len(parts) > 1 else 90, int(parts[2]) if len(parts) > 2 else None)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return out, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--encodings', nargs='+', default=['jpeg:90', 'webp:80', 'png', 'jpeg:85:2048'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    width = int(round((args.megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = width * 3 // 4
+    frame = cv2.resize(stone_wall(height // 2, width // 2, seed=3), (width, height), interpolation=cv2.INTER_CUBIC)
+    print(f"{width}x{height} frame")
+
+    rows = []
+    for count in args.counts:
+        results = make_results(count, width, height)
+        out, render_ms = timed(lambda: legacy_visualize(frame, results), args.repeat)
+        data, encode_ms = timed(lambda: cv2.imencode('.png', out)[1].tobytes(), args.repeat)
+        rows.append({'count': count, 'method': 'legacy png', 'render_ms': render_ms, 'encode_ms': encode_ms,
+                     'bytes': len(data)})
+        for text in args.encodings:
+            config = parse_encoding(text)
+            out, render_ms = timed(lambda: render(frame, results, config.max_side), args.repeat)
+            data, encode_ms = timed(lambda: encode(out, config), args.repeat)
+            rows.append({'count': count, 'method': text, 'render_ms': render_ms, 'encode_ms': encode_ms,
+                         'bytes': len(data)})
+        for r in rows[-len(args.encodings) - 1:]:
+            print(f"{count:5d} detections {r['method']:>13}: render {r['render_ms']:8.1f} ms  "
+                  f"encode {r['encode_ms']:7.1f} ms  {r['bytes'] / 1024 ** 2:6.2f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Detection clustering: the previous scikit-learn DBSCAN(min_samples=1)
+labelling with per-cluster dict loops against home/clustering.py (grid
+union-find and NumPy box merging), on synthetic detections of a 4000x3000
+frame at each --counts.
+
+Blobs are half scattered over the frame and half piled into a few damaged
+areas (Gaussian spots of 150 px), the pattern the ultra-sensitive profiles
+produce.  Reports the median time of each method over --repeat runs, the
+cluster count and whether both return the same merged detections.
+
+    python -m benchmarks.bench_clustering --counts 1000 10000 100000
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from home.clustering import cluster_detections
+
+WIDTH, HEIGHT = 4000, 3000
+
+
+def make_detections(count, seed=0):
+    rng = np.random.default_rng(seed)
+    scattered = rng.uniform((0, 0), (WIDTH, HEIGHT), (count - count // 2, 2))
+    centres = rng.uniform((300, 300), (WIDTH - 300, HEIGHT - 300), (8, 2))
+    piled = centres[rng.integers(0, len(centres), count // 2)] + rng.normal(0, 150, (count // 2, 2))
+    centroids = np.clip(np.concatenate([scattered, piled]), 0, (WIDTH - 1, HEIGHT - 1)).astype(int)
+    sizes = rng.integers(2, 40, (count, 2))
+    corners = centroids - sizes // 2
+    severities = rng.choice(['Minor', 'Moderate', 'Critical'], count, p=[0.8, 0.15, 0.05])
+    return [
+        {
+            'bbox': (x, y, w, h),
+            'area': w * h * 0.6,
+            'confidence': c,
+            'severity': s,
+            'centroid': (x + w // 2, y + h // 2),
+        }
+        for (x, y), (w, h), c, s in zip(corners.tolist(), sizes.tolist(), rng.uniform(0.1, 1, count).tolist(),
+                                        severities.tolist())
+    ]
+
+
+def legacy_merge_group(members):
+    x1 = min(d['bbox'][0] for d in members)
+    y1 = min(d['bbox'][1] for d in members)
+    x2 = max(d['bbox'][0] + d['bbox'][2] for d in members)
+    y2 = max(d['bbox'][1] + d['bbox'][3] for d in members)
+    area = sum(d['area'] for d in members)
+    conf = max(d['confidence'] for d in members)
+    severities = [d.get('severity', 'Minor') for d in members]
+    if "Critical" in severities:
+        final_severity = "Critical"
+    elif "Moderate" in severities:
+        final_severity = "Moderate"
+    else:
+        final_severity = "Minor"
+    if area > 5000:
+        final_severity = "Critical"
+    return {'bbox': (x1, y1, x2 - x1, y2 - y1), 'area': area, 'confidence': conf,
+            'severity': final_severity, 'centroid': ((x1 + x2) // 2, (y1 + y2) // 2)}
+
+
+def legacy_cluster(detections, eps):
+    """StructuralChangeDetector.cluster_detections before clustering.py."""
+    from sklearn.cluster import DBSCAN
+
+    centroids = np.array([det['centroid'] for det in detections])
+    labels = DBSCAN(eps=eps, min_samples=1).fit_predict(centroids)
+    merged = []
+    for label in set(labels):
+        indices = np.where(labels == label)[0]
+        merged.append(legacy_merge_group([detections[i] for i in indices]))
+    return merged
+
+
+def same(a, b):
+    key = lambda d: (d['bbox'], d['severity'], round(d['area'], 3), d['confidence'])
+    return len(a) == len(b) and sorted(map(key, a)) == sorted(map(key, b))
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return out, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--eps', type=float, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    results = []
+    for count in args.counts:
+        detections = make_detections(count)
+        legacy, legacy_ms = timed(lambda: legacy_cluster(detections, args.eps), args.repeat)
+        grid, grid_ms = timed(lambda: cluster_detections(detections, args.eps), args.repeat)
+        r = {'count': count, 'clusters': len(grid), 'dbscan_ms': legacy_ms, 'grid_ms': grid_ms,
+             'identical': same(legacy, grid)}
+        results.append(r)
+        print(f"{count:7d} detections -> {r['clusters']:6d} clusters  DBSCAN {legacy_ms:9.1f} ms  "
+              f"grid {grid_ms:8.1f} ms  x{legacy_ms / grid_ms:5.1f}  identical: {r['identical']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Latency and detection overlap of the detection profiles.
+
+Runs detect_structural_changes for every profile on synthetic fort-wall
+pairs with known changes and compares each profile with 'accurate' (the
+ResNet50 / 1024 pipeline all analyses used before profiles existed):
+
+  detect ms         median full detect_structural_changes time
+  vs accurate       fraction of accurate's detections the profile also
+                    finds, and of its detections that accurate also finds
+                    (IoU >= --iou; boxes differ slightly across resolutions)
+  ground truth      fraction of painted-in changes hit by a detection
+  risk agreement    pairs where the risk level equals accurate's
+
+Without --weights-dir every trunk has random weights, which measures
+latency and how the resolution/trunk choice shifts detections, but not
+the ImageNet features' real accuracy; point it at BACKBONE_WEIGHTS_DIR
+after `manage.py build_backbone_bundle` for that.
+
+    python -m benchmarks.bench_detection_profiles --pairs 6
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision  # noqa: E402
+from home.detection_profiles import PROFILES  # noqa: E402
+from home.structural_detector import StructuralChangeDetector  # noqa: E402
+
+from .matching import matched_fraction  # noqa: E402
+from .synthetic import make_pair  # noqa: E402
+
+REFERENCE = 'accurate'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights-dir', help='Directory of trunk bundles (default: random weights).')
+    parser.add_argument('--pairs', type=int, default=6)
+    parser.add_argument('--size', type=int, default=1024, help='Synthetic image size.')
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--iou', type=float, default=0.3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    pairs = [make_pair(args.size, seed=200 + i) for i in range(args.pairs)]
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_dir = args.weights_dir or tmpdir
+        for name, profile in PROFILES.items():
+            path = os.path.join(weights_dir, bundle_filename(profile.backbone))
+            if not args.weights_dir:
+                save_bundle(trunk_from_torchvision(None, arch=profile.backbone), path, 'random', arch=profile.backbone)
+            detector = StructuralChangeDetector(weights_path=path, profile=name)
+
+            times, outputs = [], []
+            for past, current, _ in pairs:
+                pair_times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    result = detector.detect_structural_changes(past, current)
+                    pair_times.append(time.perf_counter() - start)
+                times.append(min(pair_times))
+                outputs.append(result)
+            runs[name] = (times, outputs)
+
+    reference_outputs = runs[REFERENCE][1]
+    results = {}
+    for name, (times, outputs) in runs.items():
+        recovered, matching, truth, risk = [], [], [], []
+        for (_, _, changes), output, ref in zip(pairs, outputs, reference_outputs):
+            boxes = [d['bbox'] for d in output['detections']]
+            ref_boxes = [d['bbox'] for d in ref['detections']]
+            recovered.append(matched_fraction(ref_boxes, boxes, args.iou))
+            matching.append(matched_fraction(boxes, ref_boxes, args.iou))
+            truth.append(matched_fraction([box for _, box in changes], boxes, args.iou))
+            risk.append(output['risk_assessment']['level'] == ref['risk_assessment']['level'])
+        profile = PROFILES[name]
+        results[name] = {
+            'backbone': profile.backbone,
+            'input_size': list(profile.input_size),
+            'detect_ms': statistics.median(times) * 1000,
+            'accurate_detections_recovered': statistics.mean(recovered),
+            'detections_matching_accurate': statistics.mean(matching),
+            'ground_truth_recall': statistics.mean(truth),
+            'risk_agreement': sum(risk) / len(risk),
+        }
+        r = results[name]
+        print(
+            f"{name:>8} ({profile.backbone} @ {profile.input_size[0]}): detect {r['detect_ms']:6.0f} ms | "
+            f"vs accurate recovered {r['accurate_detections_recovered']:.2f} "
+            f"matching {r['detections_matching_accurate']:.2f} | "
+            f"ground truth recall {r['ground_truth_recall']:.2f} | risk agreement {r['risk_agreement']:.2f}"
+        )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
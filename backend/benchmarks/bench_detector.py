@@ -0,0 +1,214 @@
+"""
+Stage timings of the whole detector on synthetic fort-wall pairs.
+
+Every scenario is generated at each of --sizes (square frames, in pixels)
+and run through the detector the analysis workers use
+(detector_singleton, so prescreening, tiling, SSIM and annotation follow
+the Django settings) with a random-weight trunk for --profile:
+
+  unchanged       the same wall photographed twice
+  missing_stones  three stones knocked out of the wall
+  crack           two cracks
+  vegetation      two patches of growth
+  lighting        a missing stone, surveyed at another time of day
+  warp            a missing stone and a crack, past survey from another viewpoint
+  mixed           all of the above at once
+
+Each run is recorded with home/timings.py: detect_structural_changes'
+stages (align, prescreen, warp, preprocess, cnn, distance, deep_diff,
+contours, blob_filter, cluster, ssim, risk) plus render and encode of the
+annotated image, as run_structural_analysis does.  Reports the median of
+--repeat warm runs per stage, the detections and how many painted-in
+changes they hit; --json writes them with the machine and library
+versions.
+
+--compare BASE NEW reads two such files and flags every stage that got
+slower by more than --threshold (relative) and --min-ms (absolute); it
+exits with status 1 if any did, so it can gate a CI job.
+
+    python -m benchmarks.bench_detector --json before.json
+    python -m benchmarks.bench_detector --json after.json
+    python -m benchmarks.bench_detector --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    'unchanged': {'changes': ()},
+    'missing_stones': {'changes': ('missing_stone',) * 3},
+    'crack': {'changes': ('crack', 'crack')},
+    'vegetation': {'changes': ('vegetation', 'vegetation')},
+    'lighting': {'changes': ('missing_stone',), 'lighting': 1.0},
+    'warp': {'changes': ('missing_stone', 'crack'), 'warp': 1.0},
+    'mixed': {'changes': ('missing_stone', 'crack', 'vegetation'), 'lighting': 1.0, 'warp': 1.0},
+}
+
+
+def environment(profile):
+    import cv2
+    import numpy as np
+    import torch
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'profile': profile,
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def run(args):
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    import torch
+    from django.conf import settings
+
+    from home import detector_singleton, timings
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+    from home.detection_profiles import get_profile
+
+    from .matching import matched_fraction
+    from .synthetic import make_pair
+
+    profile = args.profile or settings.DETECTION_PROFILE
+    arch = get_profile(profile).backbone
+    torch.set_grad_enabled(False)
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        save_bundle(trunk_from_torchvision(None, arch=arch), os.path.join(tmpdir, bundle_filename(arch)), 'random',
+                    arch=arch)
+        settings.BACKBONE_WEIGHTS_DIR = tmpdir
+        settings.FEATURE_CACHE_ENABLED = False
+        settings.INFERENCE_BACKEND = 'eager'
+        detector = detector_singleton.get_detector(profile)
+
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                past, current, changes = make_pair(size, seed=args.seed, **SCENARIOS[scenario])
+
+                def analyze():
+                    with timings.recording() as rec:
+                        result = detector.detect_structural_changes(past, current)
+                        with timings.stage('render'):
+                            annotated = detector.visualize_results(current, result)
+                        with timings.stage('encode'):
+                            detector.save_annotated_image(annotated)
+                    return result, rec.timings()
+
+                analyze()  # warm-up: pyramids, buffers and lazy imports
+                runs = [analyze() for _ in range(args.repeat)]
+                result = runs[0][0]
+                stages = {}
+                for _, run_timings in runs:
+                    for stage, ms in run_timings.items():
+                        stages.setdefault(stage, []).append(ms)
+                boxes = [d['bbox'] for d in result['detections']]
+                r = {
+                    'scenario': scenario,
+                    'size': size,
+                    'stages': {stage: round(statistics.median(ms), 2) for stage, ms in stages.items()},
+                    'detections': len(boxes),
+                    'risk_level': result['risk_assessment']['level'],
+                    'ground_truth_recall': (matched_fraction([box for _, box in changes], boxes, args.iou)
+                                            if changes else None),
+                }
+                results.append(r)
+                slowest = sorted((ms, stage) for stage, ms in r['stages'].items() if stage != 'total')[-3:]
+                print(f"{size:>5} {scenario:>14}: {r['stages']['total']:8.1f} ms  "
+                      f"{r['detections']:3d} detections  {r['risk_level']:>8}  slowest: "
+                      + ', '.join(f"{stage} {ms:.1f}" for ms, stage in reversed(slowest)))
+
+    report = {'environment': environment(profile), 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compare(base, new, threshold=0.10, min_ms=2.0):
+    """Stages slower (or faster) in `new` than in `base` beyond both thresholds, as (kind, row) pairs."""
+    base_runs = {(r['scenario'], r['size']): r['stages'] for r in base['results']}
+    changes = []
+    for r in new['results']:
+        before = base_runs.get((r['scenario'], r['size']))
+        if before is None:
+            continue
+        for stage, ms in r['stages'].items():
+            if stage not in before:
+                continue
+            delta = ms - before[stage]
+            if abs(delta) < min_ms or abs(delta) < threshold * before[stage]:
+                continue
+            changes.append(('regression' if delta > 0 else 'improvement', {
+                'scenario': r['scenario'], 'size': r['size'], 'stage': stage,
+                'base_ms': before[stage], 'new_ms': ms,
+                'change': round(delta / before[stage], 3) if before[stage] else None,
+            }))
+    return changes
+
+
+def run_compare(args):
+    with open(args.compare[0]) as f:
+        base = json.load(f)
+    with open(args.compare[1]) as f:
+        new = json.load(f)
+    for key in ('profile', 'cpus', 'torch_threads', 'torch'):
+        if base['environment'].get(key) != new['environment'].get(key):
+            print(f"warning: {key} differs ({base['environment'].get(key)} vs {new['environment'].get(key)})")
+
+    changes = compare(base, new, args.threshold, args.min_ms)
+    for kind, c in changes:
+        change = f"{c['change']:+.0%}" if c['change'] is not None else 'new'
+        print(f"{kind:>11}: {c['size']:>5} {c['scenario']:>14} {c['stage']:>12} "
+              f"{c['base_ms']:8.1f} -> {c['new_ms']:8.1f} ms ({change})")
+    regressions = sum(kind == 'regression' for kind, _ in changes)
+    print(f"{regressions} regression(s), {len(changes) - regressions} improvement(s) "
+          f"beyond {args.threshold:.0%} and {args.min_ms} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([{'kind': kind, **c} for kind, c in changes], f, indent=2)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', help='Detection profile (default: DETECTION_PROFILE).')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048], help='Synthetic frame sizes.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=11)
+    parser.add_argument('--iou', type=float, default=0.1, help='Overlap for a detection to hit a painted-in change.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Compare two --json result files.')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative slowdown flagged by --compare.')
+    parser.add_argument('--min-ms', type=float, default=2.0, help='Absolute slowdown flagged by --compare.')
+    parser.add_argument('--json', help='Write results (or the comparison) to this file.')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(run_compare(args))
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Upload decode cost: full decode vs reduced-scale JPEG decode.
+
+For 12 MP and 48 MP stone-wall JPEGs (quality 92), each mode runs in a
+fresh interpreter that reads the file bytes, resets the peak-RSS counter
+(/proc/self/clear_refs) and then times, median of --repeat runs:
+
+  decode   producing the working image (longest side --max-side, or native)
+  prep     decode plus the derived levels the detector asks for: 1000 px
+           for feature matching and the profile's CNN input size
+
+Modes:
+  full      cv2.imdecode at native resolution (the old path; prep resizes
+            the native frame once per stage)
+  capped    cv2.imdecode at native resolution, then image_pyramid.shrink
+  reduced   image_pyramid.decode_image(max_side) + ImagePyramid levels
+  pil-draft PIL draft mode (libjpeg DCT scaling) + resize, for reference
+
+    python -m benchmarks.bench_image_decode --megapixels 12 48 --max-side 2048
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('full', 'capped', 'reduced', 'pil-draft')
+
+
+def rss_mb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_child(args):
+    import io
+    import statistics
+    import time
+
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    from home.image_pyramid import ImagePyramid, decode_image, fit_size, shrink
+
+    with open(args.path, 'rb') as f:
+        data = f.read()
+    input_size = (args.input_size, args.input_size)
+
+    def decode():
+        if args.mode == 'full':
+            return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if args.mode == 'capped':
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            return shrink(img, fit_size(img.shape[1], img.shape[0], args.max_side))
+        if args.mode == 'reduced':
+            return decode_image(data, args.max_side)
+        with Image.open(io.BytesIO(data)) as im:
+            im.draft('RGB', fit_size(*im.size, args.max_side))
+            img = cv2.cvtColor(np.asarray(im.convert('RGB')), cv2.COLOR_RGB2BGR)
+        return shrink(img, fit_size(img.shape[1], img.shape[0], args.max_side))
+
+    def prep():
+        img = decode()
+        if args.mode == 'full':
+            # Old detector: each stage resizes the native frame itself.
+            scale = 1000.0 / max(img.shape[:2])
+            return img, cv2.resize(img, (0, 0), fx=scale, fy=scale), cv2.resize(img, input_size)
+        pyramid = ImagePyramid(img)
+        return img, pyramid.fit(1000), pyramid.resized(input_size)
+
+    baseline = rss_mb('VmRSS')
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    timings = {}
+    for name, fn in (('decode', decode), ('prep', prep)):
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = fn()
+            runs.append(time.perf_counter() - start)
+            del out
+        timings[name] = statistics.median(runs) * 1000
+    img = decode()
+    print(json.dumps({
+        'decode_ms': timings['decode'],
+        'prep_ms': timings['prep'],
+        'peak_extra_mb': rss_mb('VmHWM') - baseline,
+        'output': [img.shape[1], img.shape[0]],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[12, 48])
+    parser.add_argument('--max-side', type=int, default=2048)
+    parser.add_argument('--input-size', type=int, default=1024, help='CNN input side for the prep step.')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    import cv2
+
+    from .synthetic import stone_wall
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mp in args.megapixels:
+            width = int(round((mp * 1e6 * 4 / 3) ** 0.5))
+            height = width * 3 // 4
+            wall = cv2.resize(stone_wall(height // 2, width // 2, seed=3), (width, height),
+                              interpolation=cv2.INTER_CUBIC)
+            path = os.path.join(tmpdir, f'wall_{mp:g}mp.jpg')
+            cv2.imwrite(path, wall, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            del wall
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_image_decode', '--child', '--mode', mode,
+                     '--path', path, '--max-side', str(args.max_side), '--input-size', str(args.input_size),
+                     '--repeat', str(args.repeat)],
+                    check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                )
+                r = {'megapixels': mp, 'mode': mode, **json.loads(out.stdout.strip().splitlines()[-1])}
+                results.append(r)
+                print(
+                    f"{mp:4.0f} MP {mode:>9}: decode {r['decode_ms']:7.1f} ms  prep {r['prep_ms']:7.1f} ms  "
+                    f"peak +{r['peak_extra_mb']:6.1f} MB  -> {r['output'][0]}x{r['output'][1]}"
+                )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Latency and accuracy of the trunk execution backends against eager fp32.
+
+For every backend (eager, torchscript, int8) the detector is built the
+way production builds it and run on synthetic fort-wall pairs:
+
+  latency      median trunk forward time for one (past, current) batch and
+               median full detect_structural_changes time
+  diff map     max / mean absolute error and Pearson correlation of the
+               0-255 deep-difference map against fp32
+  detections   fraction of fp32 detections recovered (IoU >= 0.5) and of
+               backend detections that match an fp32 one
+
+int8 is calibrated on separate synthetic walls.  Without --weights the
+trunk has random weights, which is enough to measure latency and numeric
+drift but not real accuracy; pass the bundle from `manage.py
+build_backbone_bundle` for that.
+
+    python -m benchmarks.bench_inference_backends --pairs 4
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from home.backbones import save_bundle, trunk_from_torchvision  # noqa: E402
+from home.inference_backends import BACKENDS, quantize_int8, save_int8  # noqa: E402
+from home.structural_detector import StructuralChangeDetector  # noqa: E402
+
+from .matching import matched_fraction  # noqa: E402
+from .synthetic import make_pair  # noqa: E402
+
+
+def timed(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', help='Backbone bundle (default: random weights).')
+    parser.add_argument('--pairs', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1024, help='Synthetic image size.')
+    parser.add_argument('--calibration-images', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    pairs = [make_pair(args.size, seed=100 + i) for i in range(args.pairs)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_path = args.weights
+        if not weights_path:
+            weights_path = os.path.join(tmpdir, 'resnet50_layer2.pt')
+            save_bundle(trunk_from_torchvision(None), weights_path, 'random')
+
+        reference = StructuralChangeDetector(weights_path=weights_path, backend='eager')
+        int8_path = os.path.join(tmpdir, 'resnet50_layer2_int8.pt')
+        calibration = [make_pair(args.size, seed=1000 + i, changes=())[0] for i in range(args.calibration_images)]
+        start = time.perf_counter()
+        module = quantize_int8(
+            reference.feature_extractor,
+            (reference.preprocess_images(calibration[i:i + 2]) for i in range(0, len(calibration), 2)),
+            reference.input_size,
+        )
+        save_int8(module, int8_path, reference.backbone_weights, len(calibration))
+        print(f"int8 calibration on {len(calibration)} images: {time.perf_counter() - start:.1f} s")
+
+        ref_outputs = [
+            (reference.get_deep_feature_difference(past, current)[0],
+             [d['bbox'] for d in reference.detect_structural_changes(past, current)['detections']])
+            for past, current, _ in pairs
+        ]
+
+        for backend in BACKENDS:
+            detector = StructuralChangeDetector(weights_path=weights_path, backend=backend, int8_path=int8_path)
+            forward_s, detect_s, max_err, mean_err, corr, recall, precision = [], [], [], [], [], [], []
+            for (past, current, _), (ref_diff, ref_boxes) in zip(pairs, ref_outputs):
+                batch = detector.preprocess_images([past, current])
+                t, _ = timed(lambda: detector.run_feature_extractor(batch), args.repeat)
+                forward_s.append(t)
+                t, result = timed(lambda: detector.detect_structural_changes(past, current), 1)
+                detect_s.append(t)
+
+                diff, _ = detector.get_deep_feature_difference(past, current)
+                err = np.abs(diff.astype(np.float32) - ref_diff.astype(np.float32))
+                max_err.append(float(err.max()))
+                mean_err.append(float(err.mean()))
+                corr.append(float(np.corrcoef(diff.ravel(), ref_diff.ravel())[0, 1]))
+                boxes = [d['bbox'] for d in result['detections']]
+                recall.append(matched_fraction(ref_boxes, boxes))
+                precision.append(matched_fraction(boxes, ref_boxes))
+
+            results[backend] = {
+                'forward_ms': statistics.median(forward_s) * 1000,
+                'detect_ms': statistics.median(detect_s) * 1000,
+                'diff_max_abs_err': max(max_err),
+                'diff_mean_abs_err': statistics.mean(mean_err),
+                'diff_correlation': min(corr),
+                'fp32_detections_recovered': statistics.mean(recall),
+                'detections_matching_fp32': statistics.mean(precision),
+            }
+            r = results[backend]
+            print(
+                f"{backend:>11}: forward {r['forward_ms']:7.0f} ms  detect {r['detect_ms']:7.0f} ms | "
+                f"diff err max {r['diff_max_abs_err']:5.1f} mean {r['diff_mean_abs_err']:5.2f} "
+                f"corr {r['diff_correlation']:.4f} | recovered {r['fp32_detections_recovered']:.2f} "
+                f"matching {r['detections_matching_fp32']:.2f}"
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Throughput of the ResNet trunk with and without micro-batching.
+
+N client threads each submit single images; the unbatched mode calls the
+model directly (one batch-size-1 pass per request), the batched mode goes
+through MicroBatcher.  Reports images/sec per concurrency level on CPU.
+
+    python -m benchmarks.bench_inference_batching --size 512 --concurrency 1 4 16
+"""
+import argparse
+import json
+import threading
+import time
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+
+from home.inference_batcher import MicroBatcher
+
+
+def build_trunk():
+    # Same conv1 -> layer2 trunk as StructuralChangeDetector, random weights.
+    full = models.resnet50(weights=None)
+    trunk = nn.Sequential(full.conv1, full.bn1, full.relu, full.maxpool, full.layer1, full.layer2)
+    return trunk.eval()
+
+
+def run_clients(forward, concurrency, requests_per_client, size):
+    image = torch.randn(1, 3, size, size)
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client():
+        barrier.wait()
+        for _ in range(requests_per_client):
+            forward(image)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return concurrency * requests_per_client / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=512, help='Input resolution (detector uses 1024).')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests-per-client', type=int, default=2)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    trunk = build_trunk()
+
+    def direct(x):
+        with torch.no_grad():
+            return trunk(x)
+
+    batcher = MicroBatcher(trunk, args.max_batch_size, args.max_wait_ms)
+    direct(torch.randn(1, 3, args.size, args.size))  # warm-up
+
+    results = []
+    print(f"torch threads={torch.get_num_threads()} size={args.size}")
+    print(f"{'clients':>8} {'unbatched img/s':>16} {'batched img/s':>14} {'avg batch':>10}")
+    for n in args.concurrency:
+        unbatched = run_clients(direct, n, args.requests_per_client, args.size)
+        batcher.batches = batcher.items = 0
+        batched = run_clients(batcher.infer, n, args.requests_per_client, args.size)
+        avg_batch = batcher.items / max(batcher.batches, 1)
+        results.append({
+            'concurrency': n,
+            'unbatched_images_per_sec': unbatched,
+            'batched_images_per_sec': batched,
+            'average_batch_size': avg_batch,
+        })
+        print(f"{n:>8} {unbatched:>16.2f} {batched:>14.2f} {avg_batch:>10.1f}")
+    batcher.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'size': args.size, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
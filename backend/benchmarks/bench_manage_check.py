@@ -0,0 +1,93 @@
+"""
+Startup cost of non-inference management commands.
+
+Times `manage.py check` in a fresh interpreter for both process roles:
+PROCESS_ROLE=inference preloads the detector in `HomeConfig.ready` (what
+every process did before the detector became lazy), PROCESS_ROLE=web
+defers it to the first analysis.  A second probe reports whether the ML
+stack got imported and the RSS after `django.setup()`.
+
+The inference role is pointed at a random-weight backbone bundle in a temp
+dir, so nothing is downloaded.
+
+    python -m benchmarks.bench_manage_check --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+import django
+django.setup()
+status = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+print(json.dumps({
+    'modules': [m for m in ('torch', 'torchvision', 'cv2', 'sklearn', 'skimage') if m in sys.modules],
+    'rss_mb': int(status['VmRSS'].split()[0]) / 1024,
+}))
+"""
+
+
+def write_bundles(tmpdir):
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+
+    save_bundle(trunk_from_torchvision(None), os.path.join(tmpdir, bundle_filename('resnet50')), 'random')
+    return tmpdir
+
+
+def time_check(env):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, 'manage.py', 'check'],
+        check=True, capture_output=True, cwd=BACKEND_DIR, env=env,
+    )
+    return time.perf_counter() - start
+
+
+def probe(env):
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        check=True, capture_output=True, text=True, cwd=BACKEND_DIR, env=env,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base_env = dict(
+            os.environ,
+            BACKBONE_WEIGHTS_DIR=write_bundles(tmpdir),
+            DETECTION_PROFILE='accurate',
+            FEATURE_CACHE_DIR=os.path.join(tmpdir, 'feature_cache'),
+        )
+        for role in ('inference', 'web'):
+            env = dict(base_env, PROCESS_ROLE=role)
+            times = [time_check(env) for _ in range(args.repeat)]
+            info = probe(env)
+            results[role] = {'check_s': statistics.median(times), **info}
+            print(
+                f"{role:>9}: manage.py check {results[role]['check_s'] * 1000:7.0f} ms  "
+                f"rss after setup {info['rss_mb']:6.1f} MB  imported: {', '.join(info['modules']) or '-'}"
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Streaming orthomosaic analysis: latency and peak memory against mosaic size.
+
+For each size a synthetic stone-wall mosaic pair is written as tiled,
+zlib-compressed GeoTIFFs (generated strip by strip, so the benchmark
+itself never holds a full mosaic), with a missing stone painted into
+every few 1024 px blocks of the current one.  Each analysis runs in a
+fresh interpreter; peak anonymous RSS is sampled while it runs, which
+leaves out the file-backed pages of the memory-mapped mosaics (those
+belong to the page cache and are reclaimable).
+
+    python -m benchmarks.bench_orthomosaic --profile fast --megapixels 16 64 256
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK = 1024
+TIFF_TILE = 256
+
+
+def status_mb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def write_mosaics(directory, side, every=3):
+    """Write past.tif/current.tif of side x side px; returns ground-truth boxes."""
+    import numpy as np
+    import tifffile
+
+    from .synthetic import add_missing_stone, stone_wall
+
+    boxes = []
+    blocks = side // BLOCK
+
+    def strips(changed):
+        for by in range(blocks):
+            strip = np.empty((BLOCK, side, 3), dtype=np.uint8)
+            for bx in range(blocks):
+                block = stone_wall(BLOCK, BLOCK, seed=by * blocks + bx)
+                if changed and (by * blocks + bx) % every == 0:
+                    x, y, w, h = add_missing_stone(block, np.random.default_rng(by * blocks + bx))
+                    boxes.append((bx * BLOCK + x, by * BLOCK + y, w, h))
+                strip[:, bx * BLOCK:(bx + 1) * BLOCK] = block[..., ::-1]  # RGB on disk
+            for ty in range(0, BLOCK, TIFF_TILE):
+                for tx in range(0, side, TIFF_TILE):
+                    yield strip[ty:ty + TIFF_TILE, tx:tx + TIFF_TILE]
+
+    geo = [(33550, 'd', 3, (0.02, 0.02, 0.0)), (33922, 'd', 6, (0, 0, 0, 500000.0, 2000000.0, 0))]
+    for name, changed in (('past.tif', False), ('current.tif', True)):
+        tifffile.imwrite(
+            os.path.join(directory, name), strips(changed), shape=(side, side, 3), dtype=np.uint8,
+            tile=(TIFF_TILE, TIFF_TILE), compression='zlib', photometric='rgb', extratags=geo, bigtiff=True,
+        )
+    return boxes
+
+
+def run_child(args):
+    import threading
+    import time
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home.backbones import bundle_filename
+    from home.detection_profiles import get_profile
+    from home.orthomosaic import analyze_orthomosaic
+    from home.structural_detector import StructuralChangeDetector
+
+    arch = get_profile(args.profile).backbone
+    detector = StructuralChangeDetector(
+        weights_path=os.path.join(args.weights_dir, bundle_filename(arch)), profile=args.profile,
+    )
+    baseline = status_mb('RssAnon')
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak[0] = max(peak[0], status_mb('RssAnon'))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    results, _ = analyze_orthomosaic(
+        detector, os.path.join(args.mosaic_dir, 'past.tif'), os.path.join(args.mosaic_dir, 'current.tif'),
+        tile_size=args.tile_size, overlap=args.overlap,
+    )
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    print(json.dumps({
+        'seconds': elapsed,
+        'baseline_anon_mb': baseline,
+        'peak_extra_anon_mb': max(peak[0], status_mb('RssAnon')) - baseline,
+        'tiles': results['deep_diff']['tiles'],
+        'detections': [d['bbox'] for d in results['detections']],
+    }))
+
+
+def write_bundle(tmpdir, profile_name):
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+    from home.detection_profiles import get_profile
+
+    arch = get_profile(profile_name).backbone
+    save_bundle(trunk_from_torchvision(None, arch=arch), os.path.join(tmpdir, bundle_filename(arch)), 'random', arch=arch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--tile-size', type=int, default=2048)
+    parser.add_argument('--overlap', type=int, default=256)
+    parser.add_argument('--weights-dir', help='Trunk bundles (default: random weights in a temp dir).')
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mosaic-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from .matching import matched_fraction
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_dir = args.weights_dir
+        if not weights_dir:
+            weights_dir = tmpdir
+            write_bundle(tmpdir, args.profile)
+        for mp in args.megapixels:
+            side = max(1, round((mp * 1e6) ** 0.5 / BLOCK)) * BLOCK
+            mosaic_dir = os.path.join(tmpdir, f'mosaic_{side}')
+            os.makedirs(mosaic_dir)
+            truth = write_mosaics(mosaic_dir, side)
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_orthomosaic', '--child', '--profile', args.profile,
+                 '--weights-dir', weights_dir, '--mosaic-dir', mosaic_dir,
+                 '--tile-size', str(args.tile_size), '--overlap', str(args.overlap)],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            file_mb = sum(os.path.getsize(os.path.join(mosaic_dir, n)) for n in os.listdir(mosaic_dir)) / 2 ** 20
+            r.update({
+                'megapixels': side * side / 1e6,
+                'side': side,
+                'files_mb': file_mb,
+                'changes': len(truth),
+                'changes_found': matched_fraction(truth, r.pop('detections'), threshold=0.1),
+            })
+            results.append(r)
+            print(
+                f"{r['megapixels']:6.0f} MP ({side}x{side}, {file_mb:5.0f} MB on disk): {r['seconds']:7.1f} s  "
+                f"{r['tiles']:3d} tile pairs  peak +{r['peak_extra_anon_mb']:6.1f} MB anon  "
+                f"changes found {r['changes_found']:.2f} of {r['changes']}"
+            )
+            for name in os.listdir(mosaic_dir):
+                os.remove(os.path.join(mosaic_dir, name))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Trunk input preparation and feature distance: the previous per-image
+cvtColor -> ToTensor -> Normalize -> torch.stack, F.normalize and
+sum((f1 - f2) ** 2) against home/preprocessing.py (per-thread reused
+batch filled in place, in-place normalization, chunked channel distance).
+
+Stages, each on a synthetic (past, current) pair at the profile's input
+size with a random-weight trunk:
+
+  preprocess   both images into one [2, 3, H, W] batch
+  distance     L2 normalization of the trunk output and the channel distance
+  end-to-end   get_deep_feature_difference (preprocess, batch-2 forward,
+               distance, upsampling)
+
+Reports the median latency over --repeat warm runs, the torch tensor
+allocations of one run (count and MB, from the profiler's per-op memory)
+and the peak of traced NumPy/OpenCV allocations (tracemalloc).
+
+    python -m benchmarks.bench_preprocessing --profile accurate
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.profiler import ProfilerActivity, profile
+from torchvision import transforms
+
+from home.backbones import save_bundle, trunk_from_torchvision
+from home.detection_profiles import get_profile
+from home.image_pyramid import ImagePyramid
+from home.preprocessing import channel_distance, normalize_
+from home.structural_detector import StructuralChangeDetector
+
+from .synthetic import make_pair
+
+LEGACY_TRANSFORM = transforms.Compose([
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def legacy_preprocess(detector, imgs):
+    tensors = []
+    for img in imgs:
+        img_resized = ImagePyramid.of(img).resized(detector.input_size)
+        tensors.append(LEGACY_TRANSFORM(cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)))
+    return torch.stack(tensors)
+
+
+def legacy_distance(features):
+    f1, f2 = F.normalize(features, p=2, dim=1).split(1)
+    return torch.sum((f1 - f2) ** 2, dim=1).squeeze()
+
+
+def legacy_difference(detector, img1, img2):
+    """get_deep_feature_difference before preprocessing.py."""
+    with torch.no_grad():
+        features = detector.feature_extractor(legacy_preprocess(detector, [img1, img2]))
+    diff_tensor = legacy_distance(features).numpy()
+    diff_map = cv2.resize(diff_tensor, (img1.shape[1], img1.shape[0]))
+    diff_map = np.maximum(diff_map, 0)
+    diff_map = diff_map / (diff_map.max() + 1e-6)
+    return (diff_map * 255).astype(np.uint8), np.mean(diff_map)
+
+
+def measure(fn, repeat):
+    fn()  # warm-up: buffers and pyramid levels exist, as in a serving worker
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    allocations = [e.self_cpu_memory_usage for e in prof.events() if e.self_cpu_memory_usage > 0]
+    tracemalloc.start()
+    fn()
+    numpy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'ms': statistics.median(times) * 1000,
+        'torch_allocations': len(allocations),
+        'torch_mb': sum(allocations) / 1024 ** 2,
+        'numpy_peak_mb': numpy_peak / 1024 ** 2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='accurate')
+    parser.add_argument('--size', type=int, default=2048, help='Synthetic frame size.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    arch = get_profile(args.profile).backbone
+    past, current, _ = make_pair(args.size, seed=7)
+    pyramids = ImagePyramid(past), ImagePyramid(current)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_path = os.path.join(tmpdir, f'{arch}_layer2.pt')
+        save_bundle(trunk_from_torchvision(None, arch=arch), weights_path, 'random', arch=arch)
+        detector = StructuralChangeDetector(weights_path=weights_path, profile=args.profile)
+
+    features = detector.feature_extractor(detector.preprocess_images(pyramids))
+    print(f"{args.profile}: {detector.input_size[0]}x{detector.input_size[1]} input, "
+          f"features {tuple(features.shape)}, frames {args.size}x{args.size}")
+    width, height = detector.input_size
+    stages = {
+        'preprocess': (
+            lambda: legacy_preprocess(detector, pyramids),
+            lambda: detector.preprocess_images(pyramids, out=detector.input_buffers.get(2, height, width)),
+        ),
+        'distance': (
+            lambda: legacy_distance(features),
+            lambda: channel_distance(*normalize_(features).split(1)),
+        ),
+        'end-to-end': (
+            lambda: legacy_difference(detector, *pyramids),
+            lambda: detector.get_deep_feature_difference(*pyramids),
+        ),
+    }
+
+    results = []
+    for stage, methods in stages.items():
+        for method, fn in zip(('legacy', 'buffered'), methods):
+            r = {'stage': stage, 'method': method, **measure(fn, args.repeat)}
+            results.append(r)
+            print(f"{stage:>10} {method:>8}: {r['ms']:8.1f} ms  torch {r['torch_allocations']:4d} allocations "
+                  f"{r['torch_mb']:7.1f} MB  numpy peak {r['numpy_peak_mb']:6.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
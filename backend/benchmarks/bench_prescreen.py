@@ -0,0 +1,172 @@
+"""
+Pre-screen (prescreen.py): how many analyses it answers without the CNN,
+whether it ever screens a real change, and the latency it saves.
+
+A mixed set of synthetic stone-wall pairs at --megapixels:
+
+  reshoot     the same wall re-photographed: up to 1 % shift and 0.3 deg
+              rotation, exposure/contrast change, sensor noise, JPEG
+  stone       a reshoot with one missing stone of about 1 % of the side
+  crack       a reshoot with a hairline crack
+  vegetation  a reshoot with a vegetation patch
+
+Every pair runs through detect_structural_changes twice on the same
+detector (random-weight trunk of --profile unless --weights-dir is given):
+pre-screen off, then on with --margin.  Reports the fraction of reshoots
+screened, changed pairs screened (must be 0), mean latency per analysis
+with and without the pre-screen and the share of the full run's SAFE
+answers the screen reproduced (meaningful with real weights only).  --margins repeats the screening decision (not the
+analysis) at other margins from the recorded statistics.
+
+    python -m benchmarks.bench_prescreen --megapixels 12 --pairs 40
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+KINDS = ('reshoot', 'stone', 'crack', 'vegetation')
+
+
+def add_small_stone(img, rng):
+    h, w = img.shape[:2]
+    side = max(4, w // 100)
+    x, y = int(rng.integers(0, w - side)), int(rng.integers(0, h - side))
+    img[y:y + side, x:x + side] = rng.normal(28, 6, (side, side, 3)).clip(0, 255).astype('uint8')
+
+
+def reshoot(ground, rng):
+    import cv2
+    import numpy as np
+
+    height, width = ground.shape[:2]
+    A = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-0.3, 0.3), 1.0)
+    A[:, 2] += rng.uniform(-0.01, 0.01, 2) * (width, height)
+    current = cv2.warpAffine(ground, A, (width, height), borderMode=cv2.BORDER_REFLECT)
+    alpha, beta = rng.uniform(0.8, 1.15), rng.uniform(-20, 20)
+    current = current.astype(np.float32) * alpha + beta + rng.normal(0, 4, current.shape).astype(np.float32)
+    current = np.clip(current, 0, 255).astype(np.uint8)
+    quality = int(rng.integers(75, 95))
+    return cv2.imdecode(cv2.imencode('.jpg', current, [cv2.IMWRITE_JPEG_QUALITY, quality])[1], cv2.IMREAD_COLOR)
+
+
+def make_pairs(count, width, height, seed):
+    import cv2
+    import numpy as np
+
+    from .synthetic import add_crack, add_vegetation, stone_wall
+
+    rng = np.random.default_rng(seed)
+    changes = {'stone': add_small_stone, 'crack': add_crack, 'vegetation': add_vegetation}
+    pairs = []
+    for i in range(count):
+        ground = cv2.resize(stone_wall(height // 2, width // 2, seed=seed + i), (width, height),
+                            interpolation=cv2.INTER_CUBIC)
+        # Half reshoots, the rest spread over the change kinds
+        kind = 'reshoot' if i % 2 == 0 else KINDS[1 + (i // 2) % 3]
+        current = reshoot(ground, rng)
+        if kind != 'reshoot':
+            # Inside the part both frames see: the drifted border has no past to compare with
+            inset = slice(height * 3 // 100, height * 97 // 100), slice(width * 3 // 100, width * 97 // 100)
+            changes[kind](current[inset], rng)
+        pairs.append((kind, ground, current))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--pairs', type=int, default=40)
+    parser.add_argument('--margin', type=float, default=0.5)
+    parser.add_argument('--margins', type=float, nargs='*', default=[0.0, 0.25, 0.5, 0.75])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--weights-dir', help='Trunk bundles (default: random weights in a temp dir).')
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+    from home.detection_profiles import get_profile
+    from home.prescreen import ScreenConfig, passes
+    from home.structural_detector import StructuralChangeDetector
+
+    width = int(round((args.megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = width * 3 // 4
+    pairs = make_pairs(args.pairs, width, height, args.seed)
+
+    arch = get_profile(args.profile).backbone
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_dir = args.weights_dir
+        if not weights_dir:
+            weights_dir = tmpdir
+            save_bundle(trunk_from_torchvision(None, arch=arch), os.path.join(tmpdir, bundle_filename(arch)),
+                        'random', arch=arch)
+        detector = StructuralChangeDetector(
+            weights_path=os.path.join(weights_dir, bundle_filename(arch)), profile=args.profile,
+        )
+
+    # Warm-up so one-off allocations are not charged to the first pair.
+    detector.detect_structural_changes(pairs[0][1], pairs[0][2])
+
+    rows = []
+    for kind, past, current in pairs:
+        row = {'kind': kind}
+        for mode, margin in (('full', None), ('screened', args.margin)):
+            detector.prescreen = None if margin is None else ScreenConfig(margin=margin)
+            start = time.perf_counter()
+            results = detector.detect_structural_changes(past, current)
+            row[f'{mode}_ms'] = (time.perf_counter() - start) * 1000
+            row[f'{mode}_level'] = results['risk_assessment']['level']
+            if margin is not None:
+                row['screened'] = results['screened']
+                row['screen'] = results['screen']
+        rows.append(row)
+        print(f"{kind:>10}: full {row['full_ms']:7.0f} ms ({row['full_level']:>8})  with pre-screen "
+              f"{row['screened_ms']:7.0f} ms ({'screened' if row['screened'] else row['screened_level']})")
+
+    reshoots = [r for r in rows if r['kind'] == 'reshoot']
+    changed = [r for r in rows if r['kind'] != 'reshoot']
+    full_safe = [r for r in rows if r['full_level'] == 'SAFE']
+
+    def screened_at(subset, margin):
+        config = ScreenConfig(margin=margin)
+        return sum(passes(r['screen'], config) for r in subset)
+
+    summary = {
+        'size': [width, height],
+        'pairs': len(rows),
+        'margin': args.margin,
+        'screened_fraction': sum(r['screened'] for r in rows) / len(rows),
+        'reshoots_screened': sum(r['screened'] for r in reshoots) / max(1, len(reshoots)),
+        'changes_screened': sum(r['screened'] for r in changed),
+        'full_safe_screened': sum(r['screened'] for r in full_safe) / max(1, len(full_safe)),
+        'mean_full_ms': statistics.mean(r['full_ms'] for r in rows),
+        'mean_screened_ms': statistics.mean(r['screened_ms'] for r in rows),
+        'median_screen_ms': statistics.median(r['screen']['seconds'] * 1000 for r in rows),
+        'by_margin': {
+            str(m): {'reshoots_screened': screened_at(reshoots, m) / max(1, len(reshoots)),
+                     'changes_screened': screened_at(changed, m)}
+            for m in args.margins
+        },
+    }
+    saved = 1 - summary['mean_screened_ms'] / summary['mean_full_ms']
+    print(f"{width}x{height}, {len(rows)} pairs, margin {args.margin}:")
+    print(f"  screened {summary['screened_fraction']:.0%} of pairs ({summary['reshoots_screened']:.0%} of reshoots, "
+          f"{summary['changes_screened']} changed pairs)")
+    print(f"  mean latency {summary['mean_full_ms']:.0f} -> {summary['mean_screened_ms']:.0f} ms ({saved:.0%} saved), "
+          f"screen itself {summary['median_screen_ms']:.1f} ms")
+    for m, stats in summary['by_margin'].items():
+        print(f"  margin {m:>4}: {stats['reshoots_screened']:.0%} of reshoots, {stats['changes_screened']} changed pairs")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'summary': summary, 'pairs': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
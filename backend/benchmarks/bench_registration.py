@@ -0,0 +1,136 @@
+"""
+Per-analysis alignment cost: pairwise AKAZE matching vs composing stored
+registrations to the fort's reference frame.
+
+A synthetic stone-wall "ground" image is the reference; --views later
+flights are perspective warps of it (known ground -> view homographies)
+saved as FortImages in a throwaway database and media directory.  Every
+consecutive pair (view i -> view i+1) is aligned three ways:
+
+  pairwise     estimate_homography on the two decoded frames
+  first        register_image on both (first analysis touching a new
+               image: one AKAZE pass, match against stored reference features)
+  registered   pair_homography from the stored registrations
+
+Reports the median time and the max corner error (px) against the true
+past -> current homography.
+
+    python -m benchmarks.bench_registration --size 4000 3000 --views 6
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, nargs=2, default=[4000, 3000], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--views', type=int, default=6)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    import cv2
+    import numpy as np
+    from django.core.files.base import ContentFile
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import override_settings
+
+    from home.models import Fort, FortImage
+    from home.alignment import AlignmentConfig
+    from home.registration import pair_homography, register_image
+    from home.structural_detector import StructuralChangeDetector
+
+    from .synthetic import stone_wall
+
+    width, height = args.size
+    ground = cv2.resize(stone_wall(height // 2, width // 2, seed=11), (width, height), interpolation=cv2.INTER_CUBIC)
+    rng = np.random.default_rng(0)
+
+    def random_view():
+        # Up to ~3 % shift, 2 deg rotation, 3 % scale and mild perspective
+        angle = np.deg2rad(rng.uniform(-2, 2))
+        scale = rng.uniform(0.97, 1.03)
+        H = np.array([
+            [scale * np.cos(angle), -scale * np.sin(angle), rng.uniform(-0.03, 0.03) * width],
+            [scale * np.sin(angle), scale * np.cos(angle), rng.uniform(-0.03, 0.03) * height],
+            [rng.uniform(-2e-6, 2e-6) * 4000 / width, rng.uniform(-2e-6, 2e-6) * 4000 / width, 1.0],
+        ])
+        return H, cv2.warpPerspective(ground, H, (width, height))
+
+    # Alignment only: the CNN trunk is never run, so skip loading one.
+    detector = StructuralChangeDetector.__new__(StructuralChangeDetector)
+    detector.alignment = AlignmentConfig()
+
+    corners = np.float32([[[0.1 * width, 0.1 * height]], [[0.9 * width, 0.1 * height]],
+                          [[0.9 * width, 0.9 * height]], [[0.1 * width, 0.9 * height]]])
+
+    def corner_error(M, expected):
+        if M is None:
+            return float('inf')
+        return float(np.abs(cv2.perspectiveTransform(corners, M) - cv2.perspectiveTransform(corners, expected)).max())
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    timings = {'pairwise': [], 'first': [], 'registered': []}
+    errors = {'pairwise': [], 'registered': []}
+    try:
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            fort = Fort.objects.create(name='Benchmark fort', location='-')
+            encode = lambda img: ContentFile(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes(),
+                                             name='view.jpg')
+            FortImage.objects.create(fort=fort, image=encode(ground), is_reference=True)
+            views = []
+            for _ in range(args.views):
+                H, img = random_view()
+                views.append((H, img, FortImage.objects.create(fort=fort, image=encode(img))))
+            frame = np.diag([float(width), float(height), 1.0])
+
+            for (H_past, past_img, past), (H_cur, cur_img, cur) in zip(views, views[1:]):
+                expected = H_cur @ np.linalg.inv(H_past)
+
+                start = time.perf_counter()
+                M = detector.estimate_homography(past_img, cur_img)
+                timings['pairwise'].append(time.perf_counter() - start)
+                errors['pairwise'].append(corner_error(M, expected))
+
+                start = time.perf_counter()
+                register_image(detector, past, past_img)
+                register_image(detector, cur, cur_img)
+                timings['first'].append(time.perf_counter() - start)
+
+                past, cur = FortImage.objects.get(id=past.id), FortImage.objects.get(id=cur.id)
+                start = time.perf_counter()
+                register_image(detector, past, past_img)
+                register_image(detector, cur, cur_img)
+                H = pair_homography(past, cur)
+                timings['registered'].append(time.perf_counter() - start)
+                errors['registered'].append(corner_error(None if H is None else frame @ H @ np.linalg.inv(frame),
+                                                         expected))
+    finally:
+        runner.teardown_databases(old_config)
+
+    results = {
+        'size': [width, height],
+        'pairs': len(timings['pairwise']),
+        **{f'{k}_ms': statistics.median(v) * 1000 for k, v in timings.items()},
+        **{f'{k}_max_corner_error_px': max(v) for k, v in errors.items()},
+    }
+    print(f"{width}x{height}, {results['pairs']} pairs (median per analysis):")
+    print(f"  pairwise   {results['pairwise_ms']:8.1f} ms  max corner error {results['pairwise_max_corner_error_px']:.2f} px")
+    print(f"  first      {results['first_ms']:8.1f} ms  (registers images new to the fort)")
+    print(f"  registered {results['registered_ms']:8.1f} ms  max corner error "
+          f"{results['registered_max_corner_error_px']:.2f} px")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
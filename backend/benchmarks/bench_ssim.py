@@ -0,0 +1,111 @@
+"""
+SSIM: skimage.metrics.structural_similarity on full-resolution grey frames
+(the previous detector code) against home/ssim.py at native resolution and
+at the analysis resolution (SSIM_MAX_SIDE, shrunk from the frames' pyramids).
+
+Each (size, method) runs in a fresh interpreter on a synthetic stone-wall
+pair (exposure change, noise and a missing stone).  Reports the median time
+over --repeat runs including the grey conversion, the peak of traced
+numpy/OpenCV allocations (tracemalloc) and the score next to skimage's.
+
+    python -m benchmarks.bench_ssim --megapixels 2 12 --max-side 1024
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METHODS = ('skimage', 'native', 'analysis')
+
+
+def run_child(args):
+    import statistics
+    import time
+    import tracemalloc
+
+    import cv2
+    import numpy as np
+
+    from home.image_pyramid import ImagePyramid
+    from home.ssim import SSIMConfig, pair_ssim
+
+    from .synthetic import add_missing_stone, stone_wall
+
+    width = int(round((args.mp * 1e6 * 4 / 3) ** 0.5))
+    height = width * 3 // 4
+    past = cv2.resize(stone_wall(height // 2, width // 2, seed=3), (width, height), interpolation=cv2.INTER_CUBIC)
+    rng = np.random.default_rng(0)
+    current = np.clip(past * 0.9 + 12 + rng.normal(0, 5, past.shape), 0, 255).astype(np.uint8)
+    add_missing_stone(current, rng)
+
+    if args.method == 'skimage':
+        from skimage.metrics import structural_similarity
+
+        def run():
+            return structural_similarity(cv2.cvtColor(past, cv2.COLOR_BGR2GRAY), cv2.cvtColor(current, cv2.COLOR_BGR2GRAY))
+    else:
+        config = SSIMConfig(max_side=args.max_side if args.method == 'analysis' else None)
+
+        def run():
+            # Fresh pyramids: the shrink is charged to the SSIM here, though
+            # in an analysis earlier stages usually built these levels already.
+            return pair_ssim(ImagePyramid(past), ImagePyramid(current), config)
+
+    run()  # warm-up
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        score = run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(json.dumps({
+        'width': width, 'height': height, 'ms': statistics.median(times) * 1000,
+        'peak_mb': peak / 1024 ** 2, 'score': score,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[2, 12])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--max-side', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--method', help=argparse.SUPPRESS)
+    parser.add_argument('--mp', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for mp in args.megapixels:
+        reference = None
+        for method in args.methods:
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_ssim', '--child', '--method', method, '--mp', str(mp),
+                 '--max-side', str(args.max_side), '--repeat', str(args.repeat)],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+            )
+            r = {'method': method, 'megapixels': mp, **json.loads(out.stdout.strip().splitlines()[-1])}
+            results.append(r)
+            if method == 'skimage':
+                reference = r['score']
+            delta = f"  (skimage {r['score'] - reference:+.5f})" if reference is not None and method != 'skimage' else ''
+            print(f"{mp:4.0f} MP {r['width']}x{r['height']} {method:>8}: {r['ms']:8.1f} ms  "
+                  f"peak {r['peak_mb']:7.1f} MB  SSIM {r['score']:.5f}{delta}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
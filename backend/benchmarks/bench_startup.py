@@ -0,0 +1,95 @@
+"""
+Cold start of the detector's CNN trunk: full torchvision ResNet50 vs the
+truncated conv1 -> layer2 bundle.
+
+Each mode runs in a fresh interpreter and reports the time to build a
+ready-to-run trunk plus the process RSS / peak RSS afterwards.  Random
+weights are written to a temp dir first, so no download is involved: the
+"full" mode loads a full ResNet50 checkpoint the way torchvision does from
+its local cache, the "bundle" mode goes through home.backbones.load_bundle.
+
+    python -m benchmarks.bench_startup --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import torch
+import torch.nn as nn
+import_s = time.perf_counter() - start
+mode, path = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+if mode == 'full':
+    import torchvision.models as models
+    full = models.resnet50(weights=None)
+    full.load_state_dict(torch.load(path, map_location='cpu', weights_only=True))
+    trunk = nn.Sequential(full.conv1, full.bn1, full.relu, full.maxpool, full.layer1, full.layer2).eval()
+else:
+    from home.backbones import load_bundle
+    trunk, _ = load_bundle(path)
+build_s = time.perf_counter() - start
+status = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+print(json.dumps({
+    'import_s': import_s,
+    'build_s': build_s,
+    'rss_mb': int(status['VmRSS'].split()[0]) / 1024,
+    'peak_rss_mb': int(status['VmHWM'].split()[0]) / 1024,
+}))
+"""
+
+
+def write_checkpoints(tmpdir):
+    import torch
+    import torchvision.models as models
+
+    from home.backbones import save_bundle, trunk_from_torchvision
+
+    full_path = os.path.join(tmpdir, 'resnet50_full.pth')
+    bundle_path = os.path.join(tmpdir, 'resnet50_layer2.pt')
+    torch.save(models.resnet50(weights=None).state_dict(), full_path)
+    save_bundle(trunk_from_torchvision(None), bundle_path, 'random')
+    return {'full': full_path, 'bundle': bundle_path}
+
+
+def run_mode(mode, path):
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD, mode, path],
+        check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = write_checkpoints(tmpdir)
+        for name, path in paths.items():
+            print(f"{name:>6}: {os.path.getsize(path) / 1e6:6.1f} MB on disk")
+        for mode, path in paths.items():
+            runs = [run_mode(mode, path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r['build_s'])
+            results[mode] = best
+            print(
+                f"{mode:>6}: build {best['build_s'] * 1000:7.1f} ms  "
+                f"rss {best['rss_mb']:6.1f} MB  peak {best['peak_rss_mb']:6.1f} MB"
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
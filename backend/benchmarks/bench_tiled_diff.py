@@ -0,0 +1,152 @@
+"""
+Deep difference latency and peak memory against image size:
+resize-to-profile-input (the default) vs native-resolution tiles.
+
+Each (mode, size) runs in a fresh interpreter.  The synthetic wall pair is
+generated first, the peak-RSS counter is reset (/proc/self/clear_refs),
+then only the deep difference step is timed, so "peak" is what that step
+adds on top of the two decoded frames.  Also reports how well the painted
+missing stone is localized: mean diff inside the changed box over mean
+diff outside it (higher is sharper; 1.0 means not localized at all).
+
+    python -m benchmarks.bench_tiled_diff --profile fast --megapixels 2 12 48
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_child(args):
+    import time
+
+    import cv2
+    import django
+    import numpy as np
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home.backbones import bundle_filename
+    from home.detection_profiles import get_profile
+    from home.structural_detector import StructuralChangeDetector
+
+    from .synthetic import stone_wall
+
+    arch = get_profile(args.profile).backbone
+    detector = StructuralChangeDetector(
+        weights_path=os.path.join(args.weights_dir, bundle_filename(arch)), profile=args.profile,
+    )
+    if args.mode == 'tiled':
+        detector.enable_tiling(args.tile_size, args.overlap, args.tile_batch, args.max_tiles)
+
+    width = int(round((args.mp * 1e6 * 4 / 3) ** 0.5))
+    height = width * 3 // 4
+    # Generate at quarter size and upscale: same look, much less generator memory.
+    past = cv2.resize(stone_wall(height // 2, width // 2, seed=7), (width, height), interpolation=cv2.INTER_CUBIC)
+    current = past.copy()
+    box = (width // 2, height // 3, max(16, width // 80), max(16, height // 60))
+    x, y, bw, bh = box
+    current[y:y + bh, x:x + bw] = 30
+
+    # Warm-up on a small pair so one-off allocations are not charged to the size.
+    detector.get_deep_feature_difference(past[:256, :256], current[:256, :256])
+    baseline = rss_mb('VmRSS')
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # reset VmHWM to the current RSS
+
+    start = time.perf_counter()
+    if args.mode == 'tiled':
+        diff, _, info = detector.get_tiled_feature_difference(past, current)
+    else:
+        diff, _ = detector.get_deep_feature_difference(past, current)
+        info = {}
+    elapsed = time.perf_counter() - start
+
+    inside = diff[y:y + bh, x:x + bw].astype(np.float64)
+    outside_mean = (diff.sum(dtype=np.float64) - inside.sum()) / (diff.size - inside.size)
+    print(json.dumps({
+        'width': width,
+        'height': height,
+        'seconds': elapsed,
+        'baseline_rss_mb': baseline,
+        'peak_extra_mb': rss_mb('VmHWM') - baseline,
+        'change_contrast': float(inside.mean() / max(outside_mean, 1e-6)),
+        'tiles': info.get('tiles', 1),
+        'scale': info.get('scale', 1.0),
+    }))
+
+
+def write_bundle(tmpdir, profile_name):
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+    from home.detection_profiles import get_profile
+
+    arch = get_profile(profile_name).backbone
+    save_bundle(trunk_from_torchvision(None, arch=arch), os.path.join(tmpdir, bundle_filename(arch)), 'random', arch=arch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[2, 12, 48])
+    parser.add_argument('--modes', nargs='+', default=['resize', 'tiled'], choices=['resize', 'tiled'])
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--overlap', type=int, default=128)
+    parser.add_argument('--tile-batch', type=int, default=2)
+    parser.add_argument('--max-tiles', type=int, default=64)
+    parser.add_argument('--weights-dir', help='Trunk bundles (default: random weights in a temp dir).')
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--mp', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        weights_dir = args.weights_dir
+        if not weights_dir:
+            weights_dir = tmpdir
+            write_bundle(tmpdir, args.profile)
+        for mp in args.megapixels:
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_tiled_diff', '--child', '--mode', mode,
+                     '--mp', str(mp), '--profile', args.profile, '--weights-dir', weights_dir,
+                     '--tile-size', str(args.tile_size), '--overlap', str(args.overlap),
+                     '--tile-batch', str(args.tile_batch), '--max-tiles', str(args.max_tiles)],
+                    check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+                )
+                r = {'mode': mode, 'megapixels': mp, **json.loads(out.stdout.strip().splitlines()[-1])}
+                results.append(r)
+                print(
+                    f"{mp:5.0f} MP {r['width']}x{r['height']} {mode:>6}: {r['seconds']:7.1f} s  "
+                    f"peak +{r['peak_extra_mb']:7.1f} MB  tiles {r['tiles']:3d} (scale {r['scale']:.2f})  "
+                    f"change contrast {r['change_contrast']:6.1f}"
+                )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
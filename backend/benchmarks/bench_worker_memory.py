@@ -0,0 +1,152 @@
+"""
+Per-worker memory of forked inference workers.
+
+A parent process forks N workers the way gunicorn / run_analysis_worker
+do; each worker runs one analysis-sized trunk forward pass and a GC cycle
+(as a serving worker would) and then idles while the parent reads its
+/proc/<pid>/smaps_rollup:
+
+  USS  Private_Clean + Private_Dirty, memory freed if only that worker exits
+  PSS  RSS with shared pages split between the processes mapping them
+
+Modes, each in a fresh parent interpreter:
+
+  per-worker      every worker loads its own detector after the fork
+  preload         the parent loads the detector, workers inherit it
+  preload-shared  the parent calls detector_singleton.share_for_fork()
+
+Weights are a random-weight backbone bundle in a temp dir.
+
+    python -m benchmarks.bench_worker_memory --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('per-worker', 'preload', 'preload-shared')
+
+
+def smaps_rollup(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': fields['Rss'],
+        'pss_mb': fields['Pss'],
+        'uss_mb': fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+
+def run_parent(mode, workers, size):
+    """Body of one measurement; runs in its own interpreter."""
+    import gc
+
+    import django
+    import numpy as np
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    from home import detector_singleton
+
+    if mode == 'preload':
+        detector_singleton.get_detector()
+    elif mode == 'preload-shared':
+        detector_singleton.share_for_fork()
+
+    pids = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        release_r, release_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(release_w)
+            detector_singleton.after_fork()
+            detector = detector_singleton.get_detector()
+            image = np.random.default_rng(0).integers(0, 255, (size, size, 3), dtype=np.uint8)
+            detector.encode_images([image, image])
+            gc.collect()
+            os.write(ready_w, b'1')
+            os.read(release_r, 1)
+            os._exit(0)
+        os.close(ready_w)
+        os.close(release_r)
+        os.read(ready_r, 1)
+        pids.append((pid, release_w))
+
+    # Measure once every worker is up, so shared pages are split N+1 ways.
+    per_worker = [smaps_rollup(pid) for pid, _ in pids]
+    parent = smaps_rollup(os.getpid())
+    for pid, release_w in pids:
+        os.write(release_w, b'1')
+        os.waitpid(pid, 0)
+
+    def mean(key):
+        return sum(w[key] for w in per_worker) / len(per_worker)
+
+    print(json.dumps({
+        'workers': workers,
+        'worker_uss_mb': mean('uss_mb'),
+        'worker_pss_mb': mean('pss_mb'),
+        'worker_rss_mb': mean('rss_mb'),
+        'parent_pss_mb': parent['pss_mb'],
+        'total_pss_mb': parent['pss_mb'] + sum(w['pss_mb'] for w in per_worker),
+    }))
+
+
+def write_bundles(tmpdir):
+    from home.backbones import bundle_filename, save_bundle, trunk_from_torchvision
+
+    save_bundle(trunk_from_torchvision(None), os.path.join(tmpdir, bundle_filename('resnet50')), 'random')
+    return tmpdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1024, help='Image size fed to the detector.')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--json', help='Write results to this file.')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_parent(args.mode, args.workers, args.size)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(
+            os.environ,
+            BACKBONE_WEIGHTS_DIR=write_bundles(tmpdir),
+            DETECTION_PROFILE='accurate',
+            FEATURE_CACHE_ENABLED='False',
+            PROCESS_ROLE='web',
+        )
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_worker_memory', '--mode', mode,
+                 '--workers', str(args.workers), '--size', str(args.size)],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR, env=env,
+            )
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+            r = results[mode]
+            print(
+                f"{mode:>14}: per worker USS {r['worker_uss_mb']:6.1f} MB  PSS {r['worker_pss_mb']:6.1f} MB  "
+                f"RSS {r['worker_rss_mb']:6.1f} MB | total PSS ({args.workers} workers + parent) "
+                f"{r['total_pss_mb']:7.1f} MB"
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""Bounding-box agreement helpers shared by the accuracy benchmarks."""
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def matched_fraction(boxes, others, threshold=0.5):
+    """Fraction of `boxes` overlapping some box in `others` with IoU >= threshold (1.0 if none)."""
+    if not boxes:
+        return 1.0
+    return sum(any(iou(b, o) >= threshold for o in others) for b in boxes) / len(boxes)
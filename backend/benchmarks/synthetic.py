@@ -0,0 +1,142 @@
+"""
+Synthetic fort-wall image pairs for offline benchmarks.
+
+`stone_wall` draws courses of irregular basalt/laterite blocks with mortar
+joints and surface texture; `make_pair` returns (past, current) BGR images
+where the current one has known structural changes painted in.  The
+bounding boxes of those changes are returned as ground truth.  Optionally
+the current survey is lit differently (`shift_lighting`) and the past one
+was shot from another viewpoint (`warp_view`); detections are reported in
+the current image's frame, so the ground-truth boxes stay where they are.
+"""
+import cv2
+import numpy as np
+
+STONE_TONES = [(70, 78, 92), (96, 104, 118), (60, 72, 96), (110, 118, 128), (82, 90, 110)]
+
+
+def stone_wall(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    wall = np.full((height, width, 3), (150, 160, 170), dtype=np.uint8)  # mortar
+    scale = max(height, width) / 1024.0
+    course = max(8, int(rng.integers(56, 80) * scale))
+    joint = max(1, int(3 * scale))
+    y = 0
+    while y < height:
+        x = -int(rng.integers(0, course))
+        while x < width:
+            w = int(course * rng.uniform(1.1, 2.2))
+            tone = np.array(STONE_TONES[rng.integers(len(STONE_TONES))]) + rng.integers(-15, 15) + rng.integers(-4, 4, 3)
+            cv2.rectangle(
+                wall, (x + joint, y + joint), (x + w - joint, y + course - joint),
+                tuple(int(c) for c in np.clip(tone, 0, 255)), -1,
+            )
+            x += w
+        y += course
+
+    # Grain: low-frequency shading plus per-pixel noise.
+    shading = cv2.resize(rng.normal(0, 10, (8, 8)).astype(np.float32), (width, height), interpolation=cv2.INTER_CUBIC)
+    grain = rng.normal(0, 6, (height, width)).astype(np.float32)
+    wall = wall.astype(np.float32) + (shading + grain)[..., None]
+    return np.clip(wall, 0, 255).astype(np.uint8)
+
+
+def _box(rng, height, width, frac):
+    bw = max(4, int(width * frac * rng.uniform(0.7, 1.3)))
+    bh = max(4, int(height * frac * rng.uniform(0.7, 1.3)))
+    x = int(rng.integers(0, width - bw))
+    y = int(rng.integers(0, height - bh))
+    return x, y, bw, bh
+
+
+def add_missing_stone(img, rng):
+    h, w = img.shape[:2]
+    x, y, bw, bh = _box(rng, h, w, 0.06)
+    cavity = rng.normal(28, 6, (bh, bw, 3)).clip(0, 255).astype(np.uint8)
+    img[y:y + bh, x:x + bw] = cavity
+    return x, y, bw, bh
+
+
+def add_crack(img, rng):
+    h, w = img.shape[:2]
+    x0, y0 = int(rng.integers(w // 8, w * 7 // 8)), int(rng.integers(h // 8, h // 2))
+    points = [(x0, y0)]
+    length = int(h * rng.uniform(0.15, 0.3))
+    thickness = max(2, w // 300)
+    for _ in range(12):
+        px, py = points[-1]
+        points.append((int(np.clip(px + rng.integers(-w // 60, w // 60 + 1), 0, w - 1)),
+                       int(np.clip(py + length // 12, 0, h - 1))))
+    cv2.polylines(img, [np.array(points, dtype=np.int32)], False, (20, 20, 24), thickness)
+    # The stroke extends about half its thickness either side of the points
+    xs, ys = zip(*points)
+    pad = thickness // 2 + 1
+    x0, y0 = max(min(xs) - pad, 0), max(min(ys) - pad, 0)
+    x1, y1 = min(max(xs) + pad + 1, w), min(max(ys) + pad + 1, h)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def add_vegetation(img, rng):
+    h, w = img.shape[:2]
+    x, y, bw, bh = _box(rng, h, w, 0.08)
+    patch = img[y:y + bh, x:x + bw]
+    mask = np.zeros((bh, bw), dtype=np.uint8)
+    cv2.ellipse(mask, (bw // 2, bh // 2), (bw // 2, bh // 2), 0, 0, 360, 255, -1)
+    green = np.stack([
+        rng.integers(20, 60, (bh, bw)), rng.integers(110, 180, (bh, bw)), rng.integers(30, 80, (bh, bw)),
+    ], axis=-1).astype(np.uint8)
+    patch[mask > 0] = green[mask > 0]
+    return x, y, bw, bh
+
+
+CHANGES = {
+    'missing_stone': add_missing_stone,
+    'crack': add_crack,
+    'vegetation': add_vegetation,
+}
+
+
+def shift_lighting(img, rng, strength=1.0):
+    """Another time of day: exposure and contrast change plus a shadow gradient across the frame."""
+    h, w = img.shape[:2]
+    gain = 1.0 + strength * rng.uniform(-0.3, 0.2)
+    offset = strength * rng.uniform(-30, 30)
+    angle = rng.uniform(0, 2 * np.pi)
+    gx = (np.arange(w, dtype=np.float32) / w - 0.5) * np.float32(np.cos(angle))
+    gy = (np.arange(h, dtype=np.float32) / h - 0.5) * np.float32(np.sin(angle))
+    shade = gain * (1.0 + np.float32(0.4 * strength) * (gy[:, None] + gx[None, :]))
+    return np.clip(img * shade[..., None] + offset, 0, 255).astype(np.uint8)
+
+
+def warp_view(img, rng, strength=1.0):
+    """
+    The same wall from a slightly different position: rotation, scale,
+    shift and perspective tilt growing with `strength`.  Returns the warped
+    image and the homography mapping `img` onto it.
+    """
+    h, w = img.shape[:2]
+    angle = rng.choice([-1, 1]) * strength * rng.uniform(1.0, 3.0)
+    A = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0 + strength * rng.uniform(-0.03, 0.03))
+    A[:, 2] += strength * rng.uniform(-0.02, 0.02, 2) * (w, h)
+    tilt = strength * rng.uniform(-8e-3, 8e-3, 2) / (w, h)
+    H = np.vstack([A, [tilt[0], tilt[1], 1.0]])
+    return cv2.warpPerspective(img, H, (w, h), borderMode=cv2.BORDER_REFLECT), H
+
+
+def make_pair(size=1024, seed=0, changes=('missing_stone', 'missing_stone', 'crack'), lighting=0.0, warp=0.0):
+    """
+    Returns (past, current, boxes) for a `size` x `size` wall; `boxes` holds
+    (kind, (x, y, w, h)) for every change painted into `current`.  Non-zero
+    `lighting` relights `current` and `warp` moves the viewpoint of `past`,
+    with that strength (1.0: a typical re-survey).
+    """
+    rng = np.random.default_rng(seed)
+    past = stone_wall(size, size, seed)
+    current = past.copy()
+    boxes = [(kind, CHANGES[kind](current, rng)) for kind in changes]
+    # Only drawn when asked for, so existing seeds give the same pairs
+    if lighting:
+        current = shift_lighting(current, rng, lighting)
+    if warp:
+        past, _ = warp_view(past, rng, warp)
+    return past, current, boxes
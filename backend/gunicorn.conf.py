@@ -0,0 +1,36 @@
+"""
+Gunicorn settings, picked up automatically from the backend directory.
+
+GUNICORN_PRELOAD_MODEL=True loads the app, and with it the structural
+detector, once in the master before forking.  The trunk's tensors are moved
+to shared memory and the heap is frozen out of the GC, so every worker
+serves synchronous analyses from the same physical copy of the model.
+Without it each worker that runs an analysis loads its own copy lazily.
+"""
+import os
+
+preload_model = os.getenv('GUNICORN_PRELOAD_MODEL', 'False') == 'True'
+
+if preload_model:
+    os.environ['PROCESS_ROLE'] = 'inference'
+    preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the (preloaded) app is imported, before any fork.
+    if preload_model:
+        from home.detector_singleton import share_for_fork
+        share_for_fork()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the shared metrics directory.
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if preload_model:
+        from home.detector_singleton import after_fork
+        after_fork()
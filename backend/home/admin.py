@@ -1,7 +1,7 @@
 # backend/admin.py
 from django.contrib import admin
 from django.contrib.auth.models import User
-from .models import Fort, FortImage, StructuralAnalysis, UserProfile, AdminUser
+from .models import Fort, FortImage, StructuralAnalysis, AnalysisJob, AnalysisMemo, UserProfile, AdminUser
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -36,19 +36,31 @@ class AdminUserAdmin(admin.ModelAdmin):
 
 @admin.register(Fort)
 class FortAdmin(admin.ModelAdmin):
-    list_display = ['name', 'location', 'analysis_count', 'created_at']
+    list_display = ['name', 'location', 'detection_profile', 'analysis_count', 'created_at']
     search_fields = ['name', 'location']
-    list_filter = ['created_at']
+    list_filter = ['created_at', 'detection_profile']
 
 @admin.register(FortImage)
 class FortImageAdmin(admin.ModelAdmin):
     list_display = ['fort', 'uploaded_at', 'is_reference']
     list_filter = ['fort', 'uploaded_at', 'is_reference']
-    search_fields = ['fort__name', 'description']
+    search_fields = ['fort__name', 'description', 'content_hash', 'perceptual_hash']
 
 @admin.register(StructuralAnalysis)
 class StructuralAnalysisAdmin(admin.ModelAdmin):
     list_display = ['fort', 'risk_level', 'risk_score', 'changes_detected', 'analysis_date']
     list_filter = ['risk_level', 'analysis_date', 'fort']
     search_fields = ['fort__name']
-    readonly_fields = ['analysis_date']
\ No newline at end of file
+    readonly_fields = ['analysis_date']
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'fort', 'status', 'attempts', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'fort']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+@admin.register(AnalysisMemo)
+class AnalysisMemoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'previous_hash', 'current_hash', 'hits', 'created_at', 'last_used_at']
+    search_fields = ['previous_hash', 'current_hash', 'config_hash']
+    readonly_fields = ['created_at', 'last_used_at']
@@ -0,0 +1,277 @@
+"""
+Tiered estimation of the past -> current homography.
+
+Most pairs are near-identical viewpoints (re-shot from the same spot, or
+orthomosaic tiles that are already georeferenced), where keypoint
+matching is wasted work.  `estimate_tiered` tries the configured tiers
+cheapest first and stops at the first result that passes its quality gate:
+
+  phase   phase correlation of a grid of patches on the 1000 px level
+          (placed by a coarse whole-frame shift), fitted to a homography;
+          gated on the fraction of patches that agree with it
+  orb     CLAHE + ORB keypoints on the 1000 px level
+  akaze   CLAHE + AKAZE keypoints on the 1000 px level (the detector's
+          alignment_features, also used for registration)
+
+Keypoint tiers match descriptors through a FLANN LSH index (exact search
+for small sets) with a vectorised Lowe ratio test, fit the homography with
+MAGSAC++ and are gated on the inlier count and inlier ratio (inliers /
+ratio-test matches).  Every homography must also
+keep the frame in view with a sane area (`is_plausible`).  When no tier
+passes, the keypoint estimate with the most inliers is used, as the
+single AKAZE pass always did.
+"""
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from .image_pyramid import ImagePyramid
+
+TIERS = ('phase', 'orb', 'akaze')
+
+FLANN_INDEX_LSH = 6
+LSH_INDEX_PARAMS = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+# Side (px at the 1000 px level) of the phase tier's patches
+PHASE_PATCH = 256
+# Residual shift (px at the 1000 px level) of a patch that lines up after warping
+PHASE_TOLERANCE = 1.0
+# Phase-correlation peak a (windowed) patch needs to count.  Aligned texture
+# peaks at 0.5-1; unrelated or flat patches stay below ~0.3, often at a
+# spurious zero shift.
+PHASE_MIN_RESPONSE = 0.4
+# Below ~1000 train descriptors an exact brute-force search is as fast as
+# building the LSH index; at ORB's 2-5k it takes about half the time.
+MIN_LSH_DESCRIPTORS = 1000
+
+
+@dataclass(frozen=True)
+class AlignmentConfig:
+    tiers: tuple = TIERS
+    # Longest side (px) of the level the coarse whole-frame shift is found on
+    phase_size: int = 512
+    # The phase tier correlates phase_grid x phase_grid patches and needs this
+    # fraction of them to agree on one homography
+    phase_grid: int = 4
+    min_phase_inlier_ratio: float = 0.75
+    # RANSAC inliers and inliers / ratio-test matches a keypoint tier needs
+    min_inliers: int = 30
+    min_inlier_ratio: float = 0.3
+    orb_features: int = 5000
+    ratio: float = 0.75
+    # RANSAC reprojection threshold in frame pixels
+    ransac_threshold: float = 5.0
+
+    def __post_init__(self):
+        unknown = set(self.tiers) - set(TIERS)
+        if unknown or not self.tiers:
+            raise ValueError(f"Unknown alignment tiers {sorted(unknown)}; expected some of {TIERS}")
+
+
+def is_plausible(H):
+    """The unit square stays roughly in frame and keeps a sane area and orientation (0-1 coordinates)."""
+    corners = np.array([[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]], dtype=np.float64).T
+    mapped = H @ corners
+    if np.any(mapped[2] <= 1e-6):
+        return False
+    xy = mapped[:2] / mapped[2]
+    area = 0.5 * (np.dot(xy[1], np.roll(xy[0], 1)) - np.dot(xy[0], np.roll(xy[1], 1)))  # < 0 when mirrored
+    return bool(np.all((xy > -1.0) & (xy < 2.0)) and 0.25 < area < 4.0)
+
+
+def frame_matrix(size):
+    """Pixel <- 0-1 coordinates for a (width, height) frame."""
+    return np.diag([float(size[0]), float(size[1]), 1.0])
+
+
+def is_plausible_in_frames(M, size1, size2):
+    """is_plausible for a pixel homography between frames sized size1 -> size2."""
+    return is_plausible(np.linalg.inv(frame_matrix(size2)) @ M @ frame_matrix(size1))
+
+
+def ratio_matches(des1, des2, ratio=0.75):
+    """
+    Lowe ratio-test matches from des1 (query) to des2 (train) binary
+    descriptors.  Returns (query indices, train indices) as arrays.
+    """
+    if len(des2) >= MIN_LSH_DESCRIPTORS:
+        index = cv2.flann_Index(des2, LSH_INDEX_PARAMS, cv2.NORM_HAMMING)
+        idx, dist = index.knnSearch(des1, 2, params={})
+    else:
+        dist, idx = cv2.batchDistance(des1, des2, cv2.CV_32S, normType=cv2.NORM_HAMMING, K=2)
+    # LSH leaves -1 where fewer than two candidates were found
+    good = (idx[:, 1] >= 0) & (idx[:, 0] >= 0) & (dist[:, 0] < ratio * dist[:, 1].astype(np.float32))
+    query = np.flatnonzero(good)
+    return query, idx[query, 0].astype(np.intp)
+
+
+def match_points(points1, des1, points2, des2, size1, size2, ratio=0.75, ransac_threshold=5.0):
+    """
+    Homography between frames sized size1 -> size2 from keypoints in 0-1
+    coordinates.  Returns (M, inliers, ratio-test matches); M is None when
+    the features cannot be aligned.
+    """
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return None, 0, 0
+    query, train = ratio_matches(des1, des2, ratio)
+    if len(query) < 10:
+        return None, 0, len(query)
+    src_pts = (points1[query] * np.float32(size1)).reshape(-1, 1, 2)
+    dst_pts = (points2[train] * np.float32(size2)).reshape(-1, 1, 2)
+    # MAGSAC++ is as fast as plain RANSAC here and several times more
+    # accurate on ORB's coarse keypoint positions
+    M, mask = cv2.findHomography(src_pts, dst_pts, cv2.USAC_MAGSAC, ransac_threshold)
+    if M is None:
+        return None, 0, len(query)
+    return M, int(mask.sum()), len(query)
+
+
+def clahe_gray(img):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+
+
+def orb_features(img, n_features=5000):
+    """CLAHE + ORB keypoints of an image's 1000 px level, in alignment_features' format."""
+    small = ImagePyramid.of(img).fit(1000)
+    kps, des = cv2.ORB_create(nfeatures=n_features).detectAndCompute(clahe_gray(small), None)
+    size = (small.shape[1], small.shape[0])
+    points = np.float32([kp.pt for kp in kps]).reshape(-1, 2) / np.float32(size)
+    return points, des, size
+
+
+def _gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+def patch_shifts(past, current, shift, grid, patch):
+    """
+    Phase-correlate a grid x grid layout of `patch`-sized windows of `past`
+    with the windows offset by the integer `shift` (dx, dy) in `current`.
+    Returns (src, dst) patch centres, [N, 2] float32, of the patches whose
+    correlation peak reaches PHASE_MIN_RESPONSE, and the number of patches.
+    """
+    height, width = past.shape
+    sx, sy = shift
+    x_lo, x_hi = max(0, -sx), min(width, width - sx)
+    y_lo, y_hi = max(0, -sy), min(height, height - sy)
+    patch = min(patch, (x_hi - x_lo) // 2, (y_hi - y_lo) // 2)
+    if patch < 32:
+        return np.zeros((0, 2), np.float32), np.zeros((0, 2), np.float32), 0
+    window = cv2.createHanningWindow((patch, patch), cv2.CV_32F)
+    src, dst = [], []
+    for y in np.linspace(y_lo, y_hi - patch, grid).astype(int):
+        for x in np.linspace(x_lo, x_hi - patch, grid).astype(int):
+            (dx, dy), response = cv2.phaseCorrelate(
+                past[y:y + patch, x:x + patch], current[y + sy:y + sy + patch, x + sx:x + sx + patch], window,
+            )
+            if not response >= PHASE_MIN_RESPONSE:  # NaN for flat patches
+                continue
+            centre = (x + (patch - 1) / 2, y + (patch - 1) / 2)
+            src.append(centre)
+            dst.append((centre[0] + sx + dx, centre[1] + sy + dy))
+    return np.float32(src).reshape(-1, 2), np.float32(dst).reshape(-1, 2), grid * grid
+
+
+def similarity(src, dst, threshold):
+    """RANSAC rotation + uniform scale + shift as a 3x3 matrix, or None."""
+    A, _ = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=threshold)
+    return None if A is None else np.vstack([A, [0.0, 0.0, 1.0]])
+
+
+def phase_homography(past, current, config):
+    """
+    Homography from local phase-correlation shifts on the 1000 px level.
+    A coarse whole-frame shift places a grid of patches whose shifts are
+    fitted to a homography; a second grid on the warped past image checks
+    it.  Returns (M in frame pixels or None, patches that line up, patches).
+    """
+    coarse_past, coarse_current = _gray(past.fit(config.phase_size)), _gray(current.fit(config.phase_size))
+    window = cv2.createHanningWindow((coarse_past.shape[1], coarse_past.shape[0]), cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(coarse_past, coarse_current, window)
+    if not response >= PHASE_MIN_RESPONSE:
+        return None, 0, 0
+
+    level_past, level_current = _gray(past.fit(1000)), _gray(current.fit(1000))
+    height, width = level_past.shape
+    scale = width / coarse_past.shape[1]
+    # Reprojection threshold in level pixels
+    threshold = config.ransac_threshold * width / past.size[0]
+
+    src, dst, patches = patch_shifts(level_past, level_current, (round(dx * scale), round(dy * scale)),
+                                     config.phase_grid, PHASE_PATCH)
+    if len(src) < 4:
+        return None, 0, patches
+    M = similarity(src, dst, threshold)
+    if M is None:
+        return None, 0, patches
+
+    warped = cv2.warpPerspective(level_past, M, (width, height))
+    src, dst, patches = patch_shifts(warped, level_current, (0, 0), config.phase_grid, PHASE_PATCH)
+    # After a correct warp every textured, unchanged patch lines up to within
+    # PHASE_TOLERANCE; those patches also refine the estimate.
+    agree = np.linalg.norm(dst - src, axis=1) <= PHASE_TOLERANCE
+    if agree.sum() >= 4:
+        residual = similarity(src[agree], dst[agree], PHASE_TOLERANCE)
+        if residual is not None:
+            M = residual @ M
+    to_frame = np.diag([past.size[0] / width, past.size[1] / height, 1.0])
+    M = to_frame @ M @ np.linalg.inv(to_frame)
+    return M / M[2, 2], int(agree.sum()), patches
+
+
+def estimate_tiered(detector, past_img, current_img, config=None):
+    """
+    Past -> current homography (or None) and a report of how it was found:
+    {'tier', 'passed', 'tried', 'seconds', and the tier's quality measures}.
+    Either image may be an ImagePyramid.
+    """
+    config = config or AlignmentConfig()
+    past, current = ImagePyramid.of(past_img), ImagePyramid.of(current_img)
+    start = time.perf_counter()
+    tried = []
+    fallback = None
+    for tier in config.tiers:
+        if tier == 'phase' and past.size != current.size:
+            continue
+        tried.append(tier)
+        if tier == 'phase':
+            M, inliers, patches = phase_homography(past, current, config)
+            quality = {
+                'inliers': inliers,
+                'patches': patches,
+                'inlier_ratio': round(inliers / patches, 4) if patches else 0.0,
+            }
+            passed = M is not None and quality['inlier_ratio'] >= config.min_phase_inlier_ratio
+        else:
+            extract = detector.alignment_features if tier == 'akaze' else (
+                lambda img: orb_features(img, config.orb_features))
+            pts1, des1, _ = extract(past)
+            pts2, des2, _ = extract(current)
+            M, inliers, matches = match_points(
+                pts1, des1, pts2, des2, past.size, current.size,
+                ratio=config.ratio, ransac_threshold=config.ransac_threshold,
+            )
+            quality = {
+                'inliers': inliers,
+                'matches': matches,
+                'inlier_ratio': round(inliers / matches, 4) if matches else 0.0,
+            }
+            passed = M is not None and inliers >= config.min_inliers and (
+                quality['inlier_ratio'] >= config.min_inlier_ratio)
+        if M is not None and not is_plausible_in_frames(M, past.size, current.size):
+            M, passed = None, False
+        if M is not None and tier != 'phase' and (fallback is None or quality['inliers'] > fallback[2]['inliers']):
+            fallback = (M, tier, quality)
+        if passed:
+            return M, {'tier': tier, 'passed': True, 'tried': tried, **quality,
+                       'seconds': round(time.perf_counter() - start, 4)}
+
+    report = {'tier': 'none', 'passed': False, 'tried': tried}
+    M = None
+    if fallback is not None:
+        # Nothing passed the gate: keep the best keypoint estimate, as the single-tier path did
+        M, tier, quality = fallback
+        report.update({'tier': tier, **quality})
+    report['seconds'] = round(time.perf_counter() - start, 4)
+    return M, report
@@ -0,0 +1,408 @@
+"""
+Database-backed queue for structural analyses.
+
+The analyze endpoint only stores the upload and inserts an `AnalysisJob`;
+`manage.py run_analysis_worker` processes poll the table, claim jobs with
+an atomic conditional UPDATE (portable across SQLite and PostgreSQL, no
+external broker) and run the detector outside the HTTP request.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics, timings
+from .detection_profiles import resolve_profile
+from .detector_singleton import get_detector
+from .image_hashes import config_hash
+from .models import AnalysisJob, AnalysisMemo, StructuralAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the same images, model and settings start producing different
+# results (e.g. 2: optional 0-1 scaled adaptive threshold), so memoized
+# analyses computed by the old code are not reused.
+ANALYSIS_VERSION = 2
+
+
+def ensure_hashes(fort_image):
+    # Images uploaded before content hashing are hashed on first use
+    if not fort_image.content_hash:
+        fort_image.compute_hashes()
+        fort_image.save(update_fields=['content_hash', 'perceptual_hash'])
+    return fort_image.content_hash
+
+
+def analysis_config(detector, fort, params, parameters):
+    """Everything besides the two images that shapes an analysis result."""
+    reference = None
+    if settings.ALIGNMENT_REGISTRATION:
+        # The image register_image promotes when the fort has no reference yet
+        reference = fort.reference_image or fort.images.order_by('uploaded_at', 'id').first()
+    return {
+        'version': ANALYSIS_VERSION,
+        'model': detector.feature_fingerprint(),
+        'detector': detector.config,
+        'alignment': detector.alignment,
+        'tiling': detector.tiling,
+        'prescreen': detector.prescreen,
+        'ssim': detector.ssim,
+        'annotation': detector.annotation,
+        'params': params.to_dict(),
+        'inputs': {k: parameters.get(k) for k in ('temperature', 'humidity', 'wind_speed')},
+        'max_side': settings.ANALYSIS_MAX_SIDE,
+        'reference': ensure_hashes(reference) if reference is not None else None,
+        'orthomosaic': [settings.ORTHOMOSAIC_TILE_SIZE, settings.ORTHOMOSAIC_TILE_OVERLAP,
+                        settings.ORTHOMOSAIC_OVERVIEW_SIZE],
+    }
+
+
+@metrics.ANALYSES_IN_PROGRESS.track_inprogress()
+def run_structural_analysis(detector, fort, previous_image, current_image, user=None, parameters=None,
+                            notify=True):
+    """
+    Compare `previous_image` against `current_image` and persist the result.
+    Shared by the synchronous endpoint path and the queue workers.  With
+    `notify` the report email is sent right away; queue workers send it
+    themselves once they know the job is still theirs.
+    """
+    parameters = parameters or {}
+    logger.info("Starting structural analysis for fort %s", fort.name)
+
+    # --- Auto-Training / ML Feedback Loop ---
+    if user is not None:
+        history_qs = StructuralAnalysis.objects.filter(fort=fort, is_verified=True, verified_by=user.username)
+    else:
+        history_qs = StructuralAnalysis.objects.filter(fort=fort, is_verified=True)
+
+    total_verifications = history_qs.count()
+    false_positives = history_qs.filter(is_false_positive=True).count()
+
+    fp_rate = 0.0
+    if total_verifications > 0:
+        fp_rate = false_positives / total_verifications
+
+    params = detector.thresholds_from_history(fp_rate)
+
+    # Environmental data captured with the upload
+    temp = parameters.get('temperature')
+    humidity = parameters.get('humidity')
+    wind_speed = parameters.get('wind_speed')
+
+    # Imported here so web processes (which only enqueue) stay free of cv2/tifffile.
+    from .orthomosaic import analyze_orthomosaic, is_orthomosaic, overview_results
+
+    with timings.recording(settings.ANALYSIS_TIMINGS, settings.ANALYSIS_TRACE_FILE or None,
+                           fort=fort.id, previous_image=previous_image.id, current_image=current_image.id) as timing:
+        memo_key = memo = None
+        with timings.stage('memo_lookup'):
+            if settings.ANALYSIS_MEMO:
+                memo_key = {
+                    'previous_hash': ensure_hashes(previous_image),
+                    'current_hash': ensure_hashes(current_image),
+                    'config_hash': config_hash(analysis_config(detector, fort, params, parameters)),
+                }
+                memo = AnalysisMemo.objects.filter(**memo_key).first()
+                metrics.ANALYSIS_MEMO_LOOKUPS.labels('miss' if memo is None else 'hit').inc()
+
+        if memo is not None:
+            # The same pair of images under the same configuration: reuse the result
+            AnalysisMemo.objects.filter(pk=memo.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+            results = {**memo.results, 'memo': {'hit': True, 'memo_id': memo.pk}}
+            annotated_file = None
+            logger.info("Analysis served from memo %s", memo.pk)
+        elif is_orthomosaic(previous_image.image.name) and is_orthomosaic(current_image.image.name):
+            # Whole-fort orthomosaics: streamed tile by tile, annotated on an overview
+            with timings.stage('orthomosaic'):
+                results, overview = analyze_orthomosaic(
+                    detector, previous_image.image.path, current_image.image.path, temp, humidity, wind_speed,
+                    params=params,
+                    tile_size=settings.ORTHOMOSAIC_TILE_SIZE,
+                    overlap=settings.ORTHOMOSAIC_TILE_OVERLAP,
+                    overview_size=settings.ORTHOMOSAIC_OVERVIEW_SIZE,
+                )
+            with timings.stage('render'):
+                annotated_img = detector.visualize_results(overview, overview_results(results))
+        else:
+            # Load images
+            max_side = settings.ANALYSIS_MAX_SIDE or None
+            with timings.stage('decode'):
+                past_img = detector.load_image_from_file(previous_image.image, max_side)
+                current_img = detector.load_image_from_file(current_image.image, max_side)
+
+            # Register each image once to the fort's reference frame; the pair's
+            # alignment is then composed from the stored homographies.
+            normalized_homography = None
+            with timings.stage('registration'):
+                if settings.ALIGNMENT_REGISTRATION:
+                    from .registration import pair_homography, register_image
+
+                    try:
+                        register_image(detector, previous_image, past_img)
+                        register_image(detector, current_image, current_img)
+                        normalized_homography = pair_homography(previous_image, current_image)
+                    except Exception as e:
+                        logger.warning("Image registration failed, aligning the pair directly: %s", e)
+
+            # Detect changes & evaluate Climate Stress Index (CSI)
+            with timings.stage('detect'):
+                results = detector.detect_structural_changes(
+                    past_img, current_img, temp, humidity, wind_speed,
+                    past_image_id=previous_image.id, current_image_id=current_image.id,
+                    params=params, normalized_homography=normalized_homography,
+                )
+
+            # Create annotated image
+            with timings.stage('render'):
+                annotated_img = detector.visualize_results(current_img, results)
+        if memo is None:
+            with timings.stage('encode'):
+                annotated_file = detector.save_annotated_image(annotated_img)
+            if memo_key is not None:
+                results['memo'] = {'hit': False}
+    if timing is not None:
+        results['timings'] = timing.timings()
+        metrics.observe_stages(results['timings'])
+
+    # Calculate total area
+    total_area = sum(d['area'] for d in results['detections']) if results['detections'] else 0
+
+    # Save analysis with Phase 3 Environmental tracking
+    analysis = StructuralAnalysis.objects.create(
+        fort=fort,
+        previous_image=previous_image,
+        current_image=current_image,
+        cnn_distance=results['cnn_distance'],
+        ssim_score=results['ssim_score'],
+        risk_level=results['risk_assessment']['level'],
+        risk_score=results['risk_assessment']['score'],
+        changes_detected=results['total_changes'],
+        total_area_affected=total_area,
+        analysis_results=results,
+        temperature=temp,
+        humidity=humidity,
+        wind_speed=wind_speed,
+        climate_stress_index=results.get('environmental_data', {}).get('climate_stress_index', 0.0),
+        final_heritage_risk_score=results.get('environmental_data', {}).get('final_heritage_risk_score', 0.0)
+    )
+
+    # Save annotated image
+    if annotated_file is None:
+        # Memoized results share the stored annotation
+        analysis.annotated_image.name = memo.annotated_image.name
+        analysis.save(update_fields=['annotated_image'])
+    else:
+        extension = os.path.splitext(annotated_file.name or '')[1] or '.png'
+        analysis.annotated_image.save(
+            f'analysis_{fort.id}_{analysis.id}{extension}',
+            annotated_file,
+            save=True
+        )
+        if memo_key is not None:
+            memo_results = {k: v for k, v in results.items() if k not in ('memo', 'timings')}
+            # A concurrent identical analysis may have stored it first; either result will do.
+            AnalysisMemo.objects.get_or_create(
+                **memo_key, defaults={'results': memo_results, 'annotated_image': analysis.annotated_image.name},
+            )
+
+    metrics.ANALYSES.labels(results['risk_assessment']['level']).inc()
+    logger.info("Analysis complete: %s risk detected", results['risk_assessment']['level'])
+
+    if notify:
+        send_analysis_report(analysis, user)
+    return analysis
+
+
+def send_analysis_report(analysis, user):
+    # --- Auto-send Email upon scan generation ---
+    from .views import send_ai_report_email
+    user_email = user.email if user is not None and user.email else None
+    threading.Thread(
+        target=send_ai_report_email,
+        args=(analysis, "Automated scan completed on new image upload.", user_email),
+        daemon=True,
+    ).start()
+
+
+def enqueue_analysis(fort, previous_image, current_image, user=None, parameters=None):
+    """Queue an analysis; an identical request still queued or running (a client retry) gets that job back."""
+    job = dict(
+        fort=fort,
+        previous_image=previous_image,
+        current_image=current_image,
+        requested_by=user,
+        parameters=parameters or {},
+    )
+    pending = AnalysisJob.objects.filter(status__in=[AnalysisJob.QUEUED, AnalysisJob.RUNNING], **job)
+    return pending.order_by('created_at').first() or AnalysisJob.objects.create(**job)
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the oldest queued job to RUNNING and return it.
+    Only the worker whose conditional UPDATE matches the row wins it.
+    """
+    candidates = AnalysisJob.objects.filter(status=AnalysisJob.QUEUED).order_by('created_at')
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = AnalysisJob.objects.filter(id=job_id, status=AnalysisJob.QUEUED).update(
+            status=AnalysisJob.RUNNING,
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return AnalysisJob.objects.select_related(
+                'fort', 'previous_image', 'current_image', 'requested_by'
+            ).get(id=job_id)
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Return RUNNING jobs whose worker died (no heartbeat within the timeout)
+    to the queue, or fail them once they exhausted their attempts.  A job
+    that is merely slow keeps its heartbeat fresh and stays with its worker.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_TIMEOUT)
+    stale = AnalysisJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=AnalysisJob.RUNNING,
+    )
+    stale.filter(attempts__lt=settings.ANALYSIS_JOB_MAX_ATTEMPTS).update(status=AnalysisJob.QUEUED, worker=None)
+    stale.update(
+        status=AnalysisJob.FAILED,
+        error='Worker stopped sending heartbeats.',
+        finished_at=timezone.now(),
+    )
+
+
+def owned(job):
+    """The job's row, as long as `job.worker` is still running it."""
+    return AnalysisJob.objects.filter(pk=job.pk, worker=job.worker, status=AnalysisJob.RUNNING)
+
+
+class JobHeartbeat:
+    """Refresh a running job's heartbeat_at every `interval` seconds from a background thread."""
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.ANALYSIS_JOB_HEARTBEAT_INTERVAL
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'heartbeat-{job.pk}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                if not owned(self.job).update(heartbeat_at=timezone.now()):
+                    logger.warning("Analysis job %s is no longer owned by %s.", self.job.id, self.job.worker)
+                    return
+        finally:
+            connections.close_all()  # this thread's connections only
+
+
+def process_job(job, detector=None):
+    error = analysis = None
+    try:
+        if detector is None:
+            detector = get_detector(resolve_profile(job.parameters.get('profile'), job.fort))
+        with JobHeartbeat(job):
+            analysis = run_structural_analysis(
+                detector, job.fort, job.previous_image, job.current_image,
+                user=job.requested_by, parameters=job.parameters, notify=False,
+            )
+    except Exception as e:
+        logger.error("Analysis job %s failed: %s", job.id, e, exc_info=True)
+        error = str(e)
+
+    finished = dict(
+        status=AnalysisJob.FAILED if analysis is None else AnalysisJob.DONE,
+        analysis=analysis, error=error, finished_at=timezone.now(),
+    )
+    if not owned(job).update(**finished):
+        # Requeued (and possibly claimed by another worker) meanwhile: that run reports it.
+        logger.warning("Analysis job %s was taken over from %s; dropping its result.", job.id, job.worker)
+        if analysis is not None:
+            analysis.delete()  # its annotation file may back a memo entry, so it stays
+        job.refresh_from_db()
+        return job
+
+    for field, value in finished.items():
+        setattr(job, field, value)
+    if analysis is not None:
+        send_analysis_report(analysis, job.requested_by)
+    return job
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(poll_interval=None, stop_event=None, worker_name=None):
+    """Poll the queue until `stop_event` is set."""
+    poll_interval = poll_interval or settings.ANALYSIS_JOB_POLL_INTERVAL
+    worker_name = worker_name or default_worker_name()
+    # Warm up the default profile; others load on their first job.
+    get_detector()
+    logger.info("Analysis worker %s started.", worker_name)
+
+    while not (stop_event and stop_event.is_set()):
+        close_old_connections()
+        job = claim_next_job(worker_name)
+        if job is None:
+            requeue_stale_jobs()
+            time.sleep(poll_interval)
+            continue
+        process_job(job)
+
+    connections.close_all()
+    logger.info("Analysis worker %s stopped.", worker_name)
+
+
+def run_worker_threads(threads=1, poll_interval=None, stop_event=None):
+    """
+    Run `threads` polling loops in this process.  They share the loaded detectors,
+    which is safe because detection parameters are passed per call.
+    """
+    if threads <= 1:
+        run_worker(poll_interval=poll_interval, stop_event=stop_event)
+    else:
+        base_name = default_worker_name()
+        pool = [
+            threading.Thread(
+                target=run_worker,
+                kwargs={'poll_interval': poll_interval, 'stop_event': stop_event, 'worker_name': f"{base_name}/{i}"},
+            )
+            for i in range(threads)
+        ]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+    log_timing_summary()
+
+
+def log_timing_summary():
+    """Log this process's per-stage analysis timings (see timings.py)."""
+    for stage, entry in timings.summary().items():
+        logger.info(
+            "Stage %-12s %5d runs  mean %9.1f ms  max %9.1f ms",
+            stage, entry['count'], entry['mean_ms'], entry['max_ms'],
+        )
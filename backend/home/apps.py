@@ -6,10 +6,10 @@ class HomeConfig(AppConfig):
     name = 'home'
 
     def ready(self):
-        # Load the ML model once at startup so it is reused across requests
-        # instead of being re-instantiated on every analysis call.
-        # detector_singleton handles ImportError gracefully when ML deps are absent.
-        try:
-            from . import detector_singleton  # noqa: F401
-        except Exception:
-            pass
+        # Only inference processes load the ML model at startup; everything
+        # else (migrate, collectstatic, API-only workers) loads it lazily on
+        # the first analysis, so it never imports torch unless it needs to.
+        from django.conf import settings
+        if settings.PROCESS_ROLE == 'inference':
+            from .detector_singleton import preload
+            preload()
@@ -0,0 +1,180 @@
+"""
+Truncated CNN backbones for deep feature differencing.
+
+The detector only uses the first stride-8 stage of each backbone (ResNet
+conv1 -> layer2, MobileNetV3 features[:7]), so instead of instantiating
+the full torchvision model (and downloading its weights on first start)
+we build just that trunk and load it from a local weight bundle produced
+once by `manage.py build_backbone_bundle`.
+
+The trunk is constructed on the meta device and the bundle is
+memory-mapped and assigned in place, so loading allocates no random
+initialisation and never touches layer3/layer4/fc.
+"""
+import logging
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+
+# Last module kept for each supported architecture (all at 1/8 resolution).
+TRUNK_LAYERS = {
+    'resnet50': 'layer2',
+    'resnet18': 'layer2',
+    'mobilenet_v3_large': 'features.6',
+}
+
+
+class BasicBlock(nn.Module):
+    # Same layout and attribute names as torchvision.models.resnet.BasicBlock.
+    expansion = 1
+
+    def __init__(self, inplanes, planes, stride=1, downsample=None):
+        super().__init__()
+        self.conv1 = nn.Conv2d(inplanes, planes, kernel_size=3, stride=stride, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(planes)
+        self.relu = nn.ReLU(inplace=True)
+        self.conv2 = nn.Conv2d(planes, planes, kernel_size=3, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(planes)
+        self.downsample = downsample
+
+    def forward(self, x):
+        identity = x if self.downsample is None else self.downsample(x)
+        out = self.relu(self.bn1(self.conv1(x)))
+        out = self.bn2(self.conv2(out))
+        return self.relu(out + identity)
+
+
+class Bottleneck(nn.Module):
+    # Same layout and attribute names as torchvision.models.resnet.Bottleneck so
+    # state_dict keys match, without importing torchvision at startup.
+    expansion = 4
+
+    def __init__(self, inplanes, planes, stride=1, downsample=None):
+        super().__init__()
+        width = planes
+        self.conv1 = nn.Conv2d(inplanes, width, kernel_size=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(width)
+        self.conv2 = nn.Conv2d(width, width, kernel_size=3, stride=stride, padding=1, bias=False)
+        self.bn2 = nn.BatchNorm2d(width)
+        self.conv3 = nn.Conv2d(width, planes * self.expansion, kernel_size=1, bias=False)
+        self.bn3 = nn.BatchNorm2d(planes * self.expansion)
+        self.relu = nn.ReLU(inplace=True)
+        self.downsample = downsample
+
+    def forward(self, x):
+        identity = x if self.downsample is None else self.downsample(x)
+        out = self.relu(self.bn1(self.conv1(x)))
+        out = self.relu(self.bn2(self.conv2(out)))
+        out = self.bn3(self.conv3(out))
+        return self.relu(out + identity)
+
+
+def _make_layer(block, inplanes, planes, blocks, stride):
+    # Mirrors torchvision.models.resnet.ResNet._make_layer so state_dict keys match.
+    outplanes = planes * block.expansion
+    downsample = None
+    if stride != 1 or inplanes != outplanes:
+        downsample = nn.Sequential(
+            nn.Conv2d(inplanes, outplanes, kernel_size=1, stride=stride, bias=False),
+            nn.BatchNorm2d(outplanes),
+        )
+    layers = [block(inplanes, planes, stride, downsample)]
+    layers.extend(block(outplanes, planes) for _ in range(1, blocks))
+    return nn.Sequential(*layers)
+
+
+def _resnet_stem():
+    return [
+        nn.Conv2d(3, 64, kernel_size=7, stride=2, padding=3, bias=False),
+        nn.BatchNorm2d(64),
+        nn.ReLU(inplace=True),
+        nn.MaxPool2d(kernel_size=3, stride=2, padding=1),
+    ]
+
+
+def build_resnet50_trunk():
+    """ResNet50 conv1 -> layer2 (512 channels, 1/8 resolution), uninitialised weights."""
+    return nn.Sequential(
+        *_resnet_stem(),
+        _make_layer(Bottleneck, 64, 64, blocks=3, stride=1),
+        _make_layer(Bottleneck, 256, 128, blocks=4, stride=2),
+    )
+
+
+def build_resnet18_trunk():
+    """ResNet18 conv1 -> layer2 (128 channels, 1/8 resolution), uninitialised weights."""
+    return nn.Sequential(
+        *_resnet_stem(),
+        _make_layer(BasicBlock, 64, 64, blocks=2, stride=1),
+        _make_layer(BasicBlock, 64, 128, blocks=2, stride=2),
+    )
+
+
+def build_mobilenet_v3_trunk():
+    """MobileNetV3-Large features[:7] (40 channels, 1/8 resolution)."""
+    # Squeeze-excitation and hardswish blocks are torchvision's own; the
+    # full model is cheap to build on the meta device and then sliced.
+    import torchvision.models as models
+
+    return models.mobilenet_v3_large(weights=None).features[:7]
+
+
+TRUNK_BUILDERS = {
+    'resnet50': build_resnet50_trunk,
+    'resnet18': build_resnet18_trunk,
+    'mobilenet_v3_large': build_mobilenet_v3_trunk,
+}
+
+
+def bundle_filename(arch, suffix=''):
+    """e.g. resnet50_layer2.pt, mobilenet_v3_large_features6_int8.pt"""
+    return f"{arch}_{TRUNK_LAYERS[arch].replace('.', '')}{suffix}.pt"
+
+
+def trunk_from_torchvision(weights, arch='resnet50'):
+    """Slice the stride-8 trunk out of a full torchvision model."""
+    import torchvision.models as models
+
+    full_model = getattr(models, arch)(weights=weights)
+    if arch == 'mobilenet_v3_large':
+        return full_model.features[:7]
+    return nn.Sequential(
+        full_model.conv1,
+        full_model.bn1,
+        full_model.relu,
+        full_model.maxpool,
+        full_model.layer1,
+        full_model.layer2,
+    )
+
+
+def save_bundle(trunk, path, weights_name, arch='resnet50'):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({
+        'format': BUNDLE_FORMAT,
+        'arch': arch,
+        'layer': TRUNK_LAYERS[arch],
+        'weights': weights_name,
+        'state_dict': trunk.state_dict(),
+    }, path)
+
+
+def load_bundle(path):
+    """
+    Build the trunk from a bundle on disk.
+    Returns (trunk, metadata) where metadata excludes the state dict.
+    """
+    bundle = torch.load(path, map_location='cpu', weights_only=True, mmap=True)
+    if bundle.get('format') != BUNDLE_FORMAT or bundle.get('arch') not in TRUNK_BUILDERS:
+        raise ValueError(f"Unsupported backbone bundle {path}")
+    with torch.device('meta'):
+        trunk = TRUNK_BUILDERS[bundle['arch']]()
+    trunk.load_state_dict(bundle['state_dict'], assign=True)
+    metadata = {k: v for k, v in bundle.items() if k != 'state_dict'}
+    return trunk.eval(), metadata
@@ -0,0 +1,200 @@
+"""
+Clustering of detection centroids and merging of their boxes.
+
+`connected_components` returns the clusters DBSCAN(eps, min_samples=1)
+finds: the connected components of the graph joining centroids at most
+`eps` apart.  Points are binned on a uniform grid with cell side
+eps / sqrt(2), so every cell is a clique and only needs one node; cells
+up to two apart are joined when their closest pair is within `eps`, and
+a vectorised union-find (pointer jumping) labels the components.  Cost
+grows with the number of occupied cells, not with the number of close
+pairs, so thousands of blobs piled into one damaged area stay cheap.
+
+`merge_clusters` merges each cluster's boxes with NumPy reductions
+(union box, summed area, highest confidence and severity).
+"""
+import numpy as np
+
+SEVERITIES = ('Minor', 'Moderate', 'Critical')
+# Merged clusters larger than this (px) are Critical
+CRITICAL_AREA = 5000
+# Candidate point pairs compared at once when joining cells
+PAIR_CHUNK = 1 << 22
+
+
+def _roots(parent):
+    # Pointer jumping until every node points at its root
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return parent
+        parent = grand
+
+
+def union_find(n, a, b):
+    """Component root of each of `n` nodes joined by the edges a[i] - b[i]."""
+    parent = np.arange(n)
+    a, b = np.asarray(a, dtype=np.intp), np.asarray(b, dtype=np.intp)
+    while a.size:
+        parent = _roots(parent)
+        ra, rb = parent[a], parent[b]
+        pending = ra != rb
+        if not pending.any():
+            break
+        a, b, ra, rb = a[pending], b[pending], ra[pending], rb[pending]
+        # Hook the larger root under the smaller; conflicting writes just
+        # leave some edges for the next round.
+        parent[np.maximum(ra, rb)] = np.minimum(ra, rb)
+    return _roots(parent)
+
+
+def _neighbour_offsets():
+    # Forward half of the cells that can hold a point within eps: offsets
+    # up to 2 cells, except (+-2, +-2) whose points are always > eps apart.
+    # Nearest first, so most far pairs are already joined when reached.
+    offsets = [(dx, dy) for dx in range(0, 3) for dy in range(-2, 3)
+               if (dx, dy) > (0, 0) and not (abs(dx) == 2 and abs(dy) == 2)]
+    return sorted(offsets, key=lambda o: (max(abs(o[0]) - 1, 0) ** 2 + max(abs(o[1]) - 1, 0) ** 2, o))
+
+
+class _Grid:
+    """Points bucketed into cells, each cell's points contiguous in `order`."""
+
+    def __init__(self, points, side):
+        self.points = points
+        cells = np.floor((points - points.min(axis=0)) / side).astype(np.int64)
+        self.cells, cell_of = np.unique(cells, axis=0, return_inverse=True)
+        self.cell_of = cell_of.ravel()
+        self.order = np.argsort(self.cell_of, kind='stable')
+        self.count = np.bincount(self.cell_of, minlength=len(self.cells))
+        self.start = np.cumsum(self.count) - self.count
+        # np.unique sorted the cells row-major, so these keys are sorted
+        self.width = self.cells[:, 1].max() + 5
+        self.keys = self.cells[:, 0] * self.width + self.cells[:, 1]
+
+    def neighbours(self, dx, dy):
+        """Occupied cell pairs (a, b) with b = a + (dx, dy)."""
+        target = (self.cells[:, 0] + dx) * self.width + (self.cells[:, 1] + dy)
+        pos = np.minimum(np.searchsorted(self.keys, target), len(self.keys) - 1)
+        a = np.flatnonzero(self.keys[pos] == target)
+        return a, pos[a]
+
+    def members(self, cells, repeat=None):
+        """Point indices of `cells` (each repeated `repeat` times) and the position each belongs to."""
+        sizes = self.count[cells] if repeat is None else self.count[cells] * repeat
+        owner = np.repeat(np.arange(len(cells)), sizes)
+        local = np.arange(owner.size) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return owner, local
+
+    def nearest(self, cells, targets):
+        """Point of each cell in `cells` nearest to the matching row of `targets`."""
+        owner, local = self.members(cells)
+        idx = self.order[self.start[cells][owner] + local]
+        d = self.points[idx] - targets[owner]
+        d = np.einsum('ij,ij->i', d, d)
+        seg = np.cumsum(self.count[cells]) - self.count[cells]
+        best = np.flatnonzero(d == np.minimum.reduceat(d, seg)[owner])
+        _, first = np.unique(owner[best], return_index=True)
+        return idx[best[first]]
+
+    def close(self, a, b, eps):
+        """Mask of the cell pairs (a[i], b[i]) holding a point pair within eps, checking every pair."""
+        close = np.zeros(a.size, dtype=bool)
+        if not a.size:
+            return close
+        sizes = self.count[a] * self.count[b]
+        total = np.cumsum(sizes)
+        cuts = np.searchsorted(total, np.arange(PAIR_CHUNK, total[-1], PAIR_CHUNK), side='right')
+        bounds = np.unique(np.r_[0, cuts, a.size])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            ca, cb = a[lo:hi], b[lo:hi]
+            pair, local = self.members(ca, self.count[cb])
+            count_b = self.count[cb][pair]
+            pa = self.order[self.start[ca][pair] + local // count_b]
+            pb = self.order[self.start[cb][pair] + local % count_b]
+            d = self.points[pa] - self.points[pb]
+            close[lo + pair[np.einsum('ij,ij->i', d, d) <= eps * eps]] = True
+        return close
+
+
+def connected_components(points, eps):
+    """
+    Cluster label of each point (DBSCAN with min_samples=1), numbered in
+    order of each cluster's first point.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.intp)
+    # Duplicate centroids share a node
+    points, point_node = np.unique(points, axis=0, return_inverse=True)
+    grid = _Grid(points, eps / np.sqrt(2.0))
+
+    edges_a, edges_b = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+    cell_root = np.arange(len(grid.cells))
+    for dx, dy in _neighbour_offsets():
+        a, b = grid.neighbours(dx, dy)
+        pending = cell_root[a] != cell_root[b]
+        a, b = a[pending], b[pending]
+        if not a.size:
+            continue
+        # Cheap probe: a's point nearest b's middle against b's point nearest
+        # that one.  Joins touching cells of a dense area without the
+        # exhaustive check, which only runs on the pairs the probe leaves.
+        middle = (grid.cells[b] + 0.5) * (eps / np.sqrt(2.0)) + points.min(axis=0)
+        pa = grid.nearest(a, middle)
+        pb = grid.nearest(b, points[pa])
+        d = points[pa] - points[pb]
+        close = np.einsum('ij,ij->i', d, d) <= eps * eps
+        close[~close] = grid.close(a[~close], b[~close], eps)
+        edges_a.append(a[close])
+        edges_b.append(b[close])
+        cell_root = union_find(len(grid.cells), np.concatenate(edges_a), np.concatenate(edges_b))
+
+    roots = cell_root[grid.cell_of[point_node.ravel()]]
+    # Renumber by first occurrence, as DBSCAN labels clusters
+    _, first, labels = np.unique(roots, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.intp)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[labels.ravel()]
+
+
+def merge_clusters(detections, labels):
+    """One merged detection per label, in label order."""
+    labels = np.asarray(labels)
+    boxes = np.array([d['bbox'] for d in detections], dtype=np.int64).reshape(-1, 4)
+    area = np.array([d['area'] for d in detections], dtype=np.float64)
+    confidence = np.array([d['confidence'] for d in detections], dtype=np.float64)
+    severity = np.array([SEVERITIES.index(d.get('severity', 'Minor')) for d in detections])
+
+    order = np.argsort(labels, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(labels[order]) != 0])
+    x1 = np.minimum.reduceat(boxes[order, 0], starts)
+    y1 = np.minimum.reduceat(boxes[order, 1], starts)
+    x2 = np.maximum.reduceat(boxes[order, 0] + boxes[order, 2], starts)
+    y2 = np.maximum.reduceat(boxes[order, 1] + boxes[order, 3], starts)
+    total_area = np.add.reduceat(area[order], starts)
+    max_confidence = np.maximum.reduceat(confidence[order], starts)
+    max_severity = np.maximum.reduceat(severity[order], starts)
+    max_severity[total_area > CRITICAL_AREA] = len(SEVERITIES) - 1
+
+    return [
+        {
+            'bbox': (int(a), int(b), int(c - a), int(d - b)),
+            'area': float(s),
+            'confidence': float(conf),
+            'severity': SEVERITIES[sev],
+            'centroid': (int((a + c) // 2), int((b + d) // 2)),
+        }
+        for a, b, c, d, s, conf, sev in zip(
+            x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist(), total_area.tolist(),
+            max_confidence.tolist(), max_severity.tolist(),
+        )
+    ]
+
+
+def cluster_detections(detections, eps):
+    """Merge detections whose centroids chain together within `eps` px."""
+    if len(detections) < 2:
+        return detections
+    labels = connected_components([d['centroid'] for d in detections], eps)
+    return merge_clusters(detections, labels)
@@ -0,0 +1,48 @@
+"""
+Named speed/accuracy profiles for the structural detector.
+
+A profile fixes the CNN trunk and the resolution the images are encoded
+at.  All trunks stop at stride 8, so diff maps, thresholds and the
+feature-cache reuse rule behave the same across profiles; lighter trunks
+see less context and finer detail is lost at lower input sizes.
+
+The profile for an analysis is the one requested with it, else the
+fort's `detection_profile`, else settings.DETECTION_PROFILE.  This module
+does not import the ML stack, so views and models can use it freely.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class DetectionProfile:
+    name: str
+    backbone: str      # trunk architecture, see backbones.TRUNK_LAYERS
+    weights: str       # torchvision weights the trunk is cut from
+    input_size: tuple  # (width, height) fed to the trunk
+
+
+PROFILES = {
+    'fast': DetectionProfile('fast', 'mobilenet_v3_large', 'MobileNet_V3_Large_Weights.IMAGENET1K_V2', (512, 512)),
+    'balanced': DetectionProfile('balanced', 'resnet18', 'ResNet18_Weights.IMAGENET1K_V1', (768, 768)),
+    'accurate': DetectionProfile('accurate', 'resnet50', 'ResNet50_Weights.IMAGENET1K_V2', (1024, 1024)),
+}
+
+PROFILE_CHOICES = [(name, name.title()) for name in PROFILES]
+
+
+def get_profile(name):
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown detection profile {name!r}; expected one of {', '.join(PROFILES)}") from None
+
+
+def resolve_profile(requested=None, fort=None):
+    """Name of the profile to use: request, then fort, then the site default."""
+    if requested:
+        return get_profile(requested).name
+    if fort is not None and fort.detection_profile:
+        return fort.detection_profile
+    return settings.DETECTION_PROFILE
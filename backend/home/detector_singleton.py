@@ -1,19 +1,162 @@
 """
-Singleton holder for StructuralChangeDetector.
+Process-wide holder for StructuralChangeDetector.
 
-Importing this module initialises the detector once and stores it in
-`detector_instance`.  All views should use this shared instance instead of
-calling `StructuralChangeDetector()` on every request.
+Importing torch/torchvision/skimage/sklearn and building the CNN trunk is
+expensive, and most processes never run an analysis (`migrate`,
+`collectstatic`, `setup_admin.py`, API-only web workers).  Nothing here
+imports the ML stack at module level: `get_detector(profile)` builds one
+detector per detection profile on first use and `detector_instance` is a
+lazy proxy for the default profile.  Processes started with
+PROCESS_ROLE=inference call `preload()` from `HomeConfig.ready` so the
+first analysis does not wait.
+
+Pre-forking servers (gunicorn with GUNICORN_PRELOAD_MODEL, the analysis
+worker pool) call `share_for_fork()` in the parent: the trunk's tensors
+move to shared memory and every live object is frozen out of the cyclic
+GC, so forked children reuse the parent's pages instead of copying them
+when they touch the model.  Children call `after_fork()`.
 """
+import gc
 import logging
+import os
+import threading
+from dataclasses import replace
+
+from .metrics import MODEL_LOADED
 
 logger = logging.getLogger(__name__)
 
-detector_instance = None
+_detectors = {}  # profile name -> StructuralChangeDetector
+_feature_store = None
+_lock = threading.Lock()
+
+
+def _get_feature_store():
+    # One store for every profile; entries are keyed by a model fingerprint.
+    global _feature_store
+    from django.conf import settings
+    from .feature_cache import FeatureStore
+
+    if _feature_store is None and getattr(settings, 'FEATURE_CACHE_ENABLED', True):
+        _feature_store = FeatureStore(
+            settings.FEATURE_CACHE_DIR,
+            max_entries=settings.FEATURE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.FEATURE_CACHE_MAX_BYTES,
+        )
+    return _feature_store
+
 
-try:
+def _build_detector(profile):
+    from django.conf import settings
+    from .backbones import bundle_filename
+    from .detection_profiles import get_profile
     from .structural_detector import StructuralChangeDetector
-    detector_instance = StructuralChangeDetector()
-    logger.info("StructuralChangeDetector loaded and cached at startup.")
-except Exception as exc:  # pragma: no cover
-    logger.warning("Could not pre-load StructuralChangeDetector: %s", exc)
+
+    arch = get_profile(profile).backbone
+    detector = StructuralChangeDetector(
+        feature_store=_get_feature_store(),
+        weights_path=os.path.join(settings.BACKBONE_WEIGHTS_DIR, bundle_filename(arch)),
+        backend=settings.INFERENCE_BACKEND,
+        int8_path=os.path.join(settings.BACKBONE_WEIGHTS_DIR, bundle_filename(arch, '_int8')),
+        profile=profile,
+    )
+    detector.default_params = replace(detector.default_params, scaled_threshold=settings.ADAPTIVE_THRESHOLD_SCALED)
+    if getattr(settings, 'INFERENCE_BATCHING', False):
+        detector.enable_batching(
+            max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+        )
+    detector.configure_alignment(
+        tiers=settings.ALIGNMENT_TIERS,
+        min_inliers=settings.ALIGNMENT_MIN_INLIERS,
+        min_inlier_ratio=settings.ALIGNMENT_MIN_INLIER_RATIO,
+    )
+    detector.configure_ssim(max_side=settings.SSIM_MAX_SIDE, gaussian=settings.SSIM_GAUSSIAN)
+    detector.configure_annotation(
+        format=settings.ANNOTATION_FORMAT,
+        quality=settings.ANNOTATION_QUALITY,
+        max_side=settings.ANNOTATION_MAX_SIDE,
+    )
+    if settings.PRESCREEN_ENABLED:
+        detector.enable_prescreen(margin=settings.PRESCREEN_MARGIN)
+    if settings.DEEP_DIFF_TILING:
+        detector.enable_tiling(
+            tile_size=settings.DEEP_DIFF_TILE_SIZE,
+            overlap=settings.DEEP_DIFF_TILE_OVERLAP,
+            batch_size=settings.DEEP_DIFF_TILE_BATCH,
+            max_tiles=settings.DEEP_DIFF_MAX_TILES,
+        )
+    return detector
+
+
+def get_detector(profile=None):
+    """Return the shared detector for `profile` (default: DETECTION_PROFILE), loading it on first use."""
+    if profile is None:
+        from django.conf import settings
+        profile = settings.DETECTION_PROFILE
+    detector = _detectors.get(profile)
+    if detector is None:
+        with _lock:
+            detector = _detectors.get(profile)
+            if detector is None:
+                detector = _detectors[profile] = _build_detector(profile)
+                MODEL_LOADED.labels(profile).set(1)
+                logger.info("StructuralChangeDetector loaded for the %s profile.", profile)
+    return detector
+
+
+def is_loaded(profile=None):
+    if profile is None:
+        from django.conf import settings
+        profile = settings.DETECTION_PROFILE
+    return profile in _detectors
+
+
+def preload():
+    """Load the default detector now; failures are logged and retried on first use."""
+    try:
+        get_detector()
+    except Exception as exc:  # pragma: no cover
+        logger.warning("Could not pre-load StructuralChangeDetector: %s", exc)
+
+
+def share_for_fork():
+    """Load the default detector in a parent process and prepare it to be inherited by forks."""
+    try:
+        detector = get_detector()
+    except Exception as exc:
+        # Children will try again lazily, each with its own copy.
+        logger.warning("Could not pre-load StructuralChangeDetector for sharing: %s", exc)
+        return None
+    for loaded in list(_detectors.values()):
+        # Shared (not copy-on-write) storage: in-place writes by one child
+        # cannot privatise the weight pages for everyone else.
+        loaded.feature_extractor.share_memory()
+    # A GC pass in a child writes to the header of every tracked object,
+    # copying each page it lands on; frozen objects are never scanned.
+    gc.collect()
+    gc.freeze()
+    logger.info("StructuralChangeDetector shared for forked workers (%d objects frozen).", gc.get_freeze_count())
+    return detector
+
+
+def after_fork():
+    """Restore per-process state in a forked child (threads do not survive fork)."""
+    for detector in list(_detectors.values()):
+        if detector.batcher is not None:
+            batcher = detector.batcher
+            detector.enable_batching(batcher.max_batch_size, batcher.max_wait * 1000.0)
+
+
+class LazyDetector:
+    """Stand-in that forwards attribute access to the detector, loading it on demand."""
+
+    def __getattr__(self, name):
+        return getattr(get_detector(), name)
+
+    def __repr__(self):
+        state = 'loaded' if is_loaded() else 'not loaded'
+        return f"<LazyDetector ({state})>"
+
+
+detector_instance = LazyDetector()
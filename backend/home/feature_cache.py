@@ -0,0 +1,144 @@
+"""
+On-disk store for normalized deep-feature maps.
+
+Each analysis encodes the *current* image with the ResNet trunk.  That same
+`FortImage` becomes the *previous* image of the next analysis for the fort,
+so keeping its layer2 map around lets the next call skip one forward pass.
+
+Entries are keyed by `FortImage` id plus a fingerprint of the model/config
+that produced them, stored as fp16 `.npy` files and memory-mapped on load.
+The store is bounded both by entry count and by total bytes and evicts the
+least recently used entries first.  The directory can be shared by several
+worker processes: writes are atomic (`os.replace`) and a file evicted by
+another process simply turns into a miss.
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .metrics import FEATURE_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureStore:
+    def __init__(self, root, max_entries=256, max_bytes=2 * 1024 ** 3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load_index()
+
+    @staticmethod
+    def make_key(image_id, fingerprint):
+        return f"{image_id}-{fingerprint}"
+
+    def _path(self, key):
+        return self.root / f"{key}.npy"
+
+    def _load_index(self):
+        # Rebuild LRU order from modification times (hits touch the file).
+        files = []
+        for path in self.root.glob('*.npy'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    def get(self, key):
+        """Return the cached float16 map (memory-mapped) or None on a miss."""
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            FEATURE_CACHE_LOOKUPS.labels('miss').inc()
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+        FEATURE_CACHE_LOOKUPS.labels('hit').inc()
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Written by another worker process sharing the directory.
+                size = path.stat().st_size
+                self._entries[key] = size
+                self._total_bytes += size
+                self._evict_locked()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return array
+
+    def put(self, key, array):
+        array = np.ascontiguousarray(array, dtype=np.float16)
+        path = self._path(key)
+        tmp_path = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Could not write feature cache entry %s: %s", key, exc)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        size = path.stat().st_size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
@@ -0,0 +1,86 @@
+"""
+Content hashes of uploaded fort images.
+
+`content_hash` is the SHA-256 of the file bytes: an identical re-upload
+(client retries over flaky mobile networks) is found by it and reuses the
+stored FortImage.  `perceptual_hash` is the 64-bit DCT hash of a 32x32
+grey thumbnail, as 16 hex digits; re-encoded or resized copies of a photo
+keep (nearly) the same value, see `hamming`.  Both are computed with
+hashlib/Pillow/numpy only, so web processes can hash uploads without the
+ML stack.
+
+An analysis is identified by what determines its result: the two images'
+content hashes plus `config_hash` of the detector configuration and the
+per-call inputs (see AnalysisMemo).
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+THUMB_SIZE = 32
+
+
+def _dct_matrix(n):
+    # Orthonormal DCT-II basis (cv2.dct / scipy dct(norm='ortho'))
+    k, i = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    basis = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+_DCT = _dct_matrix(THUMB_SIZE)
+
+
+def dct_hash(thumb):
+    """64 booleans: the 8x8 lowest DCT frequencies of a 32x32 grey thumbnail against their median."""
+    low = (_DCT @ np.asarray(thumb, dtype=np.float64) @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    return low > np.median(low)
+
+
+def to_hex(bits):
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def hamming(hex1, hex2):
+    return bin(int(hex1, 16) ^ int(hex2, 16)).count('1')
+
+
+def content_hash(file):
+    """SHA-256 hex digest of a Django File/FieldFile, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(file):
+    """DCT hash of an image file as 16 hex digits, '' when Pillow cannot decode it cheaply."""
+    from PIL import Image
+
+    # Orthomosaics are gigapixel TIFFs (see orthomosaic.py, which needs cv2)
+    if os.path.splitext(file.name)[1].lower() in ('.tif', '.tiff'):
+        return ''
+    try:
+        file.seek(0)
+        with Image.open(file) as img:
+            # JPEGs decode directly at 1/8 scale
+            img.draft('L', (THUMB_SIZE * 4, THUMB_SIZE * 4))
+            thumb = img.convert('L').resize((THUMB_SIZE, THUMB_SIZE), Image.BOX)
+        return to_hex(dct_hash(np.asarray(thumb)))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Could not compute a perceptual hash of %s: %s", file.name, e)
+        return ''
+    finally:
+        file.seek(0)
+
+
+def config_hash(config):
+    """SHA-256 of a JSON-serializable description of everything besides the images that shapes a result."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
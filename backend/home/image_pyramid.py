@@ -0,0 +1,125 @@
+"""
+Reduced-resolution decoding and per-image resolution pyramids.
+
+Uploads are phone/drone photos of 12-48 MP, but most detector stages work
+far below that: feature matching at 1000 px, the CNN at the profile's
+input size.  `decode_image` lets libjpeg do the first downscale inside
+the DCT (IMREAD_REDUCED_COLOR_2/4/8) when the analysis runs below native
+resolution, so the full-size bitmap is never materialised.
+`ImagePyramid` then derives each smaller resolution once, from the
+closest larger level, and hands the same array to every stage that asks
+for it.
+"""
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+JPEG_MAGIC = b'\xff\xd8'
+
+# libjpeg scales by 1/2, 1/4 and 1/8 while decoding (largest reduction first)
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def fit_size(width, height, max_side):
+    """(width, height) scaled down so the longer side is at most max_side."""
+    longest = max(width, height)
+    if not max_side or longest <= max_side:
+        return width, height
+    scale = max_side / longest
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def shrink(img, size):
+    """
+    Anti-aliased downscale to (width, height).  Exact 2x INTER_AREA steps
+    (OpenCV's fast integer path; an odd last row/column is dropped) while
+    the image is at least twice the target, then bilinear for the
+    remaining < 2x; a general-ratio INTER_AREA is ~10x slower.
+    """
+    height, width = img.shape[:2]
+    while width >= 2 * size[0] and height >= 2 * size[1]:
+        width, height = width // 2, height // 2
+        img = cv2.resize(img[:height * 2, :width * 2], (width, height), interpolation=cv2.INTER_AREA)
+    if (width, height) != tuple(size):
+        img = cv2.resize(img, tuple(size), interpolation=cv2.INTER_LINEAR)
+    return img
+
+
+def decode_image(data, max_side=None):
+    """
+    Decode encoded image bytes to BGR, at most `max_side` px on the longer
+    side.  JPEGs are decoded at the largest libjpeg reduction that still
+    covers `max_side` and then shrunk to it; other formats are decoded in
+    full and shrunk.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    flag = cv2.IMREAD_COLOR
+    if max_side and data[:2] == JPEG_MAGIC:
+        with Image.open(io.BytesIO(data)) as header:  # reads the header only
+            longest = max(header.size)
+        for factor, reduced in REDUCED_FLAGS:
+            if longest // factor >= max_side:
+                flag = reduced
+                break
+    img = cv2.imdecode(buf, flag)
+    if img is None or not max_side:
+        return img
+    height, width = img.shape[:2]
+    size = fit_size(width, height, max_side)
+    if size == (width, height):
+        return img
+    return shrink(img, size)
+
+
+class ImagePyramid:
+    """
+    An image plus the smaller resolutions derived from it, cached by size.
+
+    Levels are shrunk (see `shrink`) from the smallest cached level that is
+    at least as large in both dimensions, so asking for 1000 px and then
+    512 px resizes the full frame only once.  Levels are read-only
+    views shared between stages; copy before drawing on them.
+    """
+
+    def __init__(self, image):
+        self.base = image
+        self._levels = {}
+
+    @classmethod
+    def of(cls, image):
+        return image if isinstance(image, cls) else cls(image)
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    @property
+    def size(self):
+        return self.base.shape[1], self.base.shape[0]
+
+    def resized(self, size):
+        """The image at exactly (width, height)."""
+        size = tuple(int(v) for v in size)
+        if size == self.size:
+            return self.base
+        level = self._levels.get(size)
+        if level is None:
+            larger = [s for s in self._levels if s[0] >= size[0] and s[1] >= size[1]]
+            source = self._levels[min(larger, key=lambda s: s[0] * s[1])] if larger else self.base
+            if size[0] <= source.shape[1] and size[1] <= source.shape[0]:
+                level = shrink(source, size)
+            else:
+                level = cv2.resize(source, size, interpolation=cv2.INTER_LINEAR)
+            level.flags.writeable = False
+            self._levels[size] = level
+        return level
+
+    def fit(self, max_side):
+        """The image with its longer side at most max_side (the base if already smaller)."""
+        return self.resized(fit_size(*self.size, max_side))
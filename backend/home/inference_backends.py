@@ -0,0 +1,97 @@
+"""
+CPU execution backends for the conv1 -> layer2 feature trunk.
+
+  eager        the fp32 nn.Module as loaded (reference)
+  torchscript  traced and frozen with torch.jit: BatchNorm folded into the
+               convolutions, no Python dispatch per layer
+  int8         FX graph mode static quantization (per-channel weights,
+               activation ranges calibrated on stored FortImages by
+               `manage.py calibrate_int8_backbone`), saved as a frozen
+               TorchScript module so loading needs no calibration
+
+Backends produce numerically different feature maps, so the backend name
+is part of the detector's feature-cache fingerprint.
+"""
+import copy
+import json
+import logging
+import warnings
+from pathlib import Path
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('eager', 'torchscript', 'int8')
+INT8_FORMAT = 1
+
+
+def _example_input(input_size):
+    width, height = input_size
+    return torch.zeros(1, 3, height, width)
+
+
+def script_trunk(trunk, input_size):
+    """Trace and freeze a trunk (fp32 or quantized) for `input_size` (w, h) inputs."""
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)  # torch.jit deprecation notices
+        return torch.jit.freeze(torch.jit.trace(trunk.eval(), _example_input(input_size)))
+
+
+def quantize_int8(trunk, calibration_batches, input_size):
+    """
+    Static int8 quantization of an fp32 trunk.
+    `calibration_batches` yields preprocessed [N, 3, H, W] tensors.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = torch.backends.quantized.engine
+    with warnings.catch_warnings():
+        # torch.ao FX quantization emits deprecation notices pointing at torchao.
+        warnings.simplefilter('ignore')
+        prepared = prepare_fx(
+            copy.deepcopy(trunk).eval(),
+            get_default_qconfig_mapping(engine),
+            (_example_input(input_size),),
+        )
+        batches = 0
+        with torch.no_grad():
+            for batch in calibration_batches:
+                prepared(batch)
+                batches += 1
+        if not batches:
+            raise ValueError("int8 calibration needs at least one batch")
+        quantized = convert_fx(prepared)
+        return script_trunk(quantized, input_size)
+
+
+def save_int8(module, path, weights_name, calibration_images):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    metadata = {
+        'format': INT8_FORMAT,
+        'weights': weights_name,
+        'engine': torch.backends.quantized.engine,
+        'calibration_images': calibration_images,
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)  # torch.jit deprecation notice
+        torch.jit.save(module, str(path), _extra_files={'metadata.json': json.dumps(metadata)})
+
+
+def load_int8(path):
+    """Returns (module, metadata) for a module written by `save_int8`."""
+    extra_files = {'metadata.json': ''}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)  # torch.jit deprecation notice
+        module = torch.jit.load(str(path), map_location='cpu', _extra_files=extra_files)
+    metadata = json.loads(extra_files['metadata.json'] or '{}')
+    if metadata.get('format') != INT8_FORMAT:
+        raise ValueError(f"Unsupported int8 backbone {path}")
+    if metadata['engine'] != torch.backends.quantized.engine:
+        logger.warning(
+            "int8 backbone %s was quantized for the %s engine, running on %s.",
+            path, metadata['engine'], torch.backends.quantized.engine,
+        )
+    return module.eval(), metadata
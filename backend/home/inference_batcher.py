@@ -0,0 +1,102 @@
+"""
+Micro-batching scheduler for the CNN trunk.
+
+Concurrent analyses (threaded workers) would otherwise each run their own
+batch-size-1 forward pass.  `MicroBatcher` collects the tensors submitted
+within a short window, runs them through the model as one batch on a
+single background thread and hands each caller back its slice.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        # Request that would have overflowed the last batch; it starts the next one
+        self._carry = None
+        self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+        self.batches = 0
+        self.items = 0  # images (not requests) run through the model
+
+    def submit(self, inputs):
+        """Queue an [N, C, H, W] tensor; returns a Future of the model output."""
+        future = Future()
+        self._queue.put((inputs, future))
+        return future
+
+    def infer(self, inputs):
+        return self.submit(inputs).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        size = first[0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # re-deliver the shutdown sentinel
+                break
+            if size + item[0].shape[0] > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += item[0].shape[0]
+        return batch
+
+    def _run(self):
+        while True:
+            first, self._carry = self._carry, None
+            if first is None:
+                first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+
+            # Only tensors with identical C/H/W can share a forward pass.
+            groups = {}
+            for inputs, future in batch:
+                groups.setdefault(tuple(inputs.shape[1:]), []).append((inputs, future))
+
+            for items in groups.values():
+                items = [(t, f) for t, f in items if f.set_running_or_notify_cancel()]
+                if not items:
+                    continue
+                try:
+                    with torch.no_grad():
+                        outputs = self.model(torch.cat([t for t, _ in items]))
+                except Exception as exc:
+                    logger.error("Batched inference failed: %s", exc)
+                    for _, future in items:
+                        future.set_exception(exc)
+                    continue
+
+                self.batches += 1
+                self.items += sum(t.shape[0] for t, _ in items)
+                start = 0
+                for inputs, future in items:
+                    end = start + inputs.shape[0]
+                    future.set_result(outputs[start:end])
+                    start = end
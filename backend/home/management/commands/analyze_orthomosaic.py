@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from home.analysis_jobs import enqueue_analysis, run_structural_analysis
+from home.detection_profiles import PROFILES, resolve_profile
+from home.detector_singleton import get_detector
+from home.models import Fort, FortImage
+from home.orthomosaic import MosaicReader, is_orthomosaic, pixel_offset
+
+
+class Command(BaseCommand):
+    help = (
+        "Register two GeoTIFF orthomosaics of a fort and compare them tile by tile. "
+        "Multi-gigapixel mosaics are too large for the upload endpoint; the files are "
+        "copied into media storage in chunks and streamed from there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fort_id', type=int)
+        parser.add_argument('previous', help='Earlier orthomosaic (.tif/.tiff).')
+        parser.add_argument('current', help='Newer orthomosaic (.tif/.tiff).')
+        parser.add_argument('--profile', choices=list(PROFILES), help='Detection profile (default: the fort\'s).')
+        parser.add_argument(
+            '--queue', action='store_true',
+            help='Enqueue the analysis for run_analysis_worker instead of running it here.',
+        )
+
+    def register(self, fort, path):
+        with open(path, 'rb') as f:
+            return FortImage.objects.create(
+                fort=fort,
+                image=File(f, name=os.path.basename(path)),
+                description=f"Orthomosaic registered on {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            )
+
+    def handle(self, *args, **options):
+        try:
+            fort = Fort.objects.get(id=options['fort_id'])
+        except Fort.DoesNotExist:
+            raise CommandError(f"Fort {options['fort_id']} does not exist.")
+        for key in ('previous', 'current'):
+            if not is_orthomosaic(options[key]) or not os.path.isfile(options[key]):
+                raise CommandError(f"{options[key]} is not a .tif/.tiff file.")
+        # Fail before copying gigabytes when the mosaics cannot be co-registered.
+        with MosaicReader(options['previous']) as previous, MosaicReader(options['current']) as current:
+            try:
+                pixel_offset(previous, current)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        previous_image = self.register(fort, options['previous'])
+        current_image = self.register(fort, options['current'])
+        parameters = {'profile': resolve_profile(options['profile'], fort)}
+
+        if options['queue']:
+            job = enqueue_analysis(fort, previous_image, current_image, parameters=parameters)
+            self.stdout.write(self.style.SUCCESS(f"Queued analysis job {job.id}"))
+            return
+
+        analysis = run_structural_analysis(
+            get_detector(parameters['profile']), fort, previous_image, current_image, parameters=parameters,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Analysis {analysis.id}: {analysis.risk_level} risk, {analysis.changes_detected} changes "
+            f"over {analysis.analysis_results['deep_diff']['tiles']} tile pairs"
+        ))
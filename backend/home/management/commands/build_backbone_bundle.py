@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from home.backbones import bundle_filename, load_bundle, save_bundle, trunk_from_torchvision
+from home.detection_profiles import PROFILES
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the ImageNet weights of each detection profile's backbone once and save "
+        "only the stride-8 trunk used by StructuralChangeDetector, so detector startup is offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', nargs='+', choices=list(PROFILES), default=list(PROFILES),
+            help='Profiles to build bundles for (default: all).',
+        )
+        parser.add_argument(
+            '--output-dir', default=settings.BACKBONE_WEIGHTS_DIR,
+            help='Bundle directory (default: BACKBONE_WEIGHTS_DIR).',
+        )
+
+    def handle(self, *args, **options):
+        import torchvision.models as models
+
+        for name in options['profile']:
+            profile = PROFILES[name]
+            weights = models.get_weight(profile.weights)
+            path = os.path.join(options['output_dir'], bundle_filename(profile.backbone))
+            trunk = trunk_from_torchvision(weights, arch=profile.backbone)
+            save_bundle(trunk, path, str(weights), arch=profile.backbone)
+
+            # Round-trip to make sure the bundle loads into the truncated trunk.
+            load_bundle(path)
+            self.stdout.write(self.style.SUCCESS(f"Saved {weights} trunk ({name} profile) to {path}"))
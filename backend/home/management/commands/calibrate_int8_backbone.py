@@ -0,0 +1,80 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from home.backbones import bundle_filename
+from home.detection_profiles import PROFILES
+from home.inference_backends import load_int8, quantize_int8, save_int8
+from home.models import Fort, FortImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Quantize the feature trunk to int8, calibrating activation ranges on stored "
+        "FortImages, and save it for INFERENCE_BACKEND=int8."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images', type=int, default=32,
+            help='Calibration images, spread evenly over the forts (newest first).',
+        )
+        parser.add_argument('--batch-size', type=int, default=2)
+        parser.add_argument(
+            '--profile', choices=list(PROFILES), default=settings.DETECTION_PROFILE,
+            help='Detection profile whose trunk is quantized (default: DETECTION_PROFILE).',
+        )
+        parser.add_argument(
+            '--output',
+            help='Module path (default: the profile\'s *_int8.pt file in BACKBONE_WEIGHTS_DIR).',
+        )
+
+    def calibration_images(self, limit):
+        forts = list(Fort.objects.values_list('id', flat=True))
+        if not forts:
+            return []
+        per_fort = max(1, -(-limit // len(forts)))
+        images = []
+        for fort_id in forts:
+            images.extend(FortImage.objects.filter(fort_id=fort_id).order_by('-uploaded_at')[:per_fort])
+        return images[:limit]
+
+    def handle(self, *args, **options):
+        from home.structural_detector import StructuralChangeDetector
+
+        fort_images = self.calibration_images(options['images'])
+        if not fort_images:
+            raise CommandError("No FortImages to calibrate on; upload fort images first.")
+
+        arch = PROFILES[options['profile']].backbone
+        output = options['output'] or os.path.join(settings.BACKBONE_WEIGHTS_DIR, bundle_filename(arch, '_int8'))
+        detector = StructuralChangeDetector(
+            weights_path=os.path.join(settings.BACKBONE_WEIGHTS_DIR, bundle_filename(arch)),
+            backend='eager',
+            profile=options['profile'],
+        )
+        batch_size = max(1, options['batch_size'])
+
+        def batches():
+            for start in range(0, len(fort_images), batch_size):
+                imgs = []
+                for fort_image in fort_images[start:start + batch_size]:
+                    # Same decode as the analyses the module will serve
+                    img = detector.load_image_from_file(fort_image.image, settings.ANALYSIS_MAX_SIDE or None)
+                    if img is None:
+                        self.stderr.write(f"Skipping unreadable image {fort_image.image.name}")
+                        continue
+                    imgs.append(img)
+                if imgs:
+                    self.stdout.write(f"Calibrating on images {start + 1}-{start + len(imgs)}...")
+                    yield detector.preprocess_images(imgs)
+
+        module = quantize_int8(detector.feature_extractor, batches(), detector.input_size)
+        save_int8(module, output, detector.backbone_weights, len(fort_images))
+
+        # Round-trip to make sure the module loads for the detector.
+        load_int8(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved int8 {options['profile']} trunk calibrated on {len(fort_images)} images to {output}"
+        ))
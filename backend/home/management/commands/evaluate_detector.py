@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from home import timings
+from home.detection_profiles import PROFILES
+from home.detector_singleton import after_fork, get_detector
+
+LABELS = {'changed': True, 'unchanged': False}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+RISK_LEVELS = ['SAFE', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+
+def find_pairs(root):
+    """(name, changed, past path, current path) for every <root>/{changed,unchanged}/<pair>/ directory."""
+    pairs = []
+    for label, changed in LABELS.items():
+        label_dir = Path(root) / label
+        if not label_dir.is_dir():
+            continue
+        for pair_dir in sorted(p for p in label_dir.iterdir() if p.is_dir()):
+            images = {p.stem.lower(): p for p in pair_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS}
+            if 'past' not in images or 'current' not in images:
+                raise CommandError(f"{pair_dir} needs a past.* and a current.* image.")
+            pairs.append((f'{label}/{pair_dir.name}', changed, str(images['past']), str(images['current'])))
+    return pairs
+
+
+def _init_worker(threads):
+    connections.close_all()
+    after_fork()
+    import torch
+    torch.set_num_threads(threads)
+
+
+def evaluate_pair(task):
+    """Detect changes in one labeled pair at every k_factor; runs in a pool worker."""
+    name, changed, past_path, current_path, profile, k_factors, max_side, scaled_threshold = task
+    detector = get_detector(profile)
+    with open(past_path, 'rb') as past, open(current_path, 'rb') as current:
+        past_img = detector.load_image_from_file(past, max_side)
+        current_img = detector.load_image_from_file(current, max_side)
+
+    runs = []
+    for k in k_factors:
+        params = replace(detector.default_params, k_factor=k, scaled_threshold=scaled_threshold)
+        with timings.recording() as rec:
+            results = detector.detect_structural_changes(past_img, current_img, params=params)
+        runs.append({
+            'k_factor': k,
+            'risk_level': results['risk_assessment']['level'],
+            'changes': results['total_changes'],
+            'latency_ms': rec.timings()['total'],
+            'stages_ms': rec.timings(),
+        })
+    return {'name': name, 'changed': changed, 'runs': runs}
+
+
+def confusion(pairs, k_index, min_risk):
+    counts = {'tp': 0, 'tn': 0, 'fp': 0, 'fn': 0}
+    threshold = RISK_LEVELS.index(min_risk)
+    for pair in pairs:
+        predicted = RISK_LEVELS.index(pair['runs'][k_index]['risk_level']) >= threshold
+        counts[('t' if predicted == pair['changed'] else 'f') + ('p' if predicted else 'n')] += 1
+    tp, tn, fp, fn = counts['tp'], counts['tn'], counts['fp'], counts['fn']
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'confusion': counts,
+        'accuracy': (tp + tn) / len(pairs),
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluate the detector on a labeled directory of image pairs: confusion matrix and "
+        "precision/recall at several k_factor values, per-pair latency and throughput. "
+        "Pairs live in <pairs_dir>/changed/<name>/ and <pairs_dir>/unchanged/<name>/, each "
+        "holding a past.* and a current.* image. The JSON report feeds generate_results_graph.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pairs_dir')
+        parser.add_argument('--profile', choices=list(PROFILES), help='Detection profile (default: DETECTION_PROFILE).')
+        parser.add_argument('--k-factors', type=float, nargs='+', default=[0.0, 0.5, 1.0, 1.5, 2.5],
+                            help='Adaptive threshold k_factor values to evaluate.')
+        parser.add_argument('--min-risk', choices=RISK_LEVELS[1:], default='LOW',
+                            help='Lowest risk level counted as a detected change (default: LOW, i.e. not SAFE).')
+        parser.add_argument('--scaled-threshold', action=argparse.BooleanOptionalAction, default=None,
+                            help='Adaptive threshold statistics on the 0-1 scale (default: ADAPTIVE_THRESHOLD_SCALED).')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per CPU).')
+        parser.add_argument('--output', default='evaluation.json', help='JSON report path.')
+
+    def handle(self, *args, **options):
+        pairs = find_pairs(options['pairs_dir'])
+        if not pairs:
+            raise CommandError(f"No pairs under {options['pairs_dir']}/changed or /unchanged.")
+        profile = options['profile'] or settings.DETECTION_PROFILE
+        k_factors = options['k_factors']
+        scaled_threshold = options['scaled_threshold']
+        if scaled_threshold is None:
+            scaled_threshold = settings.ADAPTIVE_THRESHOLD_SCALED
+        processes = max(1, min(options['processes'], len(pairs)))
+        tasks = [(*pair, profile, k_factors, settings.ANALYSIS_MAX_SIDE or None, scaled_threshold)
+                 for pair in pairs]
+
+        # Load the model once; forked workers inherit it instead of each building a copy.
+        get_detector(profile)
+        start = time.perf_counter()
+        if processes == 1:
+            evaluated = [evaluate_pair(task) for task in tasks]
+        else:
+            connections.close_all()
+            threads = max(1, (os.cpu_count() or 1) // processes)
+            with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_worker, initargs=(threads,)) as pool:
+                evaluated = list(pool.map(evaluate_pair, tasks))
+        wall_seconds = time.perf_counter() - start
+
+        latencies = [run['latency_ms'] for pair in evaluated for run in pair['runs']]
+        stages = {}
+        for pair in evaluated:
+            for run in pair['runs']:
+                for stage, ms in run.pop('stages_ms').items():
+                    stages.setdefault(stage, []).append(ms)
+        report = {
+            'dataset': os.path.abspath(options['pairs_dir']),
+            'profile': profile,
+            'min_risk': options['min_risk'],
+            'scaled_threshold': scaled_threshold,
+            'processes': processes,
+            'pairs': len(evaluated),
+            'changed_pairs': sum(pair['changed'] for pair in evaluated),
+            'k_factors': [
+                {'k_factor': k, **confusion(evaluated, i, options['min_risk'])} for i, k in enumerate(k_factors)
+            ],
+            'latency_ms': {
+                'mean': statistics.mean(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'max': max(latencies),
+            },
+            'stages_ms': {stage: statistics.mean(ms) for stage, ms in sorted(stages.items())},
+            'wall_seconds': wall_seconds,
+            'analyses_per_second': len(latencies) / wall_seconds,
+            'results': evaluated,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for row in report['k_factors']:
+            c = row['confusion']
+            self.stdout.write(
+                f"k={row['k_factor']:<4} TP {c['tp']:3d} TN {c['tn']:3d} FP {c['fp']:3d} FN {c['fn']:3d} | "
+                f"precision {row['precision']:.3f} recall {row['recall']:.3f} f1 {row['f1']:.3f} "
+                f"accuracy {row['accuracy']:.3f}"
+            )
+        latency = report['latency_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(evaluated)} pairs x {len(k_factors)} k_factors on {processes} processes in {wall_seconds:.1f} s: "
+            f"{report['analyses_per_second']:.2f} analyses/s, latency p50 {latency['p50']:.0f} ms "
+            f"p95 {latency['p95']:.0f} ms. Report written to {options['output']}"
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from home.models import Fort
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute content and perceptual hashes of fort images uploaded before hashing "
+        "(analyses hash missing images themselves; this backfills existing uploads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fort', type=int, nargs='+', help='Fort ids (default: all forts).')
+        parser.add_argument('--force', action='store_true', help='Hash images again even if already hashed.')
+
+    def handle(self, *args, **options):
+        forts = Fort.objects.all()
+        if options['fort']:
+            forts = forts.filter(id__in=options['fort'])
+
+        for fort in forts:
+            hashed = failed = 0
+            images = fort.images.all() if options['force'] else fort.images.filter(content_hash='')
+            for fort_image in images.order_by('uploaded_at', 'id'):
+                if options['force']:
+                    fort_image.content_hash = ''
+                try:
+                    fort_image.compute_hashes()
+                except OSError as e:
+                    self.stderr.write(f"Image {fort_image.id}: {e}")
+                    failed += 1
+                    continue
+                fort_image.save(update_fields=['content_hash', 'perceptual_hash'])
+                hashed += 1
+            with_hash = fort.images.exclude(content_hash='')
+            duplicates = with_hash.count() - with_hash.values('content_hash').distinct().count()
+            self.stdout.write(f"{fort.name}: {hashed} hashed, {failed} unreadable, {duplicates} byte-identical duplicates")
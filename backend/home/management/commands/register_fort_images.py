@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from home.detector_singleton import get_detector
+from home.models import Fort
+from home.registration import register_image
+
+
+class Command(BaseCommand):
+    help = (
+        "Register fort images to their fort's reference image ahead of analyses "
+        "(analyses register missing images themselves; this backfills existing uploads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fort', type=int, nargs='+', help='Fort ids (default: all forts).')
+        parser.add_argument('--force', action='store_true', help='Match images again even if already registered.')
+
+    def handle(self, *args, **options):
+        detector = get_detector()
+        forts = Fort.objects.all()
+        if options['fort']:
+            forts = forts.filter(id__in=options['fort'])
+
+        for fort in forts:
+            registered = failed = 0
+            for fort_image in fort.images.order_by('uploaded_at', 'id'):
+                if not register_image(detector, fort_image, force=options['force']):
+                    continue
+                if fort_image.reference_homography is None:
+                    failed += 1
+                else:
+                    registered += 1
+            reference = fort.reference_image
+            self.stdout.write(
+                f"{fort.name}: {registered} registered, {failed} could not be registered"
+                + (f" (reference image {reference.id})" if reference else "")
+            )
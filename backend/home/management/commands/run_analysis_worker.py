@@ -0,0 +1,80 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from home.analysis_jobs import run_worker_threads
+from home.detector_singleton import after_fork, share_for_fork
+from home.metrics import mark_process_dead
+
+
+def _worker_main(threads, poll_interval, stop_event):
+    # Forked children must not share the parent's database connections.
+    connections.close_all()
+    after_fork()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker_threads(threads, poll_interval=poll_interval, stop_event=stop_event)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of structural analysis workers polling the database job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.ANALYSIS_WORKER_PROCESSES,
+            help='Number of worker processes (default: ANALYSIS_WORKER_PROCESSES).',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=settings.ANALYSIS_WORKER_THREADS,
+            help='Concurrent jobs per process, sharing one loaded model (default: ANALYSIS_WORKER_THREADS).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.ANALYSIS_JOB_POLL_INTERVAL,
+            help='Seconds to wait between polls when the queue is empty.',
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        threads = max(1, options['threads'])
+        poll_interval = options['poll_interval']
+
+        ctx = multiprocessing.get_context('fork')
+        stop_event = ctx.Event()
+
+        def request_stop(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        if processes == 1:
+            run_worker_threads(threads, poll_interval=poll_interval, stop_event=stop_event)
+            return
+
+        # Load the model once here; the forked workers (and their restarts)
+        # inherit its pages instead of each building a private copy.
+        share_for_fork()
+        connections.close_all()
+
+        def spawn():
+            proc = ctx.Process(target=_worker_main, args=(threads, poll_interval, stop_event), daemon=True)
+            proc.start()
+            return proc
+
+        workers = [spawn() for _ in range(processes)]
+        self.stdout.write(f"Started {processes} analysis worker processes.")
+
+        # Supervise: restart workers that crash until asked to stop.
+        while not stop_event.is_set():
+            for i, proc in enumerate(workers):
+                proc.join(timeout=poll_interval / processes)
+                if not proc.is_alive() and not stop_event.is_set():
+                    self.stderr.write(f"Worker pid {proc.pid} exited with {proc.exitcode}; restarting.")
+                    mark_process_dead(proc.pid)
+                    workers[i] = spawn()
+
+        for proc in workers:
+            proc.join(timeout=settings.ANALYSIS_JOB_TIMEOUT)
+            mark_process_dead(proc.pid)
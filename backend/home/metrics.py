@@ -0,0 +1,147 @@
+"""
+Prometheus metrics, served in the text format at /metrics to scrapers
+sending METRICS_TOKEN as a bearer token (404 while no token is set).
+
+Gunicorn workers and the analysis worker processes each count their own
+requests and analyses.  With PROMETHEUS_MULTIPROC_DIR set in the
+environment (start.sh sets it and empties it on start), prometheus_client
+keeps every process's samples in memory-mapped files in that directory
+and /metrics merges them, whichever worker serves the scrape.  Gauges of
+processes that have exited are dropped by `mark_process_dead`, called by
+gunicorn's child_exit hook and the analysis worker supervisor.  Without
+the directory /metrics reports the serving process only.
+
+The variable must be set before prometheus_client is imported; settings.py
+loads .env first, so it can live there too.
+
+Nothing here imports the ML stack, so web processes can record and serve
+metrics without loading the model.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Stages run from a few milliseconds (clustering) to minutes (orthomosaics)
+STAGE_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+REQUEST_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+ANALYSIS_STAGE_SECONDS = Histogram(
+    'durgsetu_analysis_stage_seconds', 'Time spent in each stage of an analysis (stage="total" for all of it).',
+    ['stage'], buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'durgsetu_request_seconds', 'Request latency by view and viewset action.',
+    ['view', 'action', 'method', 'status'], buckets=REQUEST_BUCKETS,
+)
+ANALYSES = Counter('durgsetu_analyses', 'Completed analyses by risk level.', ['risk_level'])
+ANALYSIS_MEMO_LOOKUPS = Counter('durgsetu_analysis_memo_lookups', 'Analysis memo lookups.', ['result'])
+FEATURE_CACHE_LOOKUPS = Counter('durgsetu_feature_cache_lookups', 'CNN feature cache lookups.', ['result'])
+REPORT_JOBS = Counter(
+    'durgsetu_report_jobs', 'Report emails and PDF attachments by outcome.', ['job', 'outcome'],
+)
+ANALYSES_IN_PROGRESS = Gauge(
+    'durgsetu_analyses_in_progress', 'Analyses currently running.', multiprocess_mode='livesum',
+)
+MODEL_LOADED = Gauge(
+    'durgsetu_model_loaded', 'Whether a live process has the detector for a profile loaded.', ['profile'],
+    multiprocess_mode='livemax',
+)
+
+
+def observe_stages(timings):
+    """Add an analysis's `analysis_results['timings']` (milliseconds) to the stage histograms."""
+    for stage, ms in timings.items():
+        ANALYSIS_STAGE_SECONDS.labels(stage).observe(ms / 1000)
+
+
+class JobQueueCollector:
+    """Analysis jobs by status, read from the queue table at scrape time."""
+
+    def _family(self):
+        return GaugeMetricFamily('durgsetu_analysis_jobs', 'Analysis jobs in the queue by status.',
+                                 labels=['status'])
+
+    def describe(self):
+        # Registration would otherwise call collect(), querying the database at import
+        yield self._family()
+
+    def collect(self):
+        from django.db.models import Count
+        from .models import AnalysisJob
+
+        family = self._family()
+        counts = dict(AnalysisJob.objects.values_list('status').annotate(n=Count('id')).order_by())
+        for status, _ in AnalysisJob.STATUS_CHOICES:
+            family.add_metric([status], counts.get(status, 0))
+        yield family
+
+
+def multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or None
+
+
+def metrics_registry(path=None):
+    """Registry to scrape: every process's samples under `path` (or PROMETHEUS_MULTIPROC_DIR), else this process's."""
+    path = path or multiprocess_dir()
+    if path is None:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    registry.register(JobQueueCollector())
+    return registry
+
+
+if multiprocess_dir() is None:
+    REGISTRY.register(JobQueueCollector())
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of an exited process (no-op outside multiprocess mode)."""
+    path = multiprocess_dir()
+    if path is not None:
+        multiprocess.mark_process_dead(pid, path)
+
+
+def metrics_view(request):
+    # Job counts and traffic are not public: without a token there is nothing to scrape.
+    token = settings.METRICS_TOKEN
+    if not settings.METRICS_ENABLED or not token:
+        return HttpResponseNotFound()
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def _view_labels(view_func, method):
+    # DRF viewsets map HTTP methods to actions; other views are labelled by method.
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', type(view_func).__name__), method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return cls.__name__, actions.get(method.lower(), method.lower())
+
+
+class MetricsMiddleware:
+    """Time each request into durgsetu_request_seconds, labelled by the view that handled it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        view, action = getattr(request, '_metrics_view', ('unmatched', ''))
+        if view != 'metrics_view':
+            REQUEST_SECONDS.labels(view, action, request.method, f'{response.status_code // 100}xx').observe(
+                time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = _view_labels(view_func, request.method)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0011_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fort',
+            name='detection_profile',
+            field=models.CharField(blank=True, choices=[('fast', 'Fast'), ('balanced', 'Balanced'), ('accurate', 'Accurate')], default='', max_length=20),
+        ),
+    ]
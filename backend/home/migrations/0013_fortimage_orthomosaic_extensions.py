@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:59
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_fort_detection_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fortimage',
+            name='image',
+            field=models.ImageField(upload_to='fort_images/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'tif', 'tiff'])]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_fortimage_orthomosaic_extensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fortimage',
+            name='alignment_features',
+            field=models.FileField(blank=True, null=True, upload_to='alignment_features/'),
+        ),
+        migrations.AddField(
+            model_name='fortimage',
+            name='reference_homography',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fortimage',
+            name='registered_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='registered_images', to='home.fortimage'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0014_fortimage_registration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisMemo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_hash', models.CharField(max_length=64)),
+                ('current_hash', models.CharField(max_length=64)),
+                ('config_hash', models.CharField(max_length=64)),
+                ('results', models.JSONField()),
+                ('annotated_image', models.ImageField(blank=True, null=True, upload_to='analysis_results/')),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fortimage',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fortimage',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='fortimage',
+            index=models.Index(fields=['fort', 'content_hash'], name='home_fortim_fort_id_739ead_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='analysismemo',
+            constraint=models.UniqueConstraint(fields=('previous_hash', 'current_hash', 'config_hash'), name='unique_analysis_memo_key'),
+        ),
+    ]
@@ -6,6 +6,8 @@ import os
 import uuid
 from datetime import timedelta
 
+from .detection_profiles import PROFILE_CHOICES
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_profile')
     phone_number = models.CharField(max_length=20, blank=True, null=True)
@@ -39,6 +41,8 @@ class Fort(models.Model):
     description = models.TextField(blank=True, null=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Speed/accuracy profile for this fort's analyses; blank uses DETECTION_PROFILE
+    detection_profile = models.CharField(max_length=20, choices=PROFILE_CHOICES, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -52,6 +56,11 @@ class Fort(models.Model):
     def latest_image(self):
         return self.images.order_by('-uploaded_at').first()
     
+    @property
+    def reference_image(self):
+        # Oldest flagged image, so concurrent promotions settle on one frame
+        return self.images.filter(is_reference=True).order_by('uploaded_at', 'id').first()
+
     @property
     def analysis_count(self):
         return self.analyses.count()
@@ -61,18 +70,46 @@ class FortImage(models.Model):
     fort = models.ForeignKey(Fort, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(
         upload_to='fort_images/',
-        validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png'])]
+        # .tif/.tiff: whole-fort orthomosaics, analysed by streaming (see orthomosaic.py)
+        validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'tif', 'tiff'])]
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
     is_reference = models.BooleanField(default=False)
+
+    # Registration to the fort's reference image (see registration.py): the
+    # homography maps this image onto the reference in 0-1 image coordinates
+    # and is None when registration was attempted and failed.
+    registered_to = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='registered_images'
+    )
+    reference_homography = models.JSONField(null=True, blank=True)
+    alignment_features = models.FileField(upload_to='alignment_features/', null=True, blank=True)
+
+    # SHA-256 of the file and 64-bit DCT perceptual hash (16 hex digits, blank
+    # for orthomosaics), see image_hashes.py; set when the image is first saved.
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    perceptual_hash = models.CharField(max_length=16, blank=True, default='', db_index=True)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [models.Index(fields=['fort', 'content_hash'])]
     
     def __str__(self):
         return f"{self.fort.name} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
 
+    def compute_hashes(self):
+        from .image_hashes import content_hash, perceptual_hash
+
+        if not self.content_hash:
+            self.content_hash = content_hash(self.image)
+        self.perceptual_hash = perceptual_hash(self.image)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.image:
+            self.compute_hashes()
+        super().save(*args, **kwargs)
+
 
 class StructuralAnalysis(models.Model):
     RISK_LEVELS = [
@@ -141,6 +178,80 @@ class StructuralAnalysis(models.Model):
         return self.risk_assessment.get('recommendations', [])
 
 
+class AnalysisMemo(models.Model):
+    """
+    Result of an analysis keyed by what determines it: the content hashes of
+    the two images and a hash of the detector configuration and per-call
+    inputs (see analysis_jobs.analysis_config).  A repeated analysis is
+    served from here instead of running the detector again.
+    """
+    previous_hash = models.CharField(max_length=64)
+    current_hash = models.CharField(max_length=64)
+    config_hash = models.CharField(max_length=64)
+    results = models.JSONField()
+    # Shares the file of the analysis that produced the memo
+    annotated_image = models.ImageField(upload_to='analysis_results/', null=True, blank=True)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['previous_hash', 'current_hash', 'config_hash'], name='unique_analysis_memo_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.previous_hash[:8]} -> {self.current_hash[:8]} ({self.config_hash[:8]})"
+
+
+class AnalysisJob(models.Model):
+    """
+    Queued structural analysis.  The database is the broker: the analyze
+    endpoint inserts a row and `manage.py run_analysis_worker` processes
+    claim rows with an atomic status update.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    fort = models.ForeignKey(Fort, on_delete=models.CASCADE, related_name='analysis_jobs')
+    previous_image = models.ForeignKey(FortImage, on_delete=models.CASCADE, related_name='+')
+    current_image = models.ForeignKey(FortImage, on_delete=models.CASCADE, related_name='+')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Request inputs forwarded to the detector (temperature, humidity, wind_speed, profile)
+    parameters = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    analysis = models.ForeignKey(
+        StructuralAnalysis, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs'
+    )
+    error = models.TextField(blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while the job runs; a stale heartbeat means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.fort.name} - job {self.id} ({self.status})"
+
+
 # ─────────────────────────────────────────────
 # User Damage Report (Public Submission)
 # ─────────────────────────────────────────────
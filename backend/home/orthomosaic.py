@@ -0,0 +1,338 @@
+"""
+Streaming structural analysis for (Geo)TIFF orthomosaics.
+
+A drone orthomosaic of a whole fort can be several gigapixels, far too
+large for `load_image_from_file` (read + cv2.imdecode of the full
+frame).  Here the TIFFs are memory-mapped and only the strips/tiles
+under the region being analysed are decoded: `iter_tile_pairs` yields
+co-registered tile pairs one at a time, each pair goes through the normal
+`detect_structural_changes`, and the detections are shifted into mosaic
+coordinates and merged.  Peak memory depends on the tile size, not on
+the mosaic size.
+
+The two mosaics are aligned through their GeoTIFF georeferencing
+(ModelTiepoint + ModelPixelScale); without it they must have the same
+pixel grid.  The per-tile homography in the detector absorbs any residual
+misregistration.
+"""
+import logging
+import mmap
+import os
+
+import cv2
+import numpy as np
+import tifffile
+
+logger = logging.getLogger(__name__)
+
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+# GeoTIFF tags
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+
+
+def is_orthomosaic(name):
+    return os.path.splitext(str(name))[1].lower() in TIFF_EXTENSIONS
+
+
+class MosaicReader:
+    """
+    Random access to regions of a large TIFF as BGR uint8.
+
+    Uncompressed contiguous images are exposed as a read-only numpy memmap;
+    otherwise the file is mmap'ed and only the segments (tiles or strips)
+    intersecting a requested region are decoded.  Either way the page cache,
+    not the process heap, holds the mosaic.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.tif = tifffile.TiffFile(self.path)
+        page = self.tif.pages[0]
+        self.page = page
+        self.height, self.width = page.imagelength, page.imagewidth
+        self.samples = page.samplesperpixel
+        if page.dtype not in (np.uint8, np.uint16):
+            raise ValueError(f"{self.path}: unsupported sample type {page.dtype}")
+
+        self._array = None
+        self._mm = None
+        if page.is_memmappable and page.planarconfig == 1:
+            self._array = tifffile.memmap(self.path, page=0, mode='r')
+        else:
+            self._file = open(self.path, 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if page.is_tiled:
+                self.segment_shape = (page.tilelength, page.tilewidth)
+            else:
+                self.segment_shape = (min(page.rowsperstrip, self.height), self.width)
+            self._grid = (-(-self.height // self.segment_shape[0]), -(-self.width // self.segment_shape[1]))
+            self._planes = self.samples if page.planarconfig == 2 else 1
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._array = None
+        self.tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def geotransform(self):
+        """(origin_x, origin_y, pixel_size_x, pixel_size_y) or None without georeferencing."""
+        tags = self.page.tags
+        if MODEL_PIXEL_SCALE not in tags or MODEL_TIEPOINT not in tags:
+            return None
+        scale_x, scale_y = tags[MODEL_PIXEL_SCALE].value[:2]
+        i, j, _, x, y = tags[MODEL_TIEPOINT].value[:5]
+        return (x - i * scale_x, y + j * scale_y, scale_x, scale_y)
+
+    def read_region(self, y, x, height, width):
+        """
+        Pixels [y, y+height) x [x, x+width) as BGR uint8; parts outside the
+        mosaic (and fully transparent pixels) are black.
+        """
+        out = np.zeros((height, width, self.samples), dtype=self.page.dtype)
+        y0, y1 = max(y, 0), min(y + height, self.height)
+        x0, x1 = max(x, 0), min(x + width, self.width)
+        if y0 < y1 and x0 < x1:
+            dst = out[y0 - y:y1 - y, x0 - x:x1 - x]
+            if self._array is not None:
+                src = self._array[y0:y1, x0:x1]
+                dst[:] = src.reshape(dst.shape)
+            else:
+                self._read_segments(dst, y0, y1, x0, x1)
+        return self._to_bgr(out)
+
+    def _read_segments(self, dst, y0, y1, x0, x1):
+        seg_h, seg_w = self.segment_shape
+        rows, cols = self._grid
+        page = self.page
+        decode = page.decode
+        for plane in range(self._planes):
+            for sy in range(y0 // seg_h, (y1 - 1) // seg_h + 1):
+                for sx in range(x0 // seg_w, (x1 - 1) // seg_w + 1):
+                    index = plane * rows * cols + sy * cols + sx
+                    offset, count = page.dataoffsets[index], page.databytecounts[index]
+                    data = self._mm[offset:offset + count] if count else None
+                    segment, (_, _, top, left, _), _ = decode(data, index, jpegtables=page.jpegtables)
+                    if segment is None:
+                        continue
+                    segment = segment[0]  # (length, width, contig samples)
+                    ys, ye = max(y0, top), min(y1, top + segment.shape[0])
+                    xs, xe = max(x0, left), min(x1, left + segment.shape[1])
+                    block = segment[ys - top:ye - top, xs - left:xe - left]
+                    if self._planes > 1:
+                        dst[ys - y0:ye - y0, xs - x0:xe - x0, plane] = block[..., 0]
+                    else:
+                        dst[ys - y0:ye - y0, xs - x0:xe - x0] = block
+
+    def _to_bgr(self, region):
+        if region.dtype == np.uint16:
+            region = (region >> 8).astype(np.uint8)
+        if self.samples < 3:
+            bgr = cv2.cvtColor(region[..., 0], cv2.COLOR_GRAY2BGR)
+        else:
+            bgr = cv2.cvtColor(np.ascontiguousarray(region[..., :3]), cv2.COLOR_RGB2BGR)
+        if self.samples in (2, 4):
+            bgr[region[..., -1] == 0] = 0  # alpha = nodata
+        return bgr
+
+
+def pixel_offset(previous, current):
+    """
+    (dy, dx) such that current pixel (y, x) covers the ground of previous
+    pixel (y + dy, x + dx).
+    """
+    prev_geo, cur_geo = previous.geotransform(), current.geotransform()
+    if prev_geo is None or cur_geo is None:
+        if (previous.height, previous.width) != (current.height, current.width):
+            raise ValueError(
+                "Orthomosaics without georeferencing must have the same size "
+                f"({previous.width}x{previous.height} vs {current.width}x{current.height})."
+            )
+        return 0, 0
+    if not np.allclose(prev_geo[2:], cur_geo[2:], rtol=1e-3):
+        raise ValueError("Orthomosaics have different ground sample distances; resample them to a common grid.")
+    dx = (cur_geo[0] - prev_geo[0]) / prev_geo[2]
+    dy = (prev_geo[1] - cur_geo[1]) / prev_geo[3]
+    return int(round(dy)), int(round(dx))
+
+
+def tile_grid(length, tile, overlap):
+    """Tile origins along one axis plus the [start, end) core each tile owns."""
+    if length <= tile:
+        return [(0, 0, length)]
+    step = tile - overlap
+    origins = list(range(0, length - tile, step)) + [length - tile]
+    tiles = []
+    for i, origin in enumerate(origins):
+        # Neighbours split their overlap down the middle.
+        core_start = 0 if i == 0 else (origin + origins[i - 1] + tile) // 2
+        core_end = length if i == len(origins) - 1 else (origins[i + 1] + origin + tile) // 2
+        tiles.append((origin, core_start, core_end))
+    return tiles
+
+
+def iter_tile_pairs(previous, current, tile_size=2048, overlap=256):
+    """
+    Yield (y, x, core, previous_tile, current_tile) over current's pixel
+    grid, one pair in memory at a time.  `core` is the (y0, y1, x0, x1)
+    region, in mosaic coordinates, that this tile is responsible for.
+    Pairs where either tile is entirely nodata are skipped; nodata pixels
+    of one tile are filled from the other so coverage gaps do not read as
+    changes.
+    """
+    dy, dx = pixel_offset(previous, current)
+    for y, cy0, cy1 in tile_grid(current.height, tile_size, overlap):
+        th = min(tile_size, current.height)
+        for x, cx0, cx1 in tile_grid(current.width, tile_size, overlap):
+            tw = min(tile_size, current.width)
+            cur_tile = current.read_region(y, x, th, tw)
+            if not cur_tile.any():
+                continue
+            prev_tile = previous.read_region(y + dy, x + dx, th, tw)
+            if not prev_tile.any():
+                continue
+            prev_missing = ~prev_tile.any(axis=2)
+            cur_missing = ~cur_tile.any(axis=2)
+            prev_tile[prev_missing] = cur_tile[prev_missing]
+            cur_tile[cur_missing] = prev_tile[cur_missing]
+            yield y, x, (cy0, cy1, cx0, cx1), prev_tile, cur_tile
+
+
+def merge_edge_fragments(detector, detections):
+    """
+    Join detections whose boxes touch; used for blobs cut by a tile core
+    boundary (each half was kept by the tile owning its centroid).
+    """
+    parent = list(range(len(detections)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    boxes = [d['bbox'] for d in detections]
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][0])
+    for a_pos, a in enumerate(order):
+        ax, ay, aw, ah = boxes[a]
+        for b in order[a_pos + 1:]:
+            bx, by, bw, bh = boxes[b]
+            if bx > ax + aw:
+                break
+            if by <= ay + ah and ay <= by + bh:
+                parent[find(a)] = find(b)
+
+    groups = {}
+    for i in range(len(detections)):
+        groups.setdefault(find(i), []).append(detections[i])
+    return [members[0] if len(members) == 1 else detector.merge_group(members) for members in groups.values()]
+
+
+def analyze_orthomosaic(detector, previous_path, current_path, temp=None, humidity=None, wind_speed=None,
+                        params=None, tile_size=2048, overlap=256, overview_size=2048):
+    """
+    Run the detector over two orthomosaics tile pair by tile pair.
+
+    Returns (results, overview): results shaped like
+    detect_structural_changes' with detections in current-mosaic pixel
+    coordinates, and a BGR overview of the current mosaic (longest side
+    `overview_size`) for the annotated image.  The overview is assembled
+    from the streamed tiles, so the mosaic is still read only once.
+    """
+    params = params or detector.default_params
+    with MosaicReader(previous_path) as previous, MosaicReader(current_path) as current:
+        scale = min(1.0, overview_size / max(current.height, current.width))
+        overview = np.zeros(
+            (max(1, round(current.height * scale)), max(1, round(current.width * scale)), 3), dtype=np.uint8
+        )
+
+        detections, edge_fragments = [], []
+        weighted = {'cnn_distance': 0.0, 'ssim_score': 0.0}
+        covered = tiles = screened = 0
+        for y, x, (cy0, cy1, cx0, cx1), prev_tile, cur_tile in iter_tile_pairs(previous, current, tile_size, overlap):
+            tiles += 1
+            tile_results = detector.detect_structural_changes(prev_tile, cur_tile, params=params)
+            screened += bool(tile_results.get('screened'))
+            core_area = (cy1 - cy0) * (cx1 - cx0)
+            covered += core_area
+            for key in weighted:
+                weighted[key] += tile_results[key] * core_area
+
+            for det in tile_results['detections']:
+                bx, by, bw, bh = det['bbox']
+                gx, gy = bx + x, by + y
+                centroid = (gx + bw // 2, gy + bh // 2)
+                # Overlapping tiles see the same change; the tile owning its centroid keeps it.
+                if not (cy0 <= centroid[1] < cy1 and cx0 <= centroid[0] < cx1):
+                    continue
+                det = {**det, 'bbox': (gx, gy, bw, bh), 'centroid': centroid}
+                crosses_core = gx < cx0 or gy < cy0 or gx + bw > cx1 or gy + bh > cy1
+                (edge_fragments if crosses_core else detections).append(det)
+
+            oy0, oy1 = round(cy0 * scale), round(cy1 * scale)
+            ox0, ox1 = round(cx0 * scale), round(cx1 * scale)
+            if oy1 > oy0 and ox1 > ox0:
+                core = cur_tile[cy0 - y:cy1 - y, cx0 - x:cx1 - x]
+                overview[oy0:oy1, ox0:ox1] = cv2.resize(core, (ox1 - ox0, oy1 - oy0), interpolation=cv2.INTER_AREA)
+
+        offset = pixel_offset(previous, current)
+        mosaic_info = {
+            'mode': 'orthomosaic',
+            'width': current.width,
+            'height': current.height,
+            'tiles': tiles,
+            'screened_tiles': screened,
+            'tile_size': tile_size,
+            'overlap': overlap,
+            'offset': list(offset),
+            'overview_scale': scale,
+        }
+
+    detections = detector.cluster_detections(detections + merge_edge_fragments(detector, edge_fragments))
+    global_diff_score = weighted['cnn_distance'] / covered if covered else 0.0
+    ssim_score = weighted['ssim_score'] / covered if covered else 1.0
+    risk_assessment = detector.assess_risk(detections, global_diff_score, temp, humidity, wind_speed)
+    overall_confidence = sum(d['confidence'] for d in detections) / len(detections) if detections else 0.0
+    logger.info("Orthomosaic analysis: %d tile pairs, %d detections", tiles, len(detections))
+
+    results = {
+        'cnn_distance': float(global_diff_score),
+        'ssim_score': float(ssim_score),
+        'overall_confidence': round(overall_confidence * 100, 1),
+        'detections': detections,
+        'risk_assessment': risk_assessment,
+        'total_changes': len(detections),
+        'feature_cache': {'enabled': False},
+        'deep_diff': mosaic_info,
+        'parameters': params.to_dict(),
+        'profile': detector.profile.name,
+        'environmental_data': {
+            'temperature': temp,
+            'humidity': humidity,
+            'wind_speed': wind_speed,
+            'climate_stress_index': risk_assessment.get('climate_stress_index', 0.0),
+            'final_heritage_risk_score': risk_assessment.get('final_heritage_score', 0.0),
+        },
+    }
+    return detector._convert_to_serializable(results), overview
+
+
+def overview_results(results):
+    """Copy of mosaic results with detections scaled onto the overview image."""
+    scale = results['deep_diff']['overview_scale']
+    scaled = []
+    for det in results['detections']:
+        x, y, w, h = det['bbox']
+        scaled.append({
+            **det,
+            'bbox': (int(x * scale), int(y * scale), max(1, int(w * scale)), max(1, int(h * scale))),
+        })
+    return {**results, 'detections': scaled}
@@ -0,0 +1,84 @@
+"""
+CNN trunk inputs and feature distances without full-size temporaries.
+
+torchvision's ToTensor + Normalize allocate three float copies of every
+frame (the scaled tensor, the centred one and the normalized one) before
+torch.stack copies them again into the batch.  `fill_batch` instead
+writes each BGR uint8 image straight into its slot of an [N, 3, H, W]
+float32 batch, one multiply-subtract per RGB plane through the shared
+NumPy view.  `InputBuffers` keeps one such batch per thread and size, so
+repeated analyses reuse it (page-locked when CUDA is available, so a copy
+to the device can be asynchronous).
+
+`channel_distance` sums the squared channel difference of two feature
+maps a slice of channels at a time, instead of materializing the
+difference and its square at full feature size; `normalize_` L2-normalizes
+features in place.
+"""
+import threading
+
+import numpy as np
+import torch
+
+# Standard ImageNet normalization
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# (x / 255 - mean) / std as x * SCALE - OFFSET, per RGB channel
+_SCALE = [np.float32(1.0 / (255.0 * s)) for s in IMAGENET_STD]
+_OFFSET = [np.float32(m / s) for m, s in zip(IMAGENET_MEAN, IMAGENET_STD)]
+# Feature channels differenced at once by channel_distance
+DISTANCE_CHUNK = 64
+
+
+def new_batch(n, height, width):
+    """An uninitialized float32 [n, 3, height, width] batch, pinned when CUDA is available."""
+    return torch.empty((n, 3, height, width), dtype=torch.float32, pin_memory=torch.cuda.is_available())
+
+
+def fill_batch(batch, imgs):
+    """Write BGR uint8 images (each H x W of `batch`) into `batch` as normalized RGB; returns `batch`."""
+    planes = batch.numpy()
+    for i, img in enumerate(imgs):
+        for c in range(3):
+            plane = planes[i, c]
+            np.multiply(img[..., 2 - c], _SCALE[c], out=plane, dtype=np.float32)
+            plane -= _OFFSET[c]
+    return batch
+
+
+class InputBuffers:
+    """Per-thread reusable input batches, one per image size."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, n, height, width):
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        batch = buffers.get((height, width))
+        if batch is None or batch.shape[0] < n:
+            batch = buffers[(height, width)] = new_batch(n, height, width)
+        return batch[:n]
+
+
+def normalize_(features, eps=1e-12):
+    """L2-normalize [N, C, h, w] features over channels in place (F.normalize semantics)."""
+    norm = torch.linalg.vector_norm(features, dim=1, keepdim=True)
+    return features.div_(norm.clamp_min_(eps))
+
+
+def channel_distance(f1, f2, chunk=DISTANCE_CHUNK):
+    """Squared Euclidean distance over channels of [N, C, h, w] maps, as [N, h, w]."""
+    n, channels, h, w = torch.broadcast_shapes(f1.shape, f2.shape)
+    dist = torch.zeros((n, h, w), dtype=torch.float32)
+    diff = torch.empty((n, min(chunk, channels), h, w), dtype=torch.float32)
+    partial = torch.empty((n, h, w), dtype=torch.float32)
+    for start in range(0, channels, chunk):
+        width = min(chunk, channels - start)
+        d = diff if width == diff.shape[1] else diff[:, :width]
+        torch.sub(f1[:, start:start + width], f2[:, start:start + width], out=d)
+        d.square_()
+        torch.sum(d, dim=1, out=partial)
+        dist += partial
+    return dist
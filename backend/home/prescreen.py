@@ -0,0 +1,170 @@
+"""
+Cheap pre-screen that answers SAFE for near-identical pairs without the CNN.
+
+Many uploads are re-shoots of an unchanged wall.  After alignment, the two
+frames are compared at a small level (`size` px on the longer side):
+
+  hash_distance   Hamming distance of the 64-bit DCT perceptual hashes
+  ssim            structural similarity of the grey levels
+  intensity       largest mean difference over `block` x `block` cells of
+                  the photometrically normalised (zero mean, unit std) grey
+                  levels, each pixel compared with the 3x3 neighbourhood
+                  range of the other frame so sub-pixel misalignment and
+                  resampling do not count
+  gradient        the same for Sobel gradient magnitudes, each normalised
+                  by its frame mean
+
+The hash and SSIM reject broad changes (and failed alignments) at once but
+barely move for a single missing stone; the block statistics are what
+separate small changes from re-shoot noise (JPEG, sensor noise, exposure,
+sub-pixel misalignment).  A pair is screened only when hash and SSIM are
+within their limits and both block statistics stay below (1 - margin) of
+floors calibrated on synthetic changes (benchmarks/bench_prescreen.py).  Cells the warped past image does not
+cover hold no evidence either way and are ignored; at least `min_coverage`
+of them must be covered.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from .image_hashes import THUMB_SIZE, dct_hash
+from .image_pyramid import ImagePyramid, fit_size
+from .ssim import structural_similarity
+
+
+@dataclass(frozen=True)
+class ScreenConfig:
+    # Longest side (px) of the compared level and the cell side at that level
+    size: int = 512
+    block: int = 8
+    # Fraction of cells the warped past frame must cover
+    min_coverage: float = 0.9
+    # Guards against broad changes and failed alignments only
+    max_hash_distance: int = 6
+    min_ssim: float = 0.85
+    # Calibrated floors: every missing stone (1 % of the frame side), hairline
+    # crack and vegetation patch exceeded the intensity floor; the gradient
+    # floor backs it up for texture-only changes
+    intensity_floor: float = 0.35
+    gradient_floor: float = 1.0
+    # Screened pairs must stay below (1 - margin) x floor
+    margin: float = 0.5
+
+    def __post_init__(self):
+        if not 0.0 <= self.margin < 1.0:
+            raise ValueError("margin must be in [0, 1)")
+
+
+def perceptual_hash(gray):
+    """64-bit DCT hash (as stored on FortImage) of a grey level."""
+    return dct_hash(cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA))
+
+
+def _normalized(values, valid):
+    mean, std = cv2.meanStdDev(values, mask=valid)
+    return (values - float(mean[0, 0])) / (float(std[0, 0]) + 1e-6)
+
+
+def _gradient(gray, valid):
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude = cv2.magnitude(gx, gy)
+    return magnitude / (cv2.mean(magnitude, mask=valid)[0] + 1e-6)
+
+
+def _max_block_mean(values, cell_valid, block):
+    h, w = cell_valid.shape
+    cells = values[:h * block, :w * block].reshape(h, block, w, block).mean(axis=(1, 3))
+    return float(cells[cell_valid].max()) if cell_valid.any() else 0.0
+
+
+def _to_level(M, past_size, current_size, past_shape, level):
+    """M (past -> current frame pixels) between a past level of `past_shape` and a current level of size `level`."""
+    to_level = np.diag([level[0] / current_size[0], level[1] / current_size[1], 1.0])
+    from_past = np.diag([past_shape[1] / past_size[0], past_shape[0] / past_size[1], 1.0])
+    return to_level @ M @ np.linalg.inv(from_past)
+
+
+def _band_difference(a, b):
+    """
+    |a - b| tolerant to a one-pixel misalignment: how far each image falls
+    outside the 3x3 min/max range of the other, whichever is larger.
+    """
+    kernel = np.ones((3, 3), np.uint8)
+    outside_b = np.maximum(a - cv2.dilate(b, kernel), cv2.erode(b, kernel) - a)
+    outside_a = np.maximum(b - cv2.dilate(a, kernel), cv2.erode(a, kernel) - b)
+    return np.maximum(np.maximum(outside_a, outside_b), 0)
+
+
+def compare(past, current, config, M=None):
+    """
+    Screening statistics of an aligned pair.  `past` is the original past
+    frame when M (past -> current, frame pixels) is given, else the already
+    aligned one; either may be an ImagePyramid.  Returns a dict with the
+    statistics, their limits and 'passed'.
+    """
+    past, current = ImagePyramid.of(past), ImagePyramid.of(current)
+    level = fit_size(*current.size, config.size)
+    gray_current = cv2.cvtColor(current.resized(level), cv2.COLOR_BGR2GRAY)
+    valid = np.full(gray_current.shape, 255, np.uint8)
+    if M is None:
+        gray_past = cv2.cvtColor(past.resized(level), cv2.COLOR_BGR2GRAY)
+    else:
+        # Warp a level twice the compared size and area-shrink it: warping the
+        # compared level itself blurs it too much, the full frame costs too much.
+        warp_level = fit_size(*current.size, 2 * config.size)
+        gray_past = cv2.cvtColor(past.resized(fit_size(*past.size, 2 * config.size)), cv2.COLOR_BGR2GRAY)
+        gray_past = cv2.resize(
+            cv2.warpPerspective(gray_past, _to_level(M, past.size, current.size, gray_past.shape, warp_level),
+                                warp_level),
+            level, interpolation=cv2.INTER_AREA,
+        )
+        valid = cv2.warpPerspective(valid, _to_level(M, past.size, current.size, gray_current.shape, level), level)
+        # Border cells mix image and fill; keep only fully covered ones
+        valid = cv2.erode(valid, np.ones((3, 3), np.uint8))
+        # Fill the uncovered border from the current frame so it adds no structure
+        gray_past = np.where(valid > 0, gray_past, gray_current)
+
+    block = config.block
+    h, w = level[1] // block, level[0] // block
+    cell_valid = valid[:h * block, :w * block].reshape(h, block, w, block).min(axis=(1, 3)) == 255
+
+    fp, fc = gray_past.astype(np.float32), gray_current.astype(np.float32)
+    intensity = _max_block_mean(_band_difference(_normalized(fp, valid), _normalized(fc, valid)), cell_valid, block)
+    gradient = _max_block_mean(_band_difference(_gradient(fp, valid), _gradient(fc, valid)), cell_valid, block)
+    hash_distance = int(np.count_nonzero(perceptual_hash(gray_past) != perceptual_hash(gray_current)))
+    similarity = structural_similarity(gray_past, gray_current)
+
+    stats = {
+        'hash_distance': hash_distance,
+        'ssim': round(similarity, 4),
+        'intensity': round(intensity, 4),
+        'gradient': round(gradient, 4),
+        'coverage': round(float(cell_valid.mean()), 4),
+        'limits': limits(config),
+    }
+    return {'passed': passes(stats, config), **stats}
+
+
+def limits(config):
+    keep = 1.0 - config.margin
+    return {
+        'coverage': config.min_coverage,
+        'hash_distance': config.max_hash_distance,
+        'ssim': config.min_ssim,
+        'intensity': round(config.intensity_floor * keep, 4),
+        'gradient': round(config.gradient_floor * keep, 4),
+    }
+
+
+def passes(stats, config):
+    """Screening decision for statistics from `compare` (possibly computed under another margin)."""
+    bounds = limits(config)
+    return bool(
+        stats['coverage'] >= bounds['coverage']
+        and stats['hash_distance'] <= bounds['hash_distance']
+        and stats['ssim'] >= bounds['ssim']
+        and stats['intensity'] <= bounds['intensity']
+        and stats['gradient'] <= bounds['gradient']
+    )
@@ -0,0 +1,127 @@
+"""
+Registration of fort images to their fort's reference frame.
+
+Instead of matching AKAZE features between the two images of every
+analysis, each FortImage is registered once to the fort's reference
+image (`is_reference`; the fort's oldest image is promoted when none is
+flagged).  Its keypoints/descriptors are stored next to the
+upload and its homography onto the reference is stored on the row, in
+0-1 image coordinates so it holds at any decode resolution.  A comparison
+then composes the two stored homographies:
+
+    past -> current = inv(current -> reference) @ (past -> reference)
+
+An image is only matched again when the fort's reference changes.  When
+either registration failed (too few inliers, implausible warp), the
+analysis falls back to pairwise matching.
+"""
+import io
+import logging
+
+import numpy as np
+from django.core.files.base import ContentFile
+
+from .alignment import frame_matrix, is_plausible
+from .orthomosaic import is_orthomosaic
+
+logger = logging.getLogger(__name__)
+
+# RANSAC reprojection threshold (px at the 1000 px matching level) and the
+# inliers a registration needs; composed pairs carry two registration errors.
+RANSAC_THRESHOLD = 2.0
+MIN_INLIERS = 15
+
+
+def save_features(fort_image, features):
+    points, descriptors, size = features
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        points=points,
+        descriptors=descriptors if descriptors is not None else np.zeros((0, 0), dtype=np.uint8),
+        size=np.array(size),
+    )
+    fort_image.alignment_features.save(f'{fort_image.id}.npz', ContentFile(buf.getvalue()), save=False)
+    fort_image.save(update_fields=['alignment_features'])
+
+
+def load_features(fort_image):
+    if not fort_image.alignment_features:
+        return None
+    try:
+        with fort_image.alignment_features.open('rb') as f:
+            data = np.load(io.BytesIO(f.read()))
+            descriptors = data['descriptors'] if data['descriptors'].size else None
+            return data['points'], descriptors, tuple(int(v) for v in data['size'])
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Unreadable alignment features for image %s: %s", fort_image.id, e)
+        return None
+
+
+def get_features(detector, fort_image, image=None):
+    """Stored alignment features of a FortImage, computed (and stored) on first use."""
+    features = load_features(fort_image)
+    if features is None:
+        if image is None:
+            # Matching only uses the 1000 px level
+            image = detector.load_image_from_file(fort_image.image, max_side=1000)
+        features = detector.alignment_features(image)
+        save_features(fort_image, features)
+    return features
+
+
+def register_image(detector, fort_image, image=None, force=False):
+    """
+    Register `fort_image` to its fort's reference image unless it already is.
+    `image` (array or ImagePyramid of this FortImage) avoids decoding it again.
+    Returns False when the image cannot take part (orthomosaics).
+    """
+    fort = fort_image.fort
+    reference = fort.reference_image
+    if reference is None:
+        oldest = fort.images.order_by('uploaded_at', 'id').first()
+        fort.images.filter(pk=oldest.pk).update(is_reference=True)
+        if oldest.pk == fort_image.pk:
+            fort_image.is_reference = True
+        reference = fort.reference_image
+    if is_orthomosaic(fort_image.image.name) or is_orthomosaic(reference.image.name):
+        return False
+    if fort_image.registered_to_id == reference.id and not force:
+        return True
+
+    features = get_features(detector, fort_image, image)
+    if reference.pk == fort_image.pk:
+        H = np.eye(3)
+    else:
+        ref_features = get_features(detector, reference)
+        M, inliers = detector.match_alignment_features(
+            features, ref_features, features[2], ref_features[2], ransac_threshold=RANSAC_THRESHOLD,
+        )
+        H = None
+        if M is not None and inliers >= MIN_INLIERS:
+            H = np.linalg.inv(frame_matrix(ref_features[2])) @ M @ frame_matrix(features[2])
+            H /= H[2, 2]
+            if not is_plausible(H):
+                H = None
+        if H is None:
+            logger.info("Image %s could not be registered to reference %s of fort %s",
+                        fort_image.id, reference.id, fort.name)
+
+    fort_image.registered_to = reference
+    fort_image.reference_homography = H.tolist() if H is not None else None
+    fort_image.save(update_fields=['registered_to', 'reference_homography'])
+    return True
+
+
+def pair_homography(previous_image, current_image):
+    """
+    past -> current homography in 0-1 image coordinates composed from the
+    stored registrations, or None when they do not share a valid reference.
+    """
+    if previous_image.registered_to_id is None or previous_image.registered_to_id != current_image.registered_to_id:
+        return None
+    if previous_image.reference_homography is None or current_image.reference_homography is None:
+        return None
+    H = np.linalg.inv(np.array(current_image.reference_homography)) @ np.array(previous_image.reference_homography)
+    H /= H[2, 2]
+    return H if is_plausible(H) else None
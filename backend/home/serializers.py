@@ -95,7 +95,7 @@ class FortSerializer(serializers.ModelSerializer):
         model = Fort
         fields = [
             'id', 'name', 'location', 'description', 
-            'latitude', 'longitude', 'created_at', 'updated_at',
+            'latitude', 'longitude', 'detection_profile', 'created_at', 'updated_at',
             'latest_image', 'analysis_count', 'latest_analysis'
         ]
         read_only_fields = ['created_at', 'updated_at']
@@ -0,0 +1,90 @@
+"""
+Structural similarity (Wang et al. 2004) with OpenCV float32 filters.
+
+`structural_similarity` reproduces skimage.metrics.structural_similarity
+for grey images (uniform 7x7 or Gaussian sigma 1.5 windows, sample
+covariance, reflected borders, mean over the map without its half-window
+border) but runs the five local moments as separable OpenCV filters on
+float32 buffers instead of scipy filters on float64 ones: several times
+faster and half the memory.  `pair_ssim` compares two BGR frames at an
+analysis resolution (longest side `max_side`), taking the grey levels
+from ImagePyramids so frames already shrunk for other stages are reused.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from .image_pyramid import ImagePyramid
+
+K1, K2 = 0.01, 0.03
+# skimage's Gaussian window: sigma 1.5 truncated at 3.5 sigma
+GAUSSIAN_SIGMA = 1.5
+GAUSSIAN_WIN = 2 * int(3.5 * GAUSSIAN_SIGMA + 0.5) + 1
+
+
+@dataclass(frozen=True)
+class SSIMConfig:
+    # Longest side (px) SSIM is computed at; None compares native frames
+    max_side: int = None
+    gaussian: bool = False
+
+
+def structural_similarity(a, b, win_size=None, gaussian=False, data_range=255.0, full=False):
+    """
+    Mean SSIM of two equally sized grey images; with `full` also the float32
+    SSIM map (same size as the inputs).
+    """
+    if a.shape != b.shape:
+        raise ValueError("Input images must have the same dimensions.")
+    win_size = win_size or (GAUSSIAN_WIN if gaussian else 7)
+    if win_size % 2 == 0 or min(a.shape[:2]) < win_size:
+        raise ValueError(f"win_size must be odd and fit the images ({a.shape[:2]})")
+
+    if gaussian:
+        window = lambda x: cv2.GaussianBlur(x, (win_size, win_size), GAUSSIAN_SIGMA, borderType=cv2.BORDER_REFLECT)
+    else:
+        window = lambda x: cv2.boxFilter(x, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    a = a.astype(np.float32, copy=False)
+    b = b.astype(np.float32, copy=False)
+    cov_norm = win_size * win_size / (win_size * win_size - 1.0)
+    c1, c2 = (K1 * data_range) ** 2, (K2 * data_range) ** 2
+
+    mu_a, mu_b = window(a), window(b)
+    # Moments in place: every buffer is float32 and reused once its input is consumed
+    var_a = window(cv2.multiply(a, a))
+    var_b = window(cv2.multiply(b, b))
+    cov = window(cv2.multiply(a, b))
+    mu_ab = cv2.multiply(mu_a, mu_b)
+    cv2.multiply(mu_a, mu_a, dst=mu_a)
+    cv2.multiply(mu_b, mu_b, dst=mu_b)
+    var_a -= mu_a
+    var_b -= mu_b
+    cov -= mu_ab
+    # Numerator (2 mu_a mu_b + c1)(2 cov + c2) into mu_ab, denominator into mu_a
+    cv2.addWeighted(mu_ab, 2.0, mu_ab, 0.0, c1, dst=mu_ab)
+    cv2.addWeighted(cov, 2.0 * cov_norm, cov, 0.0, c2, dst=cov)
+    cv2.multiply(mu_ab, cov, dst=mu_ab)
+    mu_a += mu_b
+    mu_a += c1
+    var_a += var_b
+    cv2.addWeighted(var_a, cov_norm, var_a, 0.0, c2, dst=var_a)
+    cv2.multiply(mu_a, var_a, dst=mu_a)
+    ssim_map = cv2.divide(mu_ab, mu_a, dst=mu_ab)
+
+    pad = (win_size - 1) // 2
+    score = float(cv2.mean(ssim_map[pad:-pad, pad:-pad])[0])
+    return (score, ssim_map) if full else score
+
+
+def pair_ssim(past, current, config=SSIMConfig(), full=False):
+    """SSIM of two aligned BGR frames (arrays or ImagePyramids) at `config.max_side`."""
+    past, current = ImagePyramid.of(past), ImagePyramid.of(current)
+    if config.max_side:
+        past_level, current_level = past.fit(config.max_side), current.fit(config.max_side)
+    else:
+        past_level, current_level = past.base, current.base
+    return structural_similarity(
+        cv2.cvtColor(past_level, cv2.COLOR_BGR2GRAY), cv2.cvtColor(current_level, cv2.COLOR_BGR2GRAY),
+        gaussian=config.gaussian, full=full,
+    )
@@ -3,22 +3,96 @@ import cv2
 import numpy as np
 import logging
 import torch
-import torch.nn as nn
 import torchvision.models as models
-from torchvision import transforms
-from skimage.metrics import structural_similarity as ssim
-from sklearn.cluster import DBSCAN
 from PIL import Image
 from django.core.files.base import ContentFile
+from . import clustering, timings
+from .alignment import TIERS, AlignmentConfig, estimate_tiered, match_points
+from .annotation import AnnotationConfig, encode as encode_annotation, render as render_annotation
+from .backbones import TRUNK_LAYERS, load_bundle, trunk_from_torchvision
+from .detection_profiles import get_profile
+from .image_pyramid import ImagePyramid, decode_image
+from .inference_backends import BACKENDS, load_int8, script_trunk
+from .preprocessing import InputBuffers, channel_distance, fill_batch, new_batch, normalize_
+from .prescreen import ScreenConfig, compare as screen_pair
+from .ssim import SSIMConfig, pair_ssim
 import io
-import torch.nn.functional as F
+import os
+import hashlib
+import json
+import time
+from dataclasses import dataclass, replace, asdict
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class DetectionParams:
+    """
+    Per-call tuning for detect_structural_changes.
+
+    Immutable, so a single loaded detector can serve concurrent analyses
+    with different parameters (e.g. per-fort false-positive thresholds).
+    """
+    # Adaptive threshold offset in std-devs above the mean diff (see from_false_positive_rate)
+    k_factor: float = 0.0
+    # Adaptive threshold is clamped to [min_threshold, max_threshold] (0-1 diff scale)
+    min_threshold: float = 0.15
+    max_threshold: float = 0.30
+    # Compare the diff map's mean/std on the same 0-1 scale as the bounds. Off keeps the
+    # original 0-255 statistics, which nearly always clamp to max_threshold.
+    scaled_threshold: bool = False
+    # Ultra-sensitive: catch even tiny crumbs (10px)
+    min_blob_area: float = 10
+    # Blob is noise when this fraction is vegetation (or sky) in BOTH images
+    noise_ratio: float = 0.70
+    # Hue 15-95 covers dried grass (15-30) and bright green (30-95).
+    grass_hsv_lower: tuple = (15, 30, 30)
+    grass_hsv_upper: tuple = (95, 255, 255)
+    # Sky (Bright/Blue)
+    sky_blue_hsv_lower: tuple = (90, 50, 50)
+    sky_blue_hsv_upper: tuple = (130, 255, 255)
+    # Bright white/grey sky (High value, low saturation)
+    sky_white_hsv_lower: tuple = (0, 0, 220)
+    sky_white_hsv_upper: tuple = (180, 40, 255)
+
+    def with_false_positive_rate(self, false_positive_rate):
+        """
+        ML Feedback Loop Adaptation: The user trains the model via UI verification.
+        If a specific fort has a high rate of False Positives reported by the Admin, 
+        the threshold for 'significant change' is dynamically scaled upwards. 
+        This teaches the model to ignore artifact noise and 'perfect' its precision over time.
+        """
+        # Base k=0.0 is hyper-sensitive. A 50% FP rate translates to k=1.5
+        # Require feature differences to be 1.5 standard deviations above mean to detect anything.
+        return replace(self, k_factor=min(2.5, false_positive_rate * 3.0))
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class TilingConfig:
+    """
+    Native-resolution deep difference for frames larger than the profile's
+    input size (see get_tiled_feature_difference).  Sizes are in pixels and
+    multiples of the trunk stride (8).
+    """
+    tile_size: int = 1024
+    overlap: int = 128
+    # Tiles encoded per forward pass (x2 images); bounds activation memory
+    batch_size: int = 2
+    # Frames needing more tiles are downscaled until they fit; bounds latency
+    max_tiles: int = 64
+
+
 class StructuralChangeDetector:
-    def __init__(self, config=None): 
-        self.config = config or {
-            'feature_layer': 'layer3',
+    # Output stride of every trunk (see backbones.TRUNK_LAYERS)
+    FEATURE_STRIDE = 8
+
+    def __init__(self, config=None, feature_store=None, weights_path=None, backend='eager', int8_path=None,
+                 profile='accurate'):
+        defaults = {
             'diff_threshold': 0.60,  # Increased further to reduce noise
             'min_contour_area': 800, # Increased to ignore artifacts
             'max_contour_area': 100000, 
@@ -31,44 +105,96 @@ class StructuralChangeDetector:
             # Adjust these for the local flora and season when needed.
             'grass_hsv_lower': [15, 30, 30],
             'grass_hsv_upper': [95, 255, 255],
+            # Max corner shift (px at CNN input size) for reusing a cached past
+            # feature map without warping; half a layer2 cell.
+            'feature_cache_max_shift': 4.0,
         }
-        self.k_factor = 0.0  # Adaptive threshold offset updated via update_thresholds_from_history()
+        # Callers' configs override the defaults key by key, so configs written
+        # before a key existed keep working.
+        self.config = {**defaults, **(config or {})}
+        # Defaults for detect_structural_changes; callers pass their own DetectionParams
+        # per call instead of mutating shared detector state.
+        self.default_params = DetectionParams(
+            grass_hsv_lower=tuple(self.config['grass_hsv_lower']),
+            grass_hsv_upper=tuple(self.config['grass_hsv_upper']),
+        )
+        # Optional FeatureStore holding per-FortImage layer2 maps (see feature_cache.py)
+        self.feature_store = feature_store
+        # Optional MicroBatcher sharing forward passes between threads (see enable_batching)
+        self.batcher = None
+        # Reused per-thread trunk input batches (see preprocessing.py)
+        self.input_buffers = InputBuffers()
+        # Optional TilingConfig for large frames (see enable_tiling)
+        self.tiling = None
+        # Homography estimation tiers and quality gates (see alignment.py, configure_alignment)
+        self.alignment = AlignmentConfig()
+        # Optional ScreenConfig answering SAFE for near-identical pairs (see prescreen.py, enable_prescreen)
+        self.prescreen = None
+        # Resolution and window of the reported SSIM (see ssim.py, configure_ssim)
+        self.ssim = SSIMConfig()
+        # Format, quality and size of annotated images (see annotation.py, configure_annotation)
+        self.annotation = AnnotationConfig()
+        # Trunk + input resolution (see detection_profiles.py); identifies the
+        # cached feature maps together with the backend.
+        self.profile = get_profile(profile)
+        self.input_size = self.profile.input_size
+        # Local trunk bundle from `manage.py build_backbone_bundle`
+        self.weights_path = weights_path
+        self.backbone_weights = self.profile.weights
+        # Trunk execution backend (see inference_backends.py); int8 needs the
+        # module written by `manage.py calibrate_int8_backbone`.
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend!r}; expected one of {BACKENDS}")
+        self.backend = backend
+        self.int8_path = int8_path
         self.setup_cnn_model()
-        self.setup_processing_tools()
         
     def setup_cnn_model(self):
-        # Use ResNet50 for deep feature extraction
+        # Use the profile's CNN (ResNet50 by default) for deep feature extraction
         # We want spatial features, not just a global descriptor
-        full_model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-        # Extract up to layer2 for HIGHER RESOLUTION (1/8th scale) to catch small stones
-        # layer2 output is 512 channels, 1/8th resolution
-        self.feature_extractor = nn.Sequential(
-            full_model.conv1,
-            full_model.bn1,
-            full_model.relu,
-            full_model.maxpool,
-            full_model.layer1,
-            full_model.layer2
-            # Removed layer3 and layer4 to keep high spatial resolution
-        )
-        self.feature_extractor.eval()
-        
-        # Standard ImageNet normalization
-        self.transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-    
-    def setup_processing_tools(self):
-        # Vegetation HSV filter ranges (configurable via config dict)
-        self.grass_lower = np.array(self.config['grass_hsv_lower'])
-        self.grass_upper = np.array(self.config['grass_hsv_upper'])
-        
-        # Sky filters (Blue/White/Grey)
-        self.sky_lower_blue = np.array([90, 50, 50])
-        self.sky_upper_blue = np.array([130, 255, 255])
+        # Extract up to the 1/8th scale stage (ResNet layer2) for HIGHER RESOLUTION to catch small stones
+        # ResNet50 layer2 output is 512 channels, 1/8th resolution
+        # Removed deeper stages to keep high spatial resolution
+        if self.backend == 'int8' and not (self.int8_path and os.path.exists(self.int8_path)):
+            logger.warning(
+                "int8 backbone %s not found; using the eager fp32 trunk "
+                "(run `manage.py calibrate_int8_backbone`).",
+                self.int8_path,
+            )
+            self.backend = 'eager'
+
+        if self.backend == 'int8':
+            self.feature_extractor, metadata = load_int8(self.int8_path)
+            self.backbone_weights = metadata['weights']
+        else:
+            self.feature_extractor = self.load_fp32_trunk()
+            if self.backend == 'torchscript':
+                self.feature_extractor = script_trunk(self.feature_extractor, self.input_size)
     
-    def load_image_from_file(self, image_file):
+    def load_fp32_trunk(self):
+        if self.weights_path and os.path.exists(self.weights_path):
+            # Offline start: only the truncated trunk is built and loaded.
+            trunk, metadata = load_bundle(self.weights_path)
+            if metadata['arch'] != self.profile.backbone:
+                raise ValueError(
+                    f"Backbone bundle {self.weights_path} holds {metadata['arch']}, "
+                    f"profile {self.profile.name!r} needs {self.profile.backbone}"
+                )
+            self.backbone_weights = metadata['weights']
+            return trunk
+        logger.warning(
+            "Backbone bundle %s not found; loading full torchvision %s "
+            "(run `manage.py build_backbone_bundle` for offline startup).",
+            self.weights_path, self.profile.backbone,
+        )
+        weights = models.get_weight(self.profile.weights)
+        return trunk_from_torchvision(weights, arch=self.profile.backbone).eval()
+
+    def load_image_from_file(self, image_file, max_side=None):
+        """
+        Decode an upload to BGR.  With `max_side`, the longer side is capped
+        and JPEGs are decoded at reduced scale (see image_pyramid.decode_image).
+        """
         if hasattr(image_file, 'read'):
             image_data = image_file.read()
             if hasattr(image_file, 'seek'):
@@ -76,113 +202,204 @@ class StructuralChangeDetector:
         else:
             with open(image_file.path, 'rb') as f:
                 image_data = f.read()
-        nparr = np.frombuffer(image_data, np.uint8)
-        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        return decode_image(image_data, max_side)
     
-    def align_images(self, past_img, current_img):
+    def alignment_features(self, img):
         """
-        Align current_img to match past_img viewpoint using AKAZE + Homography.
-        Includes CLAHE for lighting invariance.
+        CLAHE + AKAZE keypoints of an image's 1000 px level.
+        Returns (points [N, 2] float32 in 0-1 image coordinates, descriptors,
+        (width, height) of the level); descriptors is None when none were found.
+        `img` may be an array or an ImagePyramid.
         """
-        try:
-            # Resize for faster feature detection if images are huge
-            h, w = past_img.shape[:2]
-            scale = 1.0
-            if max(h, w) > 1000:
-                scale = 1000.0 / max(h, w)
-                past_small = cv2.resize(past_img, (0,0), fx=scale, fy=scale)
-                curr_small = cv2.resize(current_img, (0,0), fx=scale, fy=scale)
-            else:
-                past_small = past_img
-                curr_small = current_img
+        # Resize for faster feature detection if images are huge
+        small = ImagePyramid.of(img).fit(1000)
 
-            # Convert to LAB for CLAHE (Contrast Limited Adaptive Histogram Equalization)
-            # This helps normalize lighting before feature detection
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            
-            def apply_clahe(img):
-                lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-                l, a, b = cv2.split(lab)
-                l2 = clahe.apply(l)
-                lab = cv2.merge((l2, a, b))
-                return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
-                
-            past_processed = apply_clahe(past_small)
-            curr_processed = apply_clahe(curr_small)
+        # Convert to LAB for CLAHE (Contrast Limited Adaptive Histogram Equalization)
+        # This helps normalize lighting before feature detection
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        processed = cv2.cvtColor(cv2.merge((clahe.apply(l), a, b)), cv2.COLOR_LAB2BGR)
 
-            # AKAZE is more robust than ORB for nonlinear diffusion (lighting changes)
-            detector = cv2.AKAZE_create()
-            kp1, des1 = detector.detectAndCompute(past_processed, None)
-            kp2, des2 = detector.detectAndCompute(curr_processed, None)
-            
-            if des1 is None or des2 is None:
-                logger.debug("No descriptors found during image alignment.")
-                return past_img, current_img
-                
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING)
-            matches = bf.knnMatch(des1, des2, k=2)
-            
-            # Lowe's ratio test
-            good_matches = []
-            for m, n in matches:
-                if m.distance < 0.75 * n.distance:
-                    good_matches.append(m)
-            
-            if len(good_matches) < 10:
-                logger.debug("Not enough good matches to align images (%d found).", len(good_matches))
-                return past_img, current_img
-                
-            src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-            dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-            
-            # Scale points back up
-            if scale != 1.0:
-                src_pts /= scale
-                dst_pts /= scale
-                
-            M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-            
-            if M is not None:
-                h, w, c = current_img.shape
-                aligned_past = cv2.warpPerspective(past_img, M, (w, h))
-                return aligned_past, current_img
+        # AKAZE is more robust than ORB for nonlinear diffusion (lighting changes)
+        kps, des = cv2.AKAZE_create().detectAndCompute(processed, None)
+        size = (small.shape[1], small.shape[0])
+        points = np.float32([kp.pt for kp in kps]).reshape(-1, 2) / np.float32(size)
+        return points, des, size
+
+    def match_alignment_features(self, features1, features2, size1, size2, ransac_threshold=5.0):
+        """
+        Homography from image 1 to image 2 (pixel coordinates of frames sized
+        size1 / size2) from two alignment_features results.
+        Returns (M, inlier count), or (None, 0) when they cannot be aligned.
+        """
+        M, inliers, _ = match_points(
+            features1[0], features1[1], features2[0], features2[1], size1, size2,
+            ratio=self.alignment.ratio, ransac_threshold=ransac_threshold,
+        )
+        if M is None:
+            logger.debug("Not enough good matches to align images.")
+        return M, inliers
+
+    def estimate_alignment(self, past_img, current_img):
+        """
+        Estimate the homography mapping past_img onto current_img's viewpoint
+        with the tiered engine in alignment.py (phase correlation, ORB, AKAZE;
+        cheapest first, until one passes its quality gate).
+        Returns (M or None, report of the tier used and its quality).
+        Either image may be an ImagePyramid; their 1000 px levels are reused.
+        """
+        try:
+            return estimate_tiered(self, past_img, current_img, self.alignment)
         except Exception as e:
             logger.warning("Image alignment failed: %s", e)
-            pass
-            
+        return None, {'tier': 'none', 'passed': False}
+
+    def estimate_homography(self, past_img, current_img):
+        """Past -> current homography from estimate_alignment, or None when the images cannot be aligned."""
+        return self.estimate_alignment(past_img, current_img)[0]
+
+    def align_images(self, past_img, current_img, M=None):
+        """
+        Align current_img to match past_img viewpoint with a homography.
+        A precomputed homography M (past -> current) skips the estimation.
+        """
+        if M is None:
+            M = self.estimate_homography(past_img, current_img)
+        if M is not None:
+            h, w = current_img.shape[:2]
+            aligned_past = cv2.warpPerspective(past_img, M, (w, h))
+            return aligned_past, current_img
         return past_img, current_img
-    
-    def get_deep_feature_difference(self, img1, img2):
+
+    def feature_fingerprint(self):
+        """Short hash identifying the model/config that produced a feature map."""
+        spec = {
+            'backbone': self.profile.backbone,
+            'weights': self.backbone_weights,
+            'layer': TRUNK_LAYERS[self.profile.backbone],
+            'backend': self.backend,
+            'input_size': list(self.input_size),
+            'normalize': 'l2',
+            'resize': 'area',
+            'dtype': 'float16',
+        }
+        return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+    def enable_batching(self, max_batch_size=8, max_wait_ms=5.0):
+        """Route trunk forward passes through a shared MicroBatcher."""
+        from .inference_batcher import MicroBatcher
+        self.batcher = MicroBatcher(self.feature_extractor, max_batch_size, max_wait_ms)
+
+    def enable_tiling(self, tile_size=1024, overlap=128, batch_size=2, max_tiles=64):
+        """Compute the deep difference of large frames in native-resolution tiles."""
+        stride = self.FEATURE_STRIDE
+        if tile_size % stride or overlap % stride or not 0 <= overlap < tile_size:
+            raise ValueError(
+                f"tile_size and overlap must be multiples of {stride} with overlap < tile_size"
+            )
+        self.tiling = TilingConfig(tile_size, overlap, max(1, batch_size), max(1, max_tiles))
+
+    def configure_alignment(self, tiers=TIERS, min_inliers=30, min_inlier_ratio=0.3, min_phase_inlier_ratio=0.75):
+        """Pick the homography estimation tiers (cheapest first) and their quality gates."""
+        self.alignment = AlignmentConfig(
+            tuple(tiers), min_inliers=min_inliers, min_inlier_ratio=min_inlier_ratio,
+            min_phase_inlier_ratio=min_phase_inlier_ratio,
+        )
+
+    def enable_prescreen(self, margin=0.5):
+        """Skip the deep difference for pairs the cheap pre-screen proves near-identical."""
+        self.prescreen = ScreenConfig(margin=margin)
+
+    def configure_ssim(self, max_side=None, gaussian=False):
+        """Compute the SSIM score at `max_side` px (None or 0: native resolution)."""
+        self.ssim = SSIMConfig(max_side or None, gaussian)
+
+    def configure_annotation(self, format='png', quality=90, max_side=None):
+        """Encode annotated images as `format` ('jpeg', 'webp' or 'png'), at most `max_side` px."""
+        self.annotation = AnnotationConfig(format.lower(), quality, max_side or None)
+
+    def use_tiling(self, img):
+        return self.tiling is not None and max(img.shape[:2]) > max(self.input_size)
+
+    def run_feature_extractor(self, batch):
+        if self.batcher is not None:
+            return self.batcher.infer(batch)
+        with torch.no_grad():
+            return self.feature_extractor(batch)
+
+    def preprocess_images(self, imgs, out=None):
+        """
+        Resize, convert and normalize BGR images (or ImagePyramids) into one
+        [N, 3, H, W] trunk input, written into `out` when given (see preprocessing.py).
+        """
+        width, height = self.input_size
+        batch = out if out is not None else new_batch(len(imgs), height, width)
+        return fill_batch(batch, [ImagePyramid.of(img).resized(self.input_size) for img in imgs])
+
+    def encode_images(self, imgs):
+        """Run the CNN trunk on a list of images as one batch; L2-normalized [N, C, h, w]."""
+        width, height = self.input_size
+        with timings.stage('preprocess'):
+            batch = self.preprocess_images(imgs, out=self.input_buffers.get(len(imgs), height, width))
+        with timings.stage('cnn'):
+            return normalize_(self.run_feature_extractor(batch))
+
+    def encode_image(self, img):
+        """Run the CNN trunk and return L2-normalized features, shape [1, C, h, w]."""
+        return self.encode_images([img])
+
+    def is_near_identity(self, M, frame_size):
+        """
+        True when M moves no frame corner by more than
+        config['feature_cache_max_shift'] pixels at CNN input resolution.
+        Below that the cached (unwarped) features of the past image are
+        interchangeable with encoding the warped image.
+        """
+        if M is None:
+            return True
+        w, h = frame_size
+        corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        moved = cv2.perspectiveTransform(corners, M)
+        shift = np.abs(moved - corners).reshape(-1, 2) * (np.float32(self.input_size) / np.float32([w, h]))
+        return float(shift.max()) <= self.config['feature_cache_max_shift']
+
+    def get_cached_features(self, image_id, img):
+        """
+        Return (features, hit) for a FortImage, encoding and storing on a miss.
+        Features round-trip through fp16 on both paths so a hit and a miss
+        yield identical maps.
+        """
+        key = self.feature_store.make_key(image_id, self.feature_fingerprint())
+        cached = self.feature_store.get(key)
+        if cached is not None:
+            return torch.from_numpy(np.asarray(cached, dtype=np.float32)), True
+        features = self.encode_image(img).half()
+        self.feature_store.put(key, features.numpy())
+        return features.float(), False
+
+    def get_deep_feature_difference(self, img1, img2, f1=None, f2=None):
         """
         Compute pixel-wise difference in deep feature space.
         Detects structural changes while being robust to lighting/season.
+        Precomputed normalized feature maps (see encode_image) may be passed
+        in place of running the CNN on either image.  Images may be arrays
+        or ImagePyramids.
         """
-        # Prepare params
-        # INCREASED RESOLUTION: 1024x1024 for fine details (stones)
-        # Layer 2 (1/8 scale) -> 128x128 feature map.
-        input_size = (1024, 1024) 
-        
-        # Preprocess
-        img1_resized = cv2.resize(img1, input_size)
-        img2_resized = cv2.resize(img2, input_size)
-        
-        img1_rgb = cv2.cvtColor(img1_resized, cv2.COLOR_BGR2RGB)
-        img2_rgb = cv2.cvtColor(img2_resized, cv2.COLOR_BGR2RGB)
-        
-        t1 = self.transform(img1_rgb).unsqueeze(0)
-        t2 = self.transform(img2_rgb).unsqueeze(0)
-        
-        with torch.no_grad():
-            f1 = self.feature_extractor(t1) # Shape: [1, 512, 128, 128]
-            f2 = self.feature_extractor(t2)
-            
-        # normalize features (cosine similarity equivalent when using euclidean on normalized vectors)
-        f1 = F.normalize(f1, p=2, dim=1)
-        f2 = F.normalize(f2, p=2, dim=1)
-        
+        # INCREASED RESOLUTION: profile input size (1024x1024 for 'accurate') for fine details (stones)
+        # Layer 2 (1/8 scale) -> 128x128 feature map at 1024.
+        if f1 is None and f2 is None:
+            f1, f2 = self.encode_images([img1, img2]).split(1)  # Shape: [1, 512, 128, 128] each
+        if f1 is None:
+            f1 = self.encode_image(img1)
+        if f2 is None:
+            f2 = self.encode_image(img2)
+        
+        # Features are L2-normalized (cosine similarity equivalent when using euclidean on normalized vectors)
         # Compute difference (1 - Cosine Similarity) or just geometric distance
         # We use Per-element squared difference sum across channels
-        diff_tensor = torch.sum((f1 - f2) ** 2, dim=1).squeeze().cpu().numpy()
+        with timings.stage('distance'):
+            diff_tensor = channel_distance(f1, f2)[0].numpy()
         
         # Resize difference map back to original image size
         diff_map = cv2.resize(diff_tensor, (img1.shape[1], img1.shape[0]))
@@ -194,62 +411,199 @@ class StructuralChangeDetector:
         
         return diff_uint8, np.mean(diff_map)
 
-    def get_sky_mask(self, image):
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    @staticmethod
+    def _tile_origins(length, tile, step):
+        if length <= tile:
+            return [0]
+        origins = list(range(0, length - tile, step))
+        origins.append(length - tile)
+        return origins
+
+    def _tile_layout(self, height, width, cfg):
+        """Padded size, tile extent and tile origins for a frame (all multiples of the stride)."""
+        stride = self.FEATURE_STRIDE
+        padded_h = -(-height // stride) * stride
+        padded_w = -(-width // stride) * stride
+        tile_h = min(cfg.tile_size, padded_h)
+        tile_w = min(cfg.tile_size, padded_w)
+        step = cfg.tile_size - cfg.overlap
+        ys = self._tile_origins(padded_h, tile_h, step)
+        xs = self._tile_origins(padded_w, tile_w, step)
+        return (padded_h, padded_w), (tile_h, tile_w), [(y, x) for y in ys for x in xs]
+
+    def _blend_window(self, tile_h, tile_w, overlap):
+        # Linear ramp over the overlap (in feature cells), flat in the middle, never zero.
+        ramp_len = max(1, overlap // self.FEATURE_STRIDE)
+
+        def ramp(n):
+            idx = np.arange(n, dtype=np.float32)
+            return np.minimum(np.minimum(idx + 1, n - idx) / (ramp_len + 1), 1.0)
+
+        return np.outer(ramp(tile_h), ramp(tile_w))
+
+    def get_tiled_feature_difference(self, img1, img2):
+        """
+        Deep feature difference at native resolution.
+
+        Both frames (same size) are cut into overlapping tiles of
+        `tiling.tile_size` pixels, encoded `tiling.batch_size` tile pairs per
+        forward pass, and the per-tile difference maps are blended into one
+        map at feature resolution (1/8) with weights ramping down across the
+        overlaps, so seams do not show up as changes.  Only the current batch
+        of tiles is ever held as tensors.  Frames needing more than
+        `tiling.max_tiles` tiles are downscaled first.
+
+        Returns (diff_uint8 at img1's size, mean diff 0-1, info dict).
+        """
+        cfg = self.tiling
+        stride = self.FEATURE_STRIDE
+        height, width = img1.shape[:2]
+        if img2.shape[:2] != (height, width):
+            img2 = cv2.resize(img2, (width, height))
+
+        scale = 1.0
+        layout = self._tile_layout(height, width, cfg)
+        while len(layout[2]) > cfg.max_tiles:
+            scale *= 0.9
+            layout = self._tile_layout(int(height * scale), int(width * scale), cfg)
+        if scale < 1.0:
+            size = (int(width * scale), int(height * scale))
+            img1 = cv2.resize(img1, size, interpolation=cv2.INTER_AREA)
+            img2 = cv2.resize(img2, size, interpolation=cv2.INTER_AREA)
+
+        (padded_h, padded_w), (tile_h, tile_w), origins = layout
+        scaled_h, scaled_w = img1.shape[:2]
+
+        cell_h, cell_w = tile_h // stride, tile_w // stride
+        window = self._blend_window(cell_h, cell_w, cfg.overlap)
+        acc = np.zeros((padded_h // stride, padded_w // stride), dtype=np.float32)
+        weight = np.zeros_like(acc)
+
+        def tile_pixels(img, y, x):
+            tile = img[y:y + tile_h, x:x + tile_w]
+            if tile.shape[:2] != (tile_h, tile_w):
+                # Frame edge not on the stride grid: pad this tile only, not the frame.
+                tile = cv2.copyMakeBorder(
+                    tile, 0, tile_h - tile.shape[0], 0, tile_w - tile.shape[1], cv2.BORDER_REFLECT_101
+                )
+            return tile
+
+        for start in range(0, len(origins), cfg.batch_size):
+            chunk = origins[start:start + cfg.batch_size]
+            with timings.stage('preprocess'):
+                batch = fill_batch(
+                    self.input_buffers.get(2 * len(chunk), tile_h, tile_w),
+                    [tile_pixels(img1, y, x) for y, x in chunk] + [tile_pixels(img2, y, x) for y, x in chunk],
+                )
+            with timings.stage('cnn'):
+                f1, f2 = normalize_(self.run_feature_extractor(batch)).split(len(chunk))
+            with timings.stage('distance'):
+                diffs = channel_distance(f1, f2).numpy()
+            for (y, x), diff in zip(chunk, diffs):
+                if diff.shape != (cell_h, cell_w):
+                    diff = cv2.resize(diff, (cell_w, cell_h))
+                cy, cx = y // stride, x // stride
+                acc[cy:cy + cell_h, cx:cx + cell_w] += diff * window
+                weight[cy:cy + cell_h, cx:cx + cell_w] += window
+
+        cells_h, cells_w = -(-scaled_h // stride), -(-scaled_w // stride)
+        diff_cells = (acc / weight)[:cells_h, :cells_w]
+        diff_cells = np.maximum(diff_cells, 0)
+        diff_cells /= diff_cells.max() + 1e-6  # 0-1
+        # Normalize at feature resolution, upsample once as uint8 (bilinear never
+        # exceeds the extremes, so the max is preserved).
+        diff_uint8 = cv2.resize((diff_cells * 255).astype(np.uint8), (width, height))
+
+        info = {
+            'mode': 'tiled',
+            'tiles': len(origins),
+            'tile_size': cfg.tile_size,
+            'overlap': cfg.overlap,
+            'scale': round(scale, 4),
+        }
+        return diff_uint8, float(np.mean(diff_uint8)) / 255.0, info
+
+    def get_sky_mask(self, image, hsv=None, params=None):
+        params = params or self.default_params
+        if hsv is None:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         # Sky (Bright/Blue)
-        sky_mask1 = cv2.inRange(hsv, self.sky_lower_blue, self.sky_upper_blue)
+        sky_mask1 = cv2.inRange(hsv, np.array(params.sky_blue_hsv_lower), np.array(params.sky_blue_hsv_upper))
         
         # 2. Bright white/grey sky (High value, low saturation)
         # TIGHTENED: Increased sensitivity threshold (less sensitive to grey stones)
         # Stones are usually Grey (Low S, Medium V). Sky is Bright (Low S, High V).
-        # V > 200 (was 255-40=215). Let's make it strict.
-        lower_white = np.array([0, 0, 220]) # Only very bright whites
-        upper_white = np.array([180, 40, 255]) # Low saturation
-        sky_mask2 = cv2.inRange(hsv, lower_white, upper_white)
+        # Only very bright (V >= 220), low saturation whites.
+        sky_mask2 = cv2.inRange(hsv, np.array(params.sky_white_hsv_lower), np.array(params.sky_white_hsv_upper))
         
         return cv2.bitwise_or(sky_mask1, sky_mask2)
 
-    def is_vegetation_or_sky_noise(self, contour, current_img, past_img, diff_map):
-        # Create a mask for the specific contour to ensure we only check the object itself
-        # not the surrounding area in the bounding box.
-        mask = np.zeros(current_img.shape[:2], dtype=np.uint8)
-        cv2.drawContours(mask, [contour], -1, 255, -1)
-        
-        # Calculate mean vegetation measure inside the contour
-        # Vegetation defined as Hue 15-95 (Grass/Green)
+    def compute_noise_masks(self, current_img, past_img, params=None):
+        """
+        Vegetation and sky masks for both frames.  Computed once per image pair
+        and shared by every blob instead of being rebuilt per contour.
+        """
+        params = params or self.default_params
+        grass_lower = np.array(params.grass_hsv_lower)
+        grass_upper = np.array(params.grass_hsv_upper)
         hsv_curr = cv2.cvtColor(current_img, cv2.COLOR_BGR2HSV)
         hsv_past = cv2.cvtColor(past_img, cv2.COLOR_BGR2HSV)
-        
-        # Check vegetation presence strictly inside the contour
-        is_grass_curr = cv2.inRange(hsv_curr, self.grass_lower, self.grass_upper)
-        is_grass_past = cv2.inRange(hsv_past, self.grass_lower, self.grass_upper)
-        
-        # Mean value of the binary mask inside the contour (0-255) -> normalize to 0-1
-        # cv2.mean returns a tuple, take [0]
-        # We assume 'mask' is the domain.
-        veg_ratio_curr = cv2.mean(is_grass_curr, mask=mask)[0] / 255.0
-        veg_ratio_past = cv2.mean(is_grass_past, mask=mask)[0] / 255.0
-        
-        # BUG FIX: Previous logic used Bounding Box (w*h). Small stone in big grass box = High Veg Ratio.
-        # Now we use exact contour. 
-        # If a stone (Veg=0) changes to Grass (Veg=1) -> Ratio Past=0, Curr=1 -> Keep.
-        # If Grass changes to Grass (Seasonal) -> Ratio Past=1, Curr=1 -> Ignore.
-        # Threshold: if > 70% of the *changed pixels* are vegetation in BOTH times, it's seasonal.
-        if veg_ratio_curr > 0.70 and veg_ratio_past > 0.70:
-            return True 
-            
-        # 2. Sky Noise Check (Same logic with contour mask)
-        mask_sky_curr = self.get_sky_mask(current_img)
-        mask_sky_past = self.get_sky_mask(past_img)
-        
-        sky_ratio_curr = cv2.mean(mask_sky_curr, mask=mask)[0] / 255.0
-        sky_ratio_past = cv2.mean(mask_sky_past, mask=mask)[0] / 255.0
-        
-        # If it's mostly sky in BOTH images, it's just background noise (clouds)
-        if sky_ratio_curr > 0.70 and sky_ratio_past > 0.70:
-            return True 
-            
-        return False
+        return {
+            'veg_curr': cv2.inRange(hsv_curr, grass_lower, grass_upper),
+            'veg_past': cv2.inRange(hsv_past, grass_lower, grass_upper),
+            'sky_curr': self.get_sky_mask(current_img, hsv_curr, params),
+            'sky_past': self.get_sky_mask(past_img, hsv_past, params),
+        }
+
+    def measure_blobs(self, contours, diff_map, noise_masks):
+        """
+        Per-blob statistics for every contour in a single pass.
+
+        Each filled contour is rasterised into one int32 label image (external
+        contours never overlap), then every mask is reduced per label with
+        np.bincount over the labelled pixels only.  Ratios are computed the
+        same way as cv2.mean(mask=...) so results match the per-contour path.
+
+        Returns a dict of arrays indexed by contour position: 'pixels',
+        'veg_curr', 'veg_past', 'sky_curr', 'sky_past' (0-1 ratios) and
+        'diff' (mean diff intensity, 0-255).
+        """
+        n = len(contours)
+        labels = np.zeros(diff_map.shape[:2], dtype=np.int32)
+        for i in range(n):
+            cv2.drawContours(labels, contours, i, i + 1, -1)
+
+        flat = labels.ravel()
+        idx = np.flatnonzero(flat)
+        blob = flat[idx]
+        pixels = np.bincount(blob, minlength=n + 1)[1:].astype(np.float64)
+        inv = np.divide(1.0, pixels, out=np.zeros_like(pixels), where=pixels > 0)
+
+        def blob_mean(values):
+            sums = np.bincount(blob, weights=values.ravel()[idx], minlength=n + 1)[1:]
+            return sums * inv
+
+        stats = {'pixels': pixels, 'diff': blob_mean(diff_map)}
+        for name, mask in noise_masks.items():
+            stats[name] = blob_mean(mask) / 255.0
+        return stats
+
+    def noise_blob_mask(self, stats, params=None):
+        """
+        Boolean array flagging blobs that are seasonal vegetation or sky noise.
+
+        We use the exact contour, not its bounding box (a small stone in a big
+        grass box would otherwise read as vegetation).
+        If a stone (Veg=0) changes to Grass (Veg=1) -> Ratio Past=0, Curr=1 -> Keep.
+        If Grass changes to Grass (Seasonal) -> Ratio Past=1, Curr=1 -> Ignore.
+        Threshold: if > 70% (params.noise_ratio) of the *changed pixels* are vegetation
+        in BOTH times, it's seasonal.
+        Same logic for sky: mostly sky in BOTH images is background noise (clouds).
+        """
+        ratio = (params or self.default_params).noise_ratio
+        vegetation = (stats['veg_curr'] > ratio) & (stats['veg_past'] > ratio)
+        sky = (stats['sky_curr'] > ratio) & (stats['sky_past'] > ratio)
+        return vegetation | sky
 
     def _convert_to_serializable(self, obj):
         if isinstance(obj, np.integer):
@@ -266,120 +620,225 @@ class StructuralChangeDetector:
             return tuple(self._convert_to_serializable(i) for i in obj)
         return obj
         
-    def update_thresholds_from_history(self, false_positive_rate):
+    def thresholds_from_history(self, false_positive_rate, params=None):
         """
-        ML Feedback Loop Adaptation: The user trains the model via UI verification.
-        If a specific fort has a high rate of False Positives reported by the Admin, 
-        the threshold for 'significant change' is dynamically scaled upwards. 
-        This teaches the model to ignore artifact noise and 'perfect' its precision over time.
+        Return DetectionParams tuned by a fort's historical false positive rate.
+        The detector itself is left untouched so concurrent calls cannot race.
         """
-        # Base k=0.0 is hyper-sensitive. A 50% FP rate translates to k=1.5
-        # Require feature differences to be 1.5 standard deviations above mean to detect anything.
-        self.k_factor = min(2.5, false_positive_rate * 3.0)
+        params = (params or self.default_params).with_false_positive_rate(false_positive_rate)
         logger.info(
             "ML Auto-Tuner: Adjusted k_factor to %.2f based on %.1f%% historical false positive rate.",
-            self.k_factor,
+            params.k_factor,
             false_positive_rate * 100,
         )
+        return params
 
-    def detect_structural_changes(self, past_img, current_img, temp=None, humidity=None, wind_speed=None):
+    def detect_structural_changes(self, past_img, current_img, temp=None, humidity=None, wind_speed=None,
+                                  past_image_id=None, current_image_id=None, params=None,
+                                  normalized_homography=None):
+        """
+        Compare two BGR frames.  `normalized_homography` (past -> current in
+        0-1 image coordinates, e.g. composed from stored registrations, see
+        registration.py) skips feature matching; otherwise the pair is
+        aligned with estimate_homography.
+        """
+        params = params or self.default_params
         # 1. Ensure same size (resize past to current)
         if past_img.shape != current_img.shape:
             h, w = min(past_img.shape[0], current_img.shape[0]), min(past_img.shape[1], current_img.shape[1])
             past_img = cv2.resize(past_img, (w, h))
             current_img = cv2.resize(current_img, (w, h)) 
             
+        # Derived resolutions (1000 px for matching, the CNN input) are shared between stages.
+        past, current = ImagePyramid(past_img), ImagePyramid(current_img)
+
         # 2. Align
-        past_aligned, current_aligned = self.align_images(past_img, current_img)
+        align_start = time.perf_counter()
+        with timings.stage('align'):
+            if normalized_homography is not None:
+                frame = np.diag([current_img.shape[1], current_img.shape[0], 1.0])
+                M = frame @ np.asarray(normalized_homography, dtype=np.float64) @ np.linalg.inv(frame)
+                alignment = {'method': 'registered'}
+            else:
+                M, report = self.estimate_alignment(past, current)
+                alignment = {'method': 'pairwise' if M is not None else 'none', **report}
+        alignment['seconds'] = round(time.perf_counter() - align_start, 4)
+
+        # 2b. Pre-screen: near-identical pairs are SAFE without the CNN
+        screen = None
+        if self.prescreen is not None:
+            screen_start = time.perf_counter()
+            with timings.stage('prescreen'):
+                screen = screen_pair(past, current, self.prescreen, M)
+            screen['seconds'] = round(time.perf_counter() - screen_start, 4)
+            if screen['passed']:
+                # The reported SSIM stays on the SSIMConfig scale of full analyses;
+                # the screen's own (low-resolution) value is kept under 'screen'.
+                with timings.stage('warp'):
+                    past_aligned, _ = self.align_images(past_img, current_img, M)
+                past_view = past if past_aligned is past_img else past_aligned
+                with timings.stage('ssim'):
+                    ssim_val = self._reported_ssim(past_view, current)
+                return self._package_results(
+                    [], 0.0, ssim_val, params, temp, humidity, wind_speed,
+                    screened=True, screen=screen, feature_cache={'enabled': False},
+                    deep_diff={'mode': 'screened'}, alignment=alignment,
+                )
+
+        with timings.stage('warp'):
+            past_aligned, current_aligned = self.align_images(past_img, current_img, M)
+        past_view = past if past_aligned is past_img else past_aligned
         
         # 3. Deep Feature Difference
-        diff_map, global_diff_score = self.get_deep_feature_difference(past_aligned, current_aligned)
+        cache_info = {'enabled': False}
+        deep_diff_info = {'mode': 'resize', 'input_size': list(self.input_size)}
+        with timings.stage('deep_diff'):
+            if self.use_tiling(current_img):
+                # Native-resolution tiles; their maps are too large to cache.
+                diff_map, global_diff_score, deep_diff_info = self.get_tiled_feature_difference(
+                    past_aligned, current_aligned
+                )
+            elif self.feature_store is not None and past_image_id is not None and current_image_id is not None:
+                # The current image is never warped, so its map is always reusable as
+                # the "previous" map of the next analysis.  The stored past map only
+                # applies when alignment leaves the past image (almost) untouched.
+                f_curr, _ = self.get_cached_features(current_image_id, current)
+                past_reusable = self.is_near_identity(M, (current_img.shape[1], current_img.shape[0]))
+                if past_reusable:
+                    past_aligned, past_view = past_img, past
+                    f_past, past_hit = self.get_cached_features(past_image_id, past)
+                else:
+                    f_past, past_hit = self.encode_image(past_aligned), False
+                diff_map, global_diff_score = self.get_deep_feature_difference(
+                    past_view, current, f1=f_past, f2=f_curr
+                )
+                cache_info = {
+                    'enabled': True,
+                    'past_hit': past_hit,
+                    'past_reusable': past_reusable,
+                    **self.feature_store.stats(),
+                }
+            else:
+                diff_map, global_diff_score = self.get_deep_feature_difference(past_view, current)
         
         # 4. Adaptive Thresholding
+        with timings.stage('contours'):
+            diff_binary, _ = self.threshold_diff_map(diff_map, params)
+
+            # REMOVED Morphological cleanup (Erosion/Opening/Closing)
+            # This allows "Raw" detections of even single-pixel features in the map.
+            # User requested "each and every change".
+
+            # 6. Contour Detection & Smart Filtering
+            contours, _ = cv2.findContours(diff_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        # Smart Filter: vegetation/sky masks once per pair, per-blob stats in one pass
+        with timings.stage('blob_filter'):
+            noise_masks = self.compute_noise_masks(current_aligned, past_aligned, params)
+            blob_stats = self.measure_blobs(contours, diff_map, noise_masks)
+            is_noise = self.noise_blob_mask(blob_stats, params)
+
+            detections = []
+            for i, cnt in enumerate(contours):
+                area = cv2.contourArea(cnt)
+                # Ultra-sensitive: catch even tiny crumbs (10px by default)
+                if area < params.min_blob_area: 
+                    continue
+
+                # Skip blobs that are just vegetation or sky noise
+                if is_noise[i]:
+                    continue
+
+                x, y, w, h = cv2.boundingRect(cnt)
+
+                # Confidence
+                mean_diff_intensity = blob_stats['diff'][i] / 255.0 
+
+                confidence = min(1.0, mean_diff_intensity * 1.5)
+
+                # Severity Classification
+                severity = "Minor"
+                if area > 5000:
+                    severity = "Critical"
+                elif area > 1000 or confidence > 0.8:
+                    severity = "Moderate"
+
+                detections.append({
+                    'bbox': (int(x), int(y), int(w), int(h)),
+                    'area': float(area),
+                    'confidence': float(confidence),
+                    'severity': severity,
+                    'centroid': (int(x + w//2), int(y + h//2))
+                })
+
+        # 7. Cluster Detections
+        with timings.stage('cluster'):
+            clustered_detections = self.cluster_detections(detections)
+        
+        # Calculate SSIM (at the analysis resolution, from the shared pyramid levels)
+        with timings.stage('ssim'):
+            ssim_val = self._reported_ssim(past_view, current)
+        
+        # 8. Risk Assessment & Climate Stress Calculation
+        return self._package_results(
+            clustered_detections, global_diff_score, ssim_val, params, temp, humidity, wind_speed,
+            screened=False, screen=screen, feature_cache=cache_info, deep_diff=deep_diff_info,
+            alignment=alignment,
+        )
+
+    def threshold_diff_map(self, diff_map, params):
+        """
+        Binary change map of a 0-255 difference map and the threshold used,
+        on the 0-1 scale of params.min_threshold / max_threshold (see
+        DetectionParams.scaled_threshold for the scale of the statistics).
+        """
         mean_diff = np.mean(diff_map)
         std_diff = np.std(diff_map)
-        
-        # Lower k to 1.0 for        # k=0 means we detect anything above the average difference.
+        if params.scaled_threshold:
+            # Statistics on the 0-1 scale the threshold bounds are given in
+            mean_diff /= 255.0
+            std_diff /= 255.0
+
+        # k=0 means we detect anything above the average difference.
         # This is 'Raw' sensitivity.
-        k = self.k_factor
-        adaptive_thresh = mean_diff + (k * std_diff)
-        
-        # Cap max threshold at 0.30 to force detection
-        final_thresh = max(0.15, min(adaptive_thresh, 0.30))
-        
+        adaptive_thresh = mean_diff + (params.k_factor * std_diff)
+
+        # Cap max threshold (0.30 by default) to force detection
+        final_thresh = max(params.min_threshold, min(adaptive_thresh, params.max_threshold))
+
         _, diff_binary = cv2.threshold(diff_map, int(final_thresh * 255), 255, cv2.THRESH_BINARY)
-        
-        # REMOVED Morphological cleanup (Erosion/Opening/Closing)
-        # This allows "Raw" detections of even single-pixel features in the map.
-        # User requested "each and every change".
-        
-        # 6. Contour Detection & Smart Filtering
-        contours, _ = cv2.findContours(diff_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        detections = []
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            # Ultra-sensitive: catch even tiny crumbs (10px)
-            if area < 10: 
-                continue
-                
-            # Smart Filter: Check if this specific blob is just vegetation or sky noise
-            if self.is_vegetation_or_sky_noise(cnt, current_aligned, past_aligned, diff_map):
-                continue
-                
-            x, y, w, h = cv2.boundingRect(cnt)
-            
-            # Confidence
-            mask_roi = np.zeros_like(diff_map)
-            cv2.drawContours(mask_roi, [cnt], -1, 1, -1)
-            mean_diff_intensity = cv2.mean(diff_map, mask=mask_roi)[0] / 255.0 
-            
-            confidence = min(1.0, mean_diff_intensity * 1.5)
-            
-            # Severity Classification
-            severity = "Minor"
-            if area > 5000:
-                severity = "Critical"
-            elif area > 1000 or confidence > 0.8:
-                severity = "Moderate"
-                
-            detections.append({
-                'bbox': (int(x), int(y), int(w), int(h)),
-                'area': float(area),
-                'confidence': float(confidence),
-                'severity': severity,
-                'centroid': (int(x + w//2), int(y + h//2))
-            })
+        return diff_binary, final_thresh
 
-        # 7. Cluster Detections
-        clustered_detections = self.cluster_detections(detections)
-        
-        # Calculate SSIM
-        gray_past = cv2.cvtColor(past_aligned, cv2.COLOR_BGR2GRAY)
-        gray_current = cv2.cvtColor(current_aligned, cv2.COLOR_BGR2GRAY)
+    def _reported_ssim(self, past_view, current):
         try:
-            ssim_val = ssim(gray_past, gray_current)
+            return pair_ssim(past_view, current, self.ssim)
         except Exception:
-            ssim_val = 0.5 
-        
-        # 8. Risk Assessment & Climate Stress Calculation
-        risk_assessment = self.assess_risk(clustered_detections, global_diff_score, temp, humidity, wind_speed)
+            return 0.5
+
+    def _package_results(self, detections, global_diff_score, ssim_val, params, temp, humidity, wind_speed,
+                         **sections):
+        """Risk assessment and the serializable results dict shared by screened and full analyses."""
+        with timings.stage('risk'):
+            risk_assessment = self.assess_risk(detections, global_diff_score, temp, humidity, wind_speed)
 
         # Overall detection confidence: average of per-detection confidences (0–100 %)
-        if clustered_detections:
-            overall_confidence = float(
-                sum(d['confidence'] for d in clustered_detections) / len(clustered_detections)
-            )
+        if detections:
+            overall_confidence = float(sum(d['confidence'] for d in detections) / len(detections))
         else:
             overall_confidence = 0.0
-        
+
+        if sections.get('screen') is None:
+            sections.pop('screen', None)
         results = {
             'cnn_distance': float(global_diff_score),
             'ssim_score': float(ssim_val),
             'overall_confidence': round(overall_confidence * 100, 1),  # percentage
-            'detections': clustered_detections,
+            'detections': detections,
             'risk_assessment': risk_assessment,
-            'total_changes': len(clustered_detections),
+            'total_changes': len(detections),
+            **sections,
+            'parameters': params.to_dict(),
+            'profile': self.profile.name,
             # Phase 3 data export
             'environmental_data': {
                 'temperature': temp,
@@ -389,63 +848,27 @@ class StructuralChangeDetector:
                 'final_heritage_risk_score': risk_assessment.get('final_heritage_score', 0.0)
             }
         }
-        
         return self._convert_to_serializable(results)
 
     def cluster_detections(self, detections):
         if len(detections) < 2:
             return detections
-        
-        # Simple merging based on distance
-        # DBSCAN is good, but let's be robust
+        if self.config['cluster_min_samples'] <= 1:
+            # Same clusters as DBSCAN(min_samples=1), on a grid (see clustering.py)
+            return clustering.cluster_detections(detections, self.config['cluster_eps'])
+
+        # Core-point clustering leaves noise; only scikit-learn's DBSCAN does that
+        from sklearn.cluster import DBSCAN
+
         centroids = np.array([det['centroid'] for det in detections])
-        try:
-            clustering = DBSCAN(eps=self.config['cluster_eps'], min_samples=self.config['cluster_min_samples'])
-            cluster_labels = clustering.fit_predict(centroids)
-            
-            merged = []
-            unique_labels = set(cluster_labels)
-            
-            for label in unique_labels:
-                if label == -1: # Noise (shouldn't happen with min_samples=1)
-                    for idx in np.where(cluster_labels == -1)[0]:
-                        merged.append(detections[idx])
-                else:
-                    indices = np.where(cluster_labels == label)[0]
-                    cluster_members = [detections[i] for i in indices]
-                    merged.append(self.merge_group(cluster_members))
-            return merged
-        except Exception:
-            return detections # Fallback
-            
-    def merge_group(self, members):
-        x1 = min(d['bbox'][0] for d in members)
-        y1 = min(d['bbox'][1] for d in members)
-        x2 = max(d['bbox'][0] + d['bbox'][2] for d in members)
-        y2 = max(d['bbox'][1] + d['bbox'][3] for d in members)
-        
-        area = sum(d['area'] for d in members)
-        conf = max(d['confidence'] for d in members) # Take max confidence
-        
-        # Merged severity logic: take the highest severity in the group
-        severities = [d.get('severity', 'Minor') for d in members]
-        if "Critical" in severities:
-            final_severity = "Critical"
-        elif "Moderate" in severities:
-            final_severity = "Moderate"
-        else:
-            final_severity = "Minor"
-            
-        # Re-evaluate based on total area?
-        if area > 5000: final_severity = "Critical"
+        labels = DBSCAN(eps=self.config['cluster_eps'], min_samples=self.config['cluster_min_samples']).fit_predict(centroids)
+        core = [d for d, label in zip(detections, labels) if label != -1]
+        noise = [d for d, label in zip(detections, labels) if label == -1]
+        merged = clustering.merge_clusters(core, labels[labels != -1]) if core else []
+        return merged + noise
 
-        return {
-            'bbox': (x1, y1, x2-x1, y2-y1),
-            'area': area,
-            'confidence': conf,
-            'severity': final_severity,
-            'centroid': ((x1+x2)//2, (y1+y2)//2)
-        }
+    def merge_group(self, members):
+        return clustering.merge_clusters(members, np.zeros(len(members), dtype=int))[0]
 
     def assess_risk(self, detections, global_diff_score, temp=None, humidity=None, wind_speed=None):
         change_count = len(detections)
@@ -545,43 +968,7 @@ class StructuralChangeDetector:
         }
 
     def visualize_results(self, current_img, results):
-        out = current_img.copy()
-        
-        # Colors: Green(Safe) -> Yellow -> Orange -> Red
-        colors = {
-            'SAFE': (0, 255, 0),
-            'LOW': (0, 255, 255), 
-            'MEDIUM': (0, 165, 255),
-            'HIGH': (0, 0, 255),
-            'CRITICAL': (0, 0, 128)
-        }
-        level = results['risk_assessment']['level']
-        color = colors.get(level, (0,255,0))
-        
-        # Draw bounding boxes
-        for i, det in enumerate(results['detections']):
-            x, y, w, h = det['bbox']
-            # Semi-transparent overlay
-            overlay = out.copy()
-            cv2.rectangle(overlay, (x,y), (x+w, y+h), color, -1)
-            cv2.addWeighted(overlay, 0.3, out, 0.7, 0, out)
-            
-            # Border
-            cv2.rectangle(out, (x,y), (x+w, y+h), color, 2)
-            
-            # Label
-            label = f"#{i+1} Conf:{det['confidence']:.2f}"
-            cv2.putText(out, label, (x, y-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            
-        # Dashboard UI on image
-        cv2.rectangle(out, (0,0), (300, 100), (0,0,0), -1)
-        cv2.putText(out, f"Risk: {level}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-        cv2.putText(out, f"Changes: {results['total_changes']}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 1)
-        score_text = f"Global Score: {results['cnn_distance']:.2f}"
-        cv2.putText(out, score_text, (10, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200,200,200), 1)
-        
-        return out
+        return render_annotation(current_img, results, self.annotation.max_side)
 
     def save_annotated_image(self, annotated_img):
-        _, buffer = cv2.imencode('.png', annotated_img)
-        return ContentFile(buffer.tobytes())
+        return ContentFile(encode_annotation(annotated_img, self.annotation), name=f'annotated{self.annotation.extension}')
@@ -1,3 +1,1161 @@
-from django.test import TestCase
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+import tifffile
+import torch
+import torch.nn as nn
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from prometheus_client import multiprocess
+from rest_framework.test import APIClient
+
+from benchmarks import bench_detector
+from benchmarks.synthetic import make_pair
+
+from . import detector_singleton, metrics
+from .alignment import MIN_LSH_DESCRIPTORS, ratio_matches
+from .analysis_jobs import claim_next_job, process_job, requeue_stale_jobs, run_structural_analysis
+from .annotation import AnnotationConfig, encode, render
+from .backbones import load_bundle, save_bundle, trunk_from_torchvision
+from .clustering import connected_components
+from .feature_cache import FeatureStore
+from .image_hashes import hamming, to_hex
+from .inference_backends import load_int8, quantize_int8, save_int8
+from .image_pyramid import ImagePyramid, decode_image
+from .inference_batcher import MicroBatcher
+from .models import AnalysisJob, Fort, FortImage, StructuralAnalysis
+from .orthomosaic import MosaicReader, analyze_orthomosaic
+from .preprocessing import channel_distance, fill_batch, new_batch
+from .prescreen import perceptual_hash
+from .registration import pair_homography, register_image
+from .ssim import SSIMConfig, pair_ssim, structural_similarity
+from .structural_detector import DetectionParams, StructuralChangeDetector
+from .timings import recording, stage, summary, reset as reset_timings
+
+
+def make_detector_without_model(**kwargs):
+    with mock.patch.object(StructuralChangeDetector, 'setup_cnn_model'):
+        return StructuralChangeDetector(**kwargs)
+
+
+def make_detector_with_tiny_model(**kwargs):
+    # Stride-8 random conv stands in for the ResNet trunk (no weight download).
+    detector = make_detector_without_model(**kwargs)
+    torch.manual_seed(0)
+    detector.feature_extractor = nn.Sequential(nn.Conv2d(3, 16, 8, stride=8), nn.ReLU()).eval()
+    return detector
+
+
+def make_scene(seed=0):
+    rng = np.random.default_rng(seed)
+    past = cv2.resize(rng.integers(0, 255, (24, 32, 3), dtype=np.uint8), (320, 240), interpolation=cv2.INTER_NEAREST)
+    current = past.copy()
+    cv2.rectangle(current, (60, 60), (120, 110), (40, 40, 40), -1)
+    current[150:200, 200:280] = (40, 160, 50)
+    return past, current
+
+
+def make_ground(seed=1):
+    # 800 x 600 blocky texture with enough corners for keypoint matching
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 255, (45, 60, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(blocks, (800, 600), interpolation=cv2.INTER_NEAREST), (3, 3), 0)
+
+
+def corner_error(M, expected, size=(800, 600)):
+    w, h = size
+    corners = np.float32([[[0.1 * w, 0.1 * h]], [[0.9 * w, 0.1 * h]], [[0.9 * w, 0.9 * h]], [[0.1 * w, 0.9 * h]]])
+    return np.abs(cv2.perspectiveTransform(corners, M) - cv2.perspectiveTransform(corners, expected)).max()
+
+
+class TiledDifferenceTests(SimpleTestCase):
+    def test_tiles_localize_change_within_budget(self):
+        detector = make_detector_with_tiny_model()
+        past, current = make_scene()
+        detector.enable_tiling(tile_size=128, overlap=32, batch_size=3, max_tiles=100)
+
+        diff, mean_diff, info = detector.get_tiled_feature_difference(past, current)
+        self.assertEqual(diff.shape, past.shape[:2])
+        self.assertEqual((info['tiles'], info['scale']), (9, 1.0))  # 3 x 3 at step 96
+        self.assertGreater(mean_diff, 0)
+        changed = np.zeros(diff.shape, dtype=bool)
+        changed[60:110, 60:120] = changed[150:200, 200:280] = True
+        self.assertGreater(diff[changed].mean(), 4 * diff[~changed].mean())
+
+        detector.enable_tiling(tile_size=128, overlap=32, max_tiles=2)
+        diff, _, info = detector.get_tiled_feature_difference(past, current)
+        self.assertEqual(diff.shape, past.shape[:2])
+        self.assertLessEqual(info['tiles'], 2)
+        self.assertLess(info['scale'], 1.0)
+
+        with self.assertRaises(ValueError):
+            detector.enable_tiling(tile_size=100)
+
+
+class ImagePyramidTests(SimpleTestCase):
+    def test_jpeg_decodes_at_reduced_scale(self):
+        past, _ = make_scene()
+        photo = cv2.resize(past, (1600, 1200), interpolation=cv2.INTER_LINEAR)
+        jpeg = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+        png = cv2.imencode('.png', photo)[1].tobytes()
+
+        with mock.patch('home.image_pyramid.cv2.imdecode', wraps=cv2.imdecode) as imdecode:
+            small = decode_image(jpeg, max_side=400)
+            self.assertEqual(imdecode.call_args[0][1], cv2.IMREAD_REDUCED_COLOR_4)
+            self.assertEqual(decode_image(png, max_side=400).shape, (300, 400, 3))
+            self.assertEqual(imdecode.call_args[0][1], cv2.IMREAD_COLOR)
+        self.assertEqual(decode_image(jpeg).shape, (1200, 1600, 3))
+
+        reference = cv2.resize(photo, (400, 300), interpolation=cv2.INTER_AREA)
+        self.assertEqual(small.shape, reference.shape)
+        self.assertLess(np.abs(small.astype(int) - reference).mean(), 4)
+
+    def test_levels_are_cached_and_derived_from_nearest_level(self):
+        past, _ = make_scene()
+        pyramid = ImagePyramid(past)
+        self.assertIs(pyramid.fit(1000), past)  # already small enough
+        with mock.patch('home.image_pyramid.cv2.resize', wraps=cv2.resize) as resize:
+            half = pyramid.fit(160)
+            self.assertIs(pyramid.resized((160, 120)), half)
+            quarter = pyramid.fit(80)
+        self.assertEqual(quarter.shape, (60, 80, 3))
+        self.assertEqual([call[0][0].shape for call in resize.call_args_list], [(240, 320, 3), (120, 160, 3)])
+        self.assertFalse(half.flags.writeable)
+
+
+def geotags(origin_x, origin_y, pixel_size=0.5):
+    return [(33550, 'd', 3, (pixel_size, pixel_size, 0.0)), (33922, 'd', 6, (0, 0, 0, origin_x, origin_y, 0))]
+
+
+class OrthomosaicTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_regions_match_array_for_every_layout(self):
+        rgb = np.random.default_rng(0).integers(0, 255, (150, 170, 3), dtype=np.uint8)
+        rgba = np.dstack([rgb, np.full(rgb.shape[:2], 255, np.uint8)])
+        rgba[:10, :10, 3] = 0
+        layouts = {
+            'tiled': (rgb, {'tile': (64, 64), 'compression': 'zlib'}),
+            'strips': (rgb, {'rowsperstrip': 7, 'compression': 'zlib'}),
+            'planar': (rgb.transpose(2, 0, 1), {'planarconfig': 'separate', 'photometric': 'rgb', 'tile': (32, 32)}),
+            'memmap': (rgb, {}),
+            'alpha': (rgba, {'tile': (64, 64), 'extrasamples': ['unassalpha']}),
+        }
+        expected = np.zeros((170, 200, 3), dtype=np.uint8)
+        expected[10:160, 15:185] = rgb[..., ::-1]
+        expected_alpha = expected.copy()
+        expected_alpha[10:20, 15:25] = 0
+        for name, (data, kwargs) in layouts.items():
+            with self.subTest(name):
+                path = f"{self.tmp.name}/{name}.tif"
+                tifffile.imwrite(path, data, **kwargs)
+                with MosaicReader(path) as reader:
+                    self.assertEqual(reader._array is not None, name == 'memmap')
+                    # Straddles all four edges and several segments.
+                    region = reader.read_region(-10, -15, 170, 200)
+                    interior = reader.read_region(40, 50, 33, 70)
+                np.testing.assert_array_equal(region, expected_alpha if name == 'alpha' else expected)
+                np.testing.assert_array_equal(interior, rgb[40:73, 50:120, ::-1])
+
+    def test_streams_georeferenced_pair_and_merges_across_tiles(self):
+        rng = np.random.default_rng(0)
+        ground = cv2.resize(rng.integers(0, 255, (40, 54, 3), dtype=np.uint8), (440, 340),
+                            interpolation=cv2.INTER_NEAREST)
+        past = ground[:300, :400]
+        # Current flight starts 8 rows / 16 columns further into the ground
+        current = ground[8:308, 16:416].copy()
+        cv2.rectangle(current, (100, 100), (150, 140), (40, 40, 40), -1)  # spans four tiles
+        tifffile.imwrite(f"{self.tmp.name}/past.tif", past[..., ::-1], tile=(64, 64), compression='zlib',
+                         extratags=geotags(100.0, 500.0))
+        tifffile.imwrite(f"{self.tmp.name}/current.tif", current[..., ::-1], rowsperstrip=7, compression='zlib',
+                         extratags=geotags(108.0, 496.0))
+
+        results, overview = analyze_orthomosaic(
+            make_detector_with_tiny_model(), f"{self.tmp.name}/past.tif", f"{self.tmp.name}/current.tif",
+            tile_size=128, overlap=32, overview_size=200,
+        )
+        self.assertEqual(results['deep_diff']['offset'], [8, 16])
+        self.assertEqual(results['deep_diff']['tiles'], 12)
+        # One change, in mosaic coordinates, despite four tiles seeing parts of it
+        # and the uncovered strip of the past mosaic.
+        self.assertEqual(results['total_changes'], 1)
+        x, y, w, h = results['detections'][0]['bbox']
+        self.assertLessEqual(abs(x - 100) + abs(y - 100) + abs(x + w - 151) + abs(y + h - 141), 8)
+        self.assertEqual(overview.shape, (150, 200, 3))
+
+
+class FeatureStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_round_trip_is_fp16_memmap(self):
+        store = FeatureStore(self.tmp.name)
+        store.put('1-abc', np.ones((1, 4, 8, 8), dtype=np.float32))
+
+        cached = store.get('1-abc')
+        self.assertIsInstance(cached, np.memmap)
+        self.assertEqual(cached.dtype, np.float16)
+        self.assertIsNone(store.get('2-abc'))
+        self.assertEqual((store.hits, store.misses), (1, 1))
+
+    def test_partial_detector_config_keeps_cache_defaults(self):
+        detector = make_detector_without_model(config={'cluster_eps': 30})
+        self.assertEqual(detector.config['cluster_eps'], 30)
+        self.assertTrue(detector.is_near_identity(np.eye(3), (800, 600)))
+        shifted = np.float32([[1, 0, 40], [0, 1, 0], [0, 0, 1]])
+        self.assertFalse(detector.is_near_identity(shifted, (800, 600)))
+
+    def test_evicts_least_recently_used_by_count_and_size(self):
+        store = FeatureStore(self.tmp.name, max_entries=2)
+        feat = np.zeros((1, 4, 8, 8), dtype=np.float32)
+        store.put('a', feat)
+        store.put('b', feat)
+        store.get('a')
+        store.put('c', feat)
+        self.assertIsNone(store.get('b'))
+        self.assertIsNotNone(store.get('a'))
+
+        entry_bytes = store.stats()['bytes'] // 2
+        small = FeatureStore(self.tmp.name, max_entries=10, max_bytes=entry_bytes)
+        self.assertEqual(small.stats()['entries'], 1)
+        self.assertEqual(small.evictions, 1)
+
+
+class BackboneBundleTests(SimpleTestCase):
+    def test_bundle_reproduces_torchvision_trunk(self):
+        torch.manual_seed(0)
+        reference = trunk_from_torchvision(None).eval()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/resnet50_layer2.pt"
+            save_bundle(reference, path, 'test-weights')
+            trunk, metadata = load_bundle(path)
+
+            detector = make_detector_without_model(weights_path=path)
+            StructuralChangeDetector.setup_cnn_model(detector)
+            self.assertEqual(detector.backbone_weights, 'test-weights')
+
+        self.assertEqual(metadata['layer'], 'layer2')
+        image = torch.randn(1, 3, 64, 64)
+        with torch.no_grad():
+            self.assertTrue(torch.equal(trunk(image), reference(image)))
+
+
+class InferenceBackendTests(SimpleTestCase):
+    def test_int8_trunk_round_trips_and_tracks_fp32(self):
+        torch.manual_seed(0)
+        trunk = nn.Sequential(nn.Conv2d(3, 16, 8, stride=8), nn.ReLU()).eval()
+        calibration = [torch.rand(2, 3, 64, 64) for _ in range(4)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/int8.pt"
+            save_int8(quantize_int8(trunk, calibration, (64, 64)), path, 'test-weights', 8)
+            module, metadata = load_int8(path)
+
+            detector = make_detector_without_model(backend='int8', int8_path=path)
+            eager_fingerprint = make_detector_without_model().feature_fingerprint()
+            with mock.patch.object(StructuralChangeDetector, 'load_fp32_trunk') as load_fp32:
+                StructuralChangeDetector.setup_cnn_model(detector)
+            load_fp32.assert_not_called()
+
+        self.assertEqual(metadata['calibration_images'], 8)
+        self.assertEqual(detector.backbone_weights, 'test-weights')
+        self.assertNotEqual(detector.feature_fingerprint(), eager_fingerprint)
+        image = torch.rand(1, 3, 64, 64)
+        with torch.no_grad():
+            expected = trunk(image)
+            error = (module(image) - expected).abs().max()
+        self.assertLess(error, 0.05 * expected.abs().max())
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            make_detector_without_model(backend='onnx')
+
+
+class LazyDetectorTests(SimpleTestCase):
+    def test_web_process_does_not_import_ml_stack(self):
+        probe = (
+            "import os, sys, django; os.environ['PROCESS_ROLE'] = 'web'; "
+            "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings'); "
+            "django.setup(); import home.urls; "
+            "print(sorted(m for m in ('torch', 'cv2', 'sklearn', 'skimage') if m in sys.modules))"
+        )
+        out = subprocess.run(
+            [sys.executable, '-c', probe], check=True, capture_output=True, text=True, cwd=settings.BASE_DIR
+        )
+        self.assertEqual(out.stdout.strip().splitlines()[-1], '[]')
+
+    @override_settings(DETECTION_PROFILE='balanced')
+    def test_proxy_builds_detector_once_per_profile_on_first_use(self):
+        with mock.patch.dict(detector_singleton._detectors, clear=True), \
+                mock.patch.object(detector_singleton, '_build_detector', side_effect=lambda p: FakeDetector()) as build:
+            self.assertFalse(detector_singleton.is_loaded())
+            self.assertEqual(detector_singleton.detector_instance.thresholds_from_history(0.0), None)
+            default = detector_singleton.get_detector()
+            self.assertIs(detector_singleton.get_detector('balanced'), default)
+            self.assertIsNot(detector_singleton.get_detector('fast'), default)
+            self.assertEqual([c.args for c in build.call_args_list], [('balanced',), ('fast',)])
+
+    def test_share_for_fork_moves_weights_to_shared_memory(self):
+        detector = make_detector_with_tiny_model()
+        detector.enable_batching(max_batch_size=4, max_wait_ms=2.0)
+        original_batcher = detector.batcher
+        self.addCleanup(original_batcher.close)
+        with mock.patch.dict(detector_singleton._detectors, {'accurate': detector}, clear=True):
+            self.addCleanup(gc.unfreeze)
+            self.assertIs(detector_singleton.share_for_fork(), detector)
+            self.assertGreater(gc.get_freeze_count(), 0)
+            self.assertTrue(all(p.is_shared() for p in detector.feature_extractor.parameters()))
+
+            detector_singleton.after_fork()
+        self.addCleanup(detector.batcher.close)
+        self.assertIsNot(detector.batcher, original_batcher)
+        self.assertEqual(detector.batcher.max_batch_size, 4)
+
+
+class BlobFilteringTests(SimpleTestCase):
+    def test_measure_blobs_matches_per_contour_masks(self):
+        detector = make_detector_without_model()
+        rng = np.random.default_rng(7)
+        current = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        past = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        diff_map = np.zeros((240, 320), dtype=np.uint8)
+        for _ in range(60):
+            center = (int(rng.integers(0, 320)), int(rng.integers(0, 240)))
+            cv2.circle(diff_map, center, int(rng.integers(1, 12)), int(rng.integers(40, 255)), -1)
+        cv2.rectangle(diff_map, (100, 100), (160, 150), 200, 3)  # ring with a hole
+        contours, _ = cv2.findContours(diff_map, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        masks = detector.compute_noise_masks(current, past)
+        stats = detector.measure_blobs(contours, diff_map, masks)
+
+        for i, cnt in enumerate(contours):
+            mask = np.zeros(diff_map.shape, dtype=np.uint8)
+            cv2.drawContours(mask, [cnt], -1, 255, -1)
+            for name, noise in masks.items():
+                self.assertEqual(stats[name][i], cv2.mean(noise, mask=mask)[0] / 255.0)
+            self.assertEqual(stats['diff'][i], cv2.mean(diff_map, mask=mask)[0])
+
+
+def png_upload(name='fort.png', value=128):
+    _, buffer = cv2.imencode('.png', np.full((32, 32, 3), value, dtype=np.uint8))
+    return SimpleUploadedFile(name, buffer.tobytes(), content_type='image/png')
+
+
+class FakeDetector:
+    def thresholds_from_history(self, false_positive_rate, params=None):
+        return None
+
+    def load_image_from_file(self, image_file, max_side=None):
+        return np.zeros((32, 32, 3), dtype=np.uint8)
+
+    def detect_structural_changes(self, past_img, current_img, *args, **kwargs):
+        return {
+            'cnn_distance': 0.1, 'ssim_score': 0.9, 'detections': [], 'total_changes': 0,
+            'risk_assessment': {'level': 'SAFE', 'score': 0, 'recommendations': []},
+        }
+
+    def visualize_results(self, current_img, results):
+        return current_img
+
+    def save_annotated_image(self, annotated_img):
+        return ContentFile(b'png')
+
+
+class AnalysisJobQueueTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(
+            MEDIA_ROOT=self.media.name, ANALYSIS_ASYNC=True, ALIGNMENT_REGISTRATION=False, ANALYSIS_MEMO=False,
+        )
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username='admin_tester', password='pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.fort = Fort.objects.create(name='Raigad', location='Maharashtra')
+        FortImage.objects.create(fort=self.fort, image=png_upload('before.png', 100))
+
+    def test_profile_comes_from_request_then_fort(self):
+        self.fort.detection_profile = 'balanced'
+        self.fort.save()
+        url = '/api/structural-analyses/analyze/'
+
+        response = self.client.post(url, {'fort_id': self.fort.id, 'image': png_upload()}, format='multipart')
+        self.assertEqual(AnalysisJob.objects.get(id=response.data['job_id']).parameters['profile'], 'balanced')
+
+        response = self.client.post(
+            url, {'fort_id': self.fort.id, 'image': png_upload(), 'profile': 'fast'}, format='multipart'
+        )
+        self.assertEqual(AnalysisJob.objects.get(id=response.data['job_id']).parameters['profile'], 'fast')
+        with mock.patch('home.analysis_jobs.get_detector', return_value=FakeDetector()) as get_detector:
+            while (job := claim_next_job('worker-a')) is not None:
+                process_job(job)
+        self.assertEqual([c.args for c in get_detector.call_args_list], [('balanced',), ('fast',)])
+        self.assertFalse(AnalysisJob.objects.exclude(status='done').exists())
+
+        response = self.client.post(
+            url, {'fort_id': self.fort.id, 'image': png_upload(), 'profile': 'turbo'}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_analyze_enqueues_and_job_endpoint_reports_result(self):
+        response = self.client.post(
+            '/api/structural-analyses/analyze/',
+            {'fort_id': self.fort.id, 'image': png_upload('after.png', 140)},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_url = f"/api/structural-analyses/jobs/{response.data['job_id']}/"
+        self.assertTrue(response.data['status_url'].endswith(job_url))
+        self.assertEqual(self.client.get(job_url).data['status'], AnalysisJob.QUEUED)
+
+        job = claim_next_job('test-worker')
+        self.assertEqual(job.status, AnalysisJob.RUNNING)
+        self.assertIsNone(claim_next_job('other-worker'))
+        self.assertEqual(self.client.get(job_url).data['status'], AnalysisJob.RUNNING)
+
+        process_job(job, FakeDetector())
+        data = self.client.get(job_url).data
+        self.assertEqual(data['status'], AnalysisJob.DONE)
+        self.assertEqual(data['analysis']['risk_level'], 'SAFE')
+
+    def enqueue_and_claim(self, worker='worker-a'):
+        self.client.post('/api/structural-analyses/analyze/',
+                         {'fort_id': self.fort.id, 'image': png_upload('after.png', 140)}, format='multipart')
+        return claim_next_job(worker)
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        job = self.enqueue_and_claim()
+        long_ago = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_TIMEOUT * 2)
+        # Running for longer than the timeout, but still beating
+        AnalysisJob.objects.filter(pk=job.pk).update(started_at=long_ago)
+        requeue_stale_jobs()
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.RUNNING)
+
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago)
+        requeue_stale_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (AnalysisJob.QUEUED, None))
+
+    def test_taken_over_job_drops_its_result(self):
+        job = self.enqueue_and_claim()
+
+        class SlowDetector(FakeDetector):
+            def detect_structural_changes(self, *args, **kwargs):
+                # Presumed lost meanwhile and claimed by another worker
+                AnalysisJob.objects.filter(pk=job.pk).update(worker='worker-b')
+                return super().detect_structural_changes(*args, **kwargs)
+
+        with mock.patch('home.analysis_jobs.send_analysis_report') as report:
+            process_job(job, SlowDetector())
+        report.assert_not_called()
+        self.assertEqual((job.status, job.worker), (AnalysisJob.RUNNING, 'worker-b'))
+        self.assertFalse(StructuralAnalysis.objects.exists())
+
+        other = AnalysisJob.objects.get(pk=job.pk)
+        with mock.patch('home.analysis_jobs.send_analysis_report') as report:
+            process_job(other, FakeDetector())
+        report.assert_called_once()
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.DONE)
+
+
+@override_settings(METRICS_TOKEN='scrape')
+class MetricsTests(TestCase):
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(
+            MEDIA_ROOT=self.media.name, ANALYSIS_ASYNC=True, ALIGNMENT_REGISTRATION=False, ANALYSIS_MEMO=False,
+        )
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='ops', password='pw', is_staff=True))
+        self.fort = Fort.objects.create(name='Sinhagad', location='Pune')
+        FortImage.objects.create(fort=self.fort, image=png_upload('before.png', 100))
+
+    def test_requests_and_analyses_are_counted(self):
+        sample = metrics.REGISTRY.get_sample_value
+        request_labels = {'view': 'StructuralAnalysisViewSet', 'action': 'analyze', 'method': 'POST', 'status': '2xx'}
+        before = {
+            'requests': sample('durgsetu_request_seconds_count', request_labels) or 0,
+            'safe': sample('durgsetu_analyses_total', {'risk_level': 'SAFE'}) or 0,
+            'total': sample('durgsetu_analysis_stage_seconds_count', {'stage': 'total'}) or 0,
+        }
+        self.client.post('/api/structural-analyses/analyze/',
+                         {'fort_id': self.fort.id, 'image': png_upload('after.png', 140)}, format='multipart')
+        self.assertIn('durgsetu_analysis_jobs{status="queued"} 1.0', self.scrape().content.decode())
+
+        process_job(claim_next_job('test-worker'), FakeDetector())
+        self.assertEqual(sample('durgsetu_request_seconds_count', request_labels), before['requests'] + 1)
+        self.assertEqual(sample('durgsetu_analyses_total', {'risk_level': 'SAFE'}), before['safe'] + 1)
+        self.assertEqual(sample('durgsetu_analysis_stage_seconds_count', {'stage': 'total'}), before['total'] + 1)
+        self.assertEqual(sample('durgsetu_analyses_in_progress'), 0)
+        self.assertIn('durgsetu_analysis_jobs{status="done"} 1.0', self.scrape().content.decode())
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.scrape().status_code, status.HTTP_200_OK)
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_multiprocess_samples_are_merged(self):
+        script = (
+            "from home import metrics; "
+            "metrics.ANALYSES.labels('HIGH').inc(); "
+            "metrics.ANALYSES_IN_PROGRESS.inc(); "
+            "metrics.MODEL_LOADED.labels('balanced').set(1)"
+        )
+        with tempfile.TemporaryDirectory() as path:
+            env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': path}
+            pids = []
+            for _ in range(2):
+                proc = subprocess.Popen([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env)
+                self.assertEqual(proc.wait(timeout=60), 0)
+                pids.append(proc.pid)
+
+            def scrape():
+                registry = metrics.metrics_registry(path)
+                return {name: registry.get_sample_value(name, labels) for name, labels in (
+                    ('durgsetu_analyses_total', {'risk_level': 'HIGH'}),
+                    ('durgsetu_analyses_in_progress', {}),
+                    ('durgsetu_model_loaded', {'profile': 'balanced'}),
+                )}
+
+            self.assertEqual(list(scrape().values()), [2.0, 2.0, 1.0])
+            for pid in pids:
+                multiprocess.mark_process_dead(pid, path)
+            # Counters outlive their processes; live gauges do not.
+            self.assertEqual(scrape()['durgsetu_analyses_total'], 2.0)
+            self.assertIsNone(scrape()['durgsetu_analyses_in_progress'])
+
+
+class EvaluateDetectorTests(SimpleTestCase):
+    def test_reports_confusion_and_latency_per_k_factor(self):
+        past, current = make_scene()
+        detector = make_detector_with_tiny_model()
+        with tempfile.TemporaryDirectory() as root:
+            for name, images in (('changed/wall', (past, current)), ('unchanged/wall', (past, past))):
+                os.makedirs(f'{root}/{name}')
+                cv2.imwrite(f'{root}/{name}/past.png', images[0])
+                cv2.imwrite(f'{root}/{name}/current.png', images[1])
+            output = f'{root}/evaluation.json'
+            with mock.patch('home.management.commands.evaluate_detector.get_detector', return_value=detector):
+                call_command('evaluate_detector', root, '--k-factors', '0', '2', '--processes', '1',
+                             '--output', output, stdout=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual((report['pairs'], report['changed_pairs']), (2, 1))
+        self.assertEqual([row['k_factor'] for row in report['k_factors']], [0.0, 2.0])
+        for row in report['k_factors']:
+            self.assertEqual(sum(row['confusion'].values()), 2)
+            self.assertEqual(row['confusion']['tp'], 1)
+        self.assertEqual(len(report['results'][0]['runs']), 2)
+        self.assertGreater(report['analyses_per_second'], 0)
+        self.assertIn('cnn', report['stages_ms'])
+
+    def test_pairs_need_both_images(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(f'{root}/changed/wall')
+            cv2.imwrite(f'{root}/changed/wall/past.png', make_ground())
+            with self.assertRaises(CommandError):
+                call_command('evaluate_detector', root, '--processes', '1', stdout=io.StringIO())
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.fort = Fort.objects.create(name='Sinhagad', location='Pune')
+        self.ground = make_ground()
+
+    def upload(self, image):
+        upload = ContentFile(cv2.imencode('.png', image)[1].tobytes(), name='view.png')
+        return FortImage.objects.create(fort=self.fort, image=upload)
+
+    def test_pair_alignment_composes_stored_registrations(self):
+        # ground -> view homographies of two later flights
+        H_past = np.array([[1.02, 0.01, -12], [-0.01, 1.0, 8], [1e-5, 0, 1]])
+        H_current = np.array([[0.98, -0.02, 15], [0.015, 0.99, -6], [0, 1e-5, 1]])
+        reference = self.upload(self.ground)
+        past = self.upload(cv2.warpPerspective(self.ground, H_past, (800, 600)))
+        current = self.upload(cv2.warpPerspective(self.ground, H_current, (800, 600)))
+        detector = make_detector_without_model()
+        for fort_image in (past, current):  # reference is promoted on first use
+            self.assertTrue(register_image(detector, fort_image))
+        reference.refresh_from_db()
+        self.assertTrue(reference.is_reference)
+        self.assertEqual((past.registered_to, current.registered_to), (reference, reference))
+
+        frame = np.diag([800.0, 600.0, 1.0])
+        M = frame @ pair_homography(past, current) @ np.linalg.inv(frame)
+        self.assertLess(corner_error(M, H_current @ np.linalg.inv(H_past)), 2.0)
+
+        # Registered images are not matched again, even from a fresh row.
+        with mock.patch.object(detector, 'alignment_features') as features:
+            self.assertTrue(register_image(detector, FortImage.objects.get(id=current.id)))
+        features.assert_not_called()
+
+    def test_unregistrable_image_falls_back_to_pairwise(self):
+        reference = self.upload(self.ground)
+        noise = self.upload(np.full((600, 800, 3), 127, dtype=np.uint8))
+        detector = make_detector_without_model()
+        register_image(detector, reference)
+        register_image(detector, noise)
+        self.assertEqual(noise.registered_to, reference)
+        self.assertIsNone(noise.reference_homography)
+        self.assertIsNone(pair_homography(reference, noise))
+        self.assertTrue(np.allclose(pair_homography(reference, reference), np.eye(3)))
+
+
+class SSIMTests(SimpleTestCase):
+    def test_matches_skimage(self):
+        from skimage.metrics import structural_similarity as skimage_ssim
+
+        rng = np.random.default_rng(0)
+        past = cv2.cvtColor(make_ground(), cv2.COLOR_BGR2GRAY)
+        current = np.clip(past * 0.9 + 15 + rng.normal(0, 8, past.shape), 0, 255).astype(np.uint8)
+        cv2.rectangle(current, (300, 200), (360, 250), 40, -1)
+        for gaussian in (False, True):
+            with self.subTest(gaussian=gaussian):
+                expected, expected_map = skimage_ssim(past, current, gaussian_weights=gaussian, full=True)
+                score, ssim_map = structural_similarity(past, current, gaussian=gaussian, full=True)
+                self.assertEqual(ssim_map.dtype, np.float32)
+                self.assertAlmostEqual(score, expected, places=5)
+                np.testing.assert_allclose(ssim_map, expected_map, atol=1e-3)
+
+    def test_pair_ssim_at_analysis_resolution(self):
+        past = make_ground()
+        current = cv2.GaussianBlur(past, (5, 5), 0)
+        score, ssim_map = pair_ssim(past, ImagePyramid(current), SSIMConfig(max_side=400), full=True)
+        self.assertEqual(ssim_map.shape, (300, 400))
+        gray = lambda img: cv2.cvtColor(cv2.resize(img, (400, 300), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        self.assertAlmostEqual(score, structural_similarity(gray(past), gray(current)), places=2)
+        self.assertEqual(pair_ssim(past, past, SSIMConfig(max_side=None)), 1.0)
+
+
+class ClusteringTests(SimpleTestCase):
+    def test_matches_dbscan(self):
+        from sklearn.cluster import DBSCAN
+
+        rng = np.random.default_rng(0)
+        layouts = {
+            'scattered': rng.integers(0, 600, (300, 2)),
+            # Lattice spaced eps apart: chains only join on exact distance ties
+            'lattice': rng.integers(0, 12, (300, 2)) * 50,
+            'dense': np.round(rng.normal(300, 40, (2000, 2))),
+            'duplicates': np.repeat(rng.integers(0, 400, (50, 2)), 4, axis=0),
+        }
+        for name, points in layouts.items():
+            for eps in (10, 50, 49.5):
+                with self.subTest(layout=name, eps=eps):
+                    expected = DBSCAN(eps=eps, min_samples=1).fit(points).labels_
+                    np.testing.assert_array_equal(connected_components(points, eps), expected)
+
+    def test_merges_like_groups(self):
+        detector = make_detector_without_model()
+        det = lambda x, y, area, severity: {
+            'bbox': (x, y, 20, 10), 'area': area, 'confidence': area / 10000, 'severity': severity,
+            'centroid': (x + 10, y + 5),
+        }
+        detections = [
+            det(0, 0, 100, 'Minor'), det(500, 500, 300, 'Moderate'), det(40, 0, 200, 'Moderate'),
+            det(80, 30, 4900, 'Minor'), det(900, 0, 50, 'Minor'),
+        ]
+        merged = detector.cluster_detections(detections)
+        self.assertEqual(merged, [
+            {'bbox': (0, 0, 100, 40), 'area': 5200.0, 'confidence': 0.49, 'severity': 'Critical', 'centroid': (50, 20)},
+            {'bbox': (500, 500, 20, 10), 'area': 300.0, 'confidence': 0.03, 'severity': 'Moderate', 'centroid': (510, 505)},
+            {'bbox': (900, 0, 20, 10), 'area': 50.0, 'confidence': 0.005, 'severity': 'Minor', 'centroid': (910, 5)},
+        ])
+        self.assertEqual(detector.merge_group(detections[1:3])['severity'], 'Moderate')
+
+        # Core points only: the isolated blobs stay unmerged after the clusters
+        detector.config = {**detector.config, 'cluster_min_samples': 2}
+        merged = detector.cluster_detections(detections)
+        self.assertEqual([d['bbox'] for d in merged], [(0, 0, 100, 40), (500, 500, 20, 10), (900, 0, 20, 10)])
+        self.assertEqual(merged[1], detections[1])
+
+
+class AnnotationTests(SimpleTestCase):
+    def results(self, *boxes):
+        return {
+            'detections': [{'bbox': box, 'confidence': 0.5} for box in boxes], 'total_changes': len(boxes),
+            'risk_assessment': {'level': 'HIGH'}, 'cnn_distance': 0.4,
+        }
+
+    def test_fills_blend_once(self):
+        frame = np.full((400, 600, 3), 100, dtype=np.uint8)
+        out = render(frame, self.results((200, 200, 100, 100), (250, 250, 100, 100), (500, 150, 40, 40)))
+        tinted = np.round(0.3 * np.array([0, 0, 255]) + 0.7 * 100)
+        for y, x in ((220, 220), (275, 275), (170, 520)):  # single, overlapping and separate fills
+            np.testing.assert_allclose(out[y, x], tinted, atol=1)
+        np.testing.assert_array_equal(out[380, 100], frame[380, 100])
+        np.testing.assert_array_equal(out[150, 200:300], frame[150, 200:300])
+        self.assertEqual(frame.max(), 100)
+
+    def test_downscale_and_encodings(self):
+        frame = make_ground()
+        out = render(frame, self.results((400, 300, 80, 60)), max_side=400)
+        self.assertEqual(out.shape, (300, 400, 3))
+        # Boxes scale with the frame
+        shrunk = cv2.resize(frame, (400, 300), interpolation=cv2.INTER_AREA)
+        np.testing.assert_allclose(out[165, 220], 0.3 * np.array([0, 0, 255]) + 0.7 * shrunk[165, 220], atol=1)
+        np.testing.assert_array_equal(out[250, 100], shrunk[250, 100])
+        sizes = {}
+        for fmt in ('jpeg', 'webp', 'png'):
+            with self.subTest(format=fmt):
+                data = encode(out, AnnotationConfig(fmt, quality=80))
+                decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                self.assertEqual(decoded.shape, out.shape)
+                sizes[fmt] = len(data)
+        self.assertLess(sizes['jpeg'], sizes['png'])
+        with self.assertRaises(ValueError):
+            AnnotationConfig('gif')
+
+
+class PreprocessingTests(SimpleTestCase):
+    def test_matches_torchvision(self):
+        from torchvision import transforms
+
+        transform = transforms.Compose([
+            transforms.ToTensor(), transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ])
+        imgs = [make_ground(seed) for seed in (1, 2)]
+        expected = torch.stack([transform(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)) for img in imgs])
+        batch = fill_batch(new_batch(2, 600, 800), imgs)
+        torch.testing.assert_close(batch, expected, rtol=0, atol=1e-5)
+
+        f1, f2 = torch.rand(1, 130, 9, 7), torch.rand(3, 130, 9, 7)
+        torch.testing.assert_close(channel_distance(f1, f2, chunk=64), torch.sum((f1 - f2) ** 2, dim=1))
+
+    def test_input_batches_are_reused_per_thread(self):
+        detector = make_detector_with_tiny_model()
+        detector.input_size = (64, 48)
+        past, current = make_scene()
+        batch = detector.input_buffers.get(2, 48, 64)
+        features = detector.encode_images([past, current])
+        self.assertEqual(detector.input_buffers.get(1, 48, 64).data_ptr(), batch.data_ptr())
+        torch.testing.assert_close(
+            detector.input_buffers.get(2, 48, 64), detector.preprocess_images([past, current]),
+        )
+        torch.testing.assert_close(features.norm(dim=1), torch.ones(2, 6, 8))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            other = pool.submit(detector.input_buffers.get, 2, 48, 64).result()
+        self.assertNotEqual(other.data_ptr(), batch.data_ptr())
+
+
+class TimingsTests(SimpleTestCase):
+    def setUp(self):
+        reset_timings()
+        self.addCleanup(reset_timings)
+
+    def test_records_detector_stages(self):
+        detector = make_detector_with_tiny_model()
+        past, current = make_scene()
+        with recording() as rec:
+            detector.detect_structural_changes(past, current)
+        timings = rec.timings()
+        for name in ('align', 'warp', 'preprocess', 'cnn', 'distance', 'deep_diff', 'contours', 'risk', 'total'):
+            self.assertIn(name, timings)
+        self.assertGreaterEqual(timings['total'], timings['deep_diff'])
+        self.assertEqual(summary()['cnn']['count'], 1)
+
+    def test_stage_is_noop_outside_recording(self):
+        self.assertIs(stage('a'), stage('b'))
+        with recording(enabled=False) as rec:
+            self.assertIsNone(rec)
+            self.assertIs(stage('a'), stage('b'))
+        self.assertEqual(summary(), {})
+
+    def test_trace_file_appends_analyses(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = f'{tmpdir}/trace.json'
+            for fort in (1, 2):
+                with recording(trace_path=path, fort=fort):
+                    with stage('detect'):
+                        pass
+            with open(path) as f:
+                events = json.loads(f.read().rstrip(',\n') + ']')
+        self.assertEqual([e['name'] for e in events], ['analysis', 'detect'] * 2)
+        self.assertEqual([e['args']['fort'] for e in events if e['name'] == 'analysis'], [1, 2])
+        self.assertEqual(summary()['detect']['count'], 2)
+
+
+class DeduplicationTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=self.media.name, ANALYSIS_ASYNC=False)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='surveyor', password='pw'))
+        self.fort = Fort.objects.create(name='Torna', location='Pune')
+        self.ground = make_ground()
+
+    def post(self, image, ext='.png'):
+        upload = SimpleUploadedFile(f'view{ext}', cv2.imencode(ext, image)[1].tobytes())
+        return self.client.post(
+            '/api/structural-analyses/analyze/', {'fort_id': self.fort.id, 'image': upload}, format='multipart'
+        )
+
+    def test_identical_reupload_reuses_image_and_memoized_analysis(self):
+        changed = self.ground.copy()
+        cv2.rectangle(changed, (300, 200), (360, 250), (40, 40, 40), -1)
+        detector = make_detector_with_tiny_model()
+        self.assertTrue(self.post(self.ground).data['is_first_upload'])
+
+        with mock.patch('home.views.get_detector', return_value=detector), \
+                mock.patch.object(detector, 'detect_structural_changes',
+                                  wraps=detector.detect_structural_changes) as detect:
+            first = self.post(changed)
+            retry = self.post(changed)
+        self.assertEqual(detect.call_count, 1)
+        self.assertEqual(FortImage.objects.filter(fort=self.fort).count(), 2)
+        self.assertEqual((first.data['image_reused'], retry.data['image_reused']), (False, True))
+        first, retry = (StructuralAnalysis.objects.get(id=r.data['analysis']['id']) for r in (first, retry))
+        self.assertEqual(first.current_image_id, retry.current_image_id)
+        self.assertEqual(first.analysis_results['memo'], {'hit': False})
+        self.assertIn('detect', first.analysis_results['timings'])
+        self.assertTrue(retry.analysis_results['memo']['hit'])
+        self.assertEqual(retry.changes_detected, first.changes_detected)
+        self.assertEqual(retry.annotated_image.name, first.annotated_image.name)
+
+        # Other parameters are a different analysis.
+        with mock.patch('home.analysis_jobs.get_detector', return_value=detector):
+            analysis = run_structural_analysis(detector, self.fort, first.previous_image, first.current_image,
+                                               parameters={'temperature': 41, 'humidity': 90})
+        self.assertFalse(analysis.analysis_results['memo']['hit'])
+
+        # So is the same analysis from a newer ANALYSIS_VERSION.
+        with mock.patch('home.analysis_jobs.ANALYSIS_VERSION', 'next'):
+            analysis = run_structural_analysis(detector, self.fort, first.previous_image, first.current_image)
+        self.assertFalse(analysis.analysis_results['memo']['hit'])
+
+    def test_reuploading_an_older_image_compares_it_with_the_latest(self):
+        changed = self.ground.copy()
+        cv2.rectangle(changed, (300, 200), (360, 250), (40, 40, 40), -1)
+        detector = make_detector_with_tiny_model()
+        with mock.patch('home.views.get_detector', return_value=detector):
+            first = self.post(self.ground)
+            second = self.post(changed)
+            again = self.post(self.ground)
+        self.assertTrue(again.data['image_reused'])
+        original = FortImage.objects.get(id=first.data['image_id'])
+        analysis = StructuralAnalysis.objects.get(id=again.data['analysis']['id'])
+        # A new, latest row sharing the stored file, compared against the newer upload
+        self.assertNotEqual(analysis.current_image_id, original.id)
+        self.assertEqual(analysis.current_image.image.name, original.image.name)
+        self.assertEqual(analysis.previous_image_id, second.data['analysis']['current_image'])
+        self.assertGreater(analysis.current_image.uploaded_at, analysis.previous_image.uploaded_at)
+        self.assertEqual(len(os.listdir(os.path.join(self.media.name, 'fort_images'))), 2)
+
+    def test_perceptual_hash_survives_reencoding(self):
+        png = FortImage.objects.create(fort=self.fort, image=ContentFile(cv2.imencode('.png', self.ground)[1].tobytes(),
+                                                                          name='a.png'))
+        jpeg = FortImage.objects.create(fort=self.fort, image=ContentFile(
+            cv2.imencode('.jpg', cv2.resize(self.ground, (400, 300)), [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes(),
+            name='b.jpg'))
+        self.assertNotEqual(png.content_hash, jpeg.content_hash)
+        self.assertEqual(len(png.content_hash), 64)
+        self.assertLessEqual(hamming(png.perceptual_hash, jpeg.perceptual_hash), 4)
+        other = make_ground(seed=2)
+        self.assertGreater(hamming(png.perceptual_hash, to_hex(perceptual_hash(cv2.cvtColor(other, cv2.COLOR_BGR2GRAY)))),
+                           12)
+
+
+class AlignmentTests(SimpleTestCase):
+    def test_near_identical_viewpoint_stops_at_phase_tier(self):
+        ground = make_ground()
+        expected = cv2.getRotationMatrix2D((400, 300), 0.5, 1.0)
+        expected = np.vstack([expected, [0, 0, 1]]) @ np.array([[1, 0, 7.3], [0, 1, -4.6], [0, 0, 1]])
+        current = cv2.warpPerspective(ground, expected, (800, 600))
+        detector = make_detector_without_model()
+
+        with mock.patch('home.alignment.orb_features') as orb:
+            M, report = detector.estimate_alignment(ground, current)
+        orb.assert_not_called()
+        self.assertEqual((report['tier'], report['passed'], report['tried']), ('phase', True, ['phase']))
+        self.assertLess(corner_error(M, expected), 1.5)
+
+    def test_gate_falls_through_to_keypoint_tiers(self):
+        ground = make_ground()
+        expected = np.vstack([cv2.getRotationMatrix2D((400, 300), 8, 1.05), [0, 0, 1]])
+        current = cv2.warpPerspective(ground, expected, (800, 600))
+        detector = make_detector_without_model()
+
+        M, report = detector.estimate_alignment(ground, current)
+        self.assertTrue(report['passed'])
+        self.assertIn(report['tier'], ('orb', 'akaze'))
+        self.assertEqual(report['tried'][0], 'phase')
+        self.assertGreaterEqual(report['inlier_ratio'], detector.alignment.min_inlier_ratio)
+        self.assertLess(corner_error(M, expected), 2.0)
+
+        # A flat image passes no tier and leaves the pair unaligned.
+        M, report = detector.estimate_alignment(ground, np.full_like(ground, 127))
+        self.assertIsNone(M)
+        self.assertEqual((report['tier'], report['passed']), ('none', False))
+
+    def test_ratio_matches_agree_with_brute_force(self):
+        detector = make_detector_without_model()
+        ground = make_ground()
+        _, des1, _ = detector.alignment_features(ground)
+        _, des2, _ = detector.alignment_features(cv2.GaussianBlur(ground, (5, 5), 0))
+
+        def loop_matches(d1, d2):
+            pairs = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(d1, d2, k=2)
+            return {(m.queryIdx, m.trainIdx) for m, n in pairs if m.distance < 0.75 * n.distance}
+
+        # Exact search below MIN_LSH_DESCRIPTORS train descriptors
+        query, train = ratio_matches(des1, des2[:200])
+        self.assertEqual(set(zip(query.tolist(), train.tolist())), loop_matches(des1, des2[:200]))
+        # Approximate LSH search keeps most of the exact matches
+        self.assertGreaterEqual(len(des2), MIN_LSH_DESCRIPTORS)
+        exact = loop_matches(des1, des2)
+        lsh = set(zip(*(a.tolist() for a in ratio_matches(des1, des2))))
+        self.assertGreater(len(exact & lsh), 0.8 * len(exact))
+
+
+class PrescreenTests(SimpleTestCase):
+    def reshoot(self):
+        # Same wall: 3 px drift, exposure change, sensor noise and JPEG
+        rng = np.random.default_rng(3)
+        current = cv2.warpAffine(make_ground(), np.float32([[1, 0, 3.4], [0, 1, -2.2]]), (800, 600),
+                                 borderMode=cv2.BORDER_REFLECT)
+        current = np.clip(current * 0.85 + 20 + rng.normal(0, 4, current.shape), 0, 255).astype(np.uint8)
+        return cv2.imdecode(cv2.imencode('.jpg', current, [cv2.IMWRITE_JPEG_QUALITY, 80])[1], cv2.IMREAD_COLOR)
+
+    def test_near_identical_pair_is_safe_without_the_cnn(self):
+        detector = make_detector_with_tiny_model()
+        detector.enable_prescreen()
+        with mock.patch.object(detector, 'get_deep_feature_difference') as deep:
+            results = detector.detect_structural_changes(make_ground(), self.reshoot())
+        deep.assert_not_called()
+        self.assertTrue(results['screened'])
+        self.assertTrue(results['screen']['passed'])
+        self.assertEqual(results['deep_diff'], {'mode': 'screened'})
+        self.assertEqual((results['risk_assessment']['level'], results['total_changes']), ('SAFE', 0))
+        # Reported on the same scale as full analyses, not the screen's small level
+        full = make_detector_with_tiny_model().detect_structural_changes(make_ground(), self.reshoot())
+        self.assertAlmostEqual(results['ssim_score'], full['ssim_score'], places=4)
+
+    def test_small_change_goes_to_the_deep_difference(self):
+        detector = make_detector_with_tiny_model()
+        detector.enable_prescreen()
+        current = self.reshoot()
+        cv2.rectangle(current, (300, 200), (312, 212), (40, 40, 40), -1)
+        results = detector.detect_structural_changes(make_ground(), current)
+        self.assertFalse(results['screened'])
+        self.assertGreater(results['screen']['intensity'], results['screen']['limits']['intensity'])
+        self.assertGreater(results['total_changes'], 0)
+
+        with self.assertRaises(ValueError):
+            detector.enable_prescreen(margin=1.0)
+
+
+class AdaptiveThresholdTests(SimpleTestCase):
+    def test_k_factor_moves_the_threshold(self):
+        detector = make_detector_with_tiny_model()
+        diff_map, _ = detector.get_deep_feature_difference(*make_scene())
+        (loose, t0), (strict, t1) = (
+            detector.threshold_diff_map(diff_map, DetectionParams(k_factor=k, scaled_threshold=True))
+            for k in (0.0, 1.0)
+        )
+        self.assertLess(t0, t1)
+        self.assertLess(t1, DetectionParams().max_threshold)
+        self.assertGreater(np.count_nonzero(loose), np.count_nonzero(strict))
+        # A stricter threshold only removes pixels
+        self.assertFalse(np.any(strict & ~loose))
+
+    def test_unscaled_threshold_keeps_the_original_behaviour(self):
+        detector = make_detector_with_tiny_model()
+        diff_map, _ = detector.get_deep_feature_difference(*make_scene())
+        for k in (0.0, 1.0):
+            _, threshold = detector.threshold_diff_map(diff_map, DetectionParams(k_factor=k))
+            self.assertEqual(threshold, DetectionParams().max_threshold)
+
+    @override_settings(ADAPTIVE_THRESHOLD_SCALED=True)
+    def test_setting_enables_scaled_threshold(self):
+        with mock.patch.object(StructuralChangeDetector, 'setup_cnn_model'), \
+                mock.patch.object(detector_singleton, '_get_feature_store', return_value=None):
+            detector = detector_singleton._build_detector(settings.DETECTION_PROFILE)
+        self.assertTrue(detector.default_params.scaled_threshold)
+
+
+class ConcurrentDetectionTests(SimpleTestCase):
+    def test_parallel_analyses_use_their_own_parameters(self):
+        detector = make_detector_with_tiny_model()
+        past, current = make_scene()
+        param_sets = [
+            DetectionParams(),
+            DetectionParams(k_factor=2.5, min_threshold=0.45, max_threshold=0.60),
+            DetectionParams(min_blob_area=2000),
+            DetectionParams(grass_hsv_lower=(0, 0, 0), grass_hsv_upper=(180, 255, 255), noise_ratio=0.1),
+        ]
+        expected = [detector.detect_structural_changes(past, current, params=p) for p in param_sets]
+        self.assertGreater(len({str(r['detections']) for r in expected}), 2)
+
+        calls = list(range(len(param_sets))) * 4
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda i: detector.detect_structural_changes(past, current, params=param_sets[i]), calls
+            ))
+
+        for i, result in zip(calls, results):
+            self.assertEqual(result['parameters'], param_sets[i].to_dict())
+            self.assertEqual(result['detections'], expected[i]['detections'])
+
+
+class GatedModel:
+    """Doubles its input; the first forward pass waits for `release` so later submissions queue up."""
+
+    def __init__(self, error=None):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+        self.batch_shapes = []
+
+    def __call__(self, x):
+        if not self.started.is_set():
+            self.started.set()
+            self.release.wait(5)
+        self.batch_shapes.append(tuple(x.shape))
+        if self.error is not None and len(self.batch_shapes) > 1:
+            raise self.error
+        return x * 2
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def queued_behind_first(self, model, inputs, **kwargs):
+        """Futures for `inputs`, all submitted while the worker is busy with a first request."""
+        batcher = MicroBatcher(model, max_wait_ms=50, **kwargs)
+        self.addCleanup(batcher.close)
+        first = batcher.submit(torch.zeros(1, 1, 2, 2))
+        self.assertTrue(model.started.wait(5))
+        futures = [batcher.submit(t) for t in inputs]
+        model.release.set()
+        first.result(timeout=5)
+        return batcher, futures
+
+    def test_batches_stop_at_max_batch_size(self):
+        model = GatedModel()
+        inputs = [torch.full((n, 1, 2, 2), float(i)) for i, n in enumerate((3, 2, 2))]
+        batcher, futures = self.queued_behind_first(model, inputs, max_batch_size=4)
+        for inputs_, future in zip(inputs, futures):
+            self.assertTrue(torch.equal(future.result(timeout=5), inputs_ * 2))
+        # The request that would overflow a batch starts the next one
+        self.assertEqual([shape[0] for shape in model.batch_shapes], [1, 3, 4])
+        self.assertEqual((batcher.batches, batcher.items), (3, 8))
+
+    def test_concurrent_callers_get_their_own_slice(self):
+        model = GatedModel()
+        inputs = [torch.full((n, 1, 2, 2), float(i)) for i, n in enumerate((1, 2, 1, 3))]
+        _, futures = self.queued_behind_first(model, inputs)
+        for inputs_, future in zip(inputs, futures):
+            self.assertTrue(torch.equal(future.result(timeout=5), inputs_ * 2))
+        self.assertEqual(model.batch_shapes[1:], [(7, 1, 2, 2)])
+
+    def test_model_error_reaches_every_waiting_caller(self):
+        error = RuntimeError('out of memory')
+        model = GatedModel(error=error)
+        with self.assertLogs('home.inference_batcher', 'ERROR'):
+            _, futures = self.queued_behind_first(model, [torch.zeros(1, 1, 2, 2) for _ in range(3)])
+            for future in futures:
+                self.assertIs(future.exception(timeout=5), error)
+        self.assertEqual(len(model.batch_shapes), 2)
+
+    def test_inputs_of_different_shapes_run_separately(self):
+        model = GatedModel()
+        inputs = [torch.ones(1, 1, 2, 2), torch.ones(1, 1, 3, 3), torch.ones(2, 1, 2, 2)]
+        _, futures = self.queued_behind_first(model, inputs)
+        for inputs_, future in zip(inputs, futures):
+            self.assertTrue(torch.equal(future.result(timeout=5), inputs_ * 2))
+        self.assertEqual(sorted(model.batch_shapes[1:]), [(1, 1, 3, 3), (3, 1, 2, 2)])
+
+    def test_close_stops_the_worker_after_queued_requests(self):
+        model = GatedModel()
+        batcher = MicroBatcher(model)
+        first = batcher.submit(torch.zeros(1, 1, 2, 2))
+        self.assertTrue(model.started.wait(5))
+        queued = batcher.submit(torch.ones(1, 1, 2, 2))
+        model.release.set()
+        batcher.close()
+        self.assertFalse(batcher._thread.is_alive())
+        self.assertTrue(first.done() and queued.done())
+        self.assertTrue(torch.equal(queued.result(), torch.ones(1, 1, 2, 2) * 2))
+
+
+class BenchmarkToolTests(SimpleTestCase):
+    def test_synthetic_pairs_are_deterministic(self):
+        past, current, boxes = make_pair(256, seed=3)
+        again = make_pair(256, seed=3)
+        self.assertTrue(np.array_equal(past, again[0]) and np.array_equal(current, again[1]))
+        self.assertEqual(boxes, again[2])
+        self.assertFalse(np.array_equal(current, make_pair(256, seed=4)[1]))
+        # Without lighting or warp the images differ only inside the painted-in changes
+        outside = np.ones(past.shape[:2], dtype=bool)
+        for _, (x, y, w, h) in boxes:
+            outside[y:y + h, x:x + w] = False
+        self.assertTrue(np.array_equal(past[outside], current[outside]))
+
+    def test_ground_truth_stays_in_the_current_frame_under_warp(self):
+        changes = ('missing_stone', 'crack', 'vegetation')
+        for seed in range(5):
+            past, current, boxes = make_pair(256, seed=seed, changes=changes, warp=1.0)
+            still, _, still_boxes = make_pair(256, seed=seed, changes=changes)
+            self.assertEqual(boxes, still_boxes)  # only the past survey moves
+            self.assertFalse(np.array_equal(past, still))
+            for _, (x, y, w, h) in boxes:
+                self.assertTrue(0 <= x and 0 <= y and x + w <= 256 and y + h <= 256, (seed, x, y, w, h))
+
+    def test_compare_flags_regressions_and_fails(self):
+        def report(stages):
+            return {'environment': {'profile': 'balanced'},
+                    'results': [{'scenario': 'crack', 'size': 512, 'stages': stages}]}
+
+        base = report({'cnn': 100.0, 'ssim': 10.0, 'cluster': 1.0, 'risk': 50.0})
+        new = report({'cnn': 130.0, 'ssim': 10.5, 'cluster': 2.5, 'risk': 40.0})
+        # ssim: under both thresholds; cluster: +150% but only 1.5 ms
+        self.assertEqual([(kind, c['stage']) for kind, c in bench_detector.compare(base, new)],
+                         [('regression', 'cnn'), ('improvement', 'risk')])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, name) for name in ('base.json', 'new.json')]
+            for path, data in zip(paths, (base, new)):
+                with open(path, 'w') as f:
+                    json.dump(data, f)
+            for files, code in ((paths, 1), ([paths[0], paths[0]], 0)):
+                argv = ['bench_detector', '--compare', *files]
+                with mock.patch.object(sys, 'argv', argv), mock.patch('sys.stdout', new_callable=io.StringIO), \
+                        self.assertRaises(SystemExit) as exit_:
+                    bench_detector.main()
+                self.assertEqual(exit_.exception.code, code)
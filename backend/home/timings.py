@@ -0,0 +1,142 @@
+"""
+Per-stage timings of analyses.
+
+`stage(name)` times a block into the analysis being recorded by the
+enclosing `recording()`.  The recording lives in a context variable, so
+concurrent worker threads keep their own, and code deep in the detector
+needs no extra arguments.  Outside a recording (or with timings
+disabled) `stage` hands back one shared no-op context manager, so an
+instrumented block costs a context-variable lookup.
+
+Finished recordings are folded into a process-wide summary (`summary()`:
+count, total, mean and max milliseconds per stage).  With a trace path
+they are also appended to a Chrome trace-event file, one complete ("X")
+event per stage.  chrome://tracing, Perfetto and speedscope open it as a
+flame graph.  The file is a JSON array left open for appending, which
+these viewers accept.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+_current = contextvars.ContextVar('analysis_timings', default=None)
+_NOOP = nullcontext()
+
+_lock = threading.Lock()
+_summary = {}
+
+
+class _Stage:
+    __slots__ = ('recording', 'name', 'start')
+
+    def __init__(self, recording, name):
+        self.recording = recording
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recording.events.append((self.name, self.start, time.perf_counter() - self.start))
+        return False
+
+
+class Recording:
+    """Stage events of one analysis as (name, perf_counter start, seconds)."""
+
+    def __init__(self):
+        self.events = []
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.thread_id = threading.get_ident()
+        self.total = None
+
+    def timings(self):
+        """Milliseconds per stage (summed when a stage ran several times) and in total."""
+        ms = {}
+        for name, _, seconds in self.events:
+            ms[name] = ms.get(name, 0.0) + seconds * 1000
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        ms['total'] = total * 1000
+        return {name: round(value, 2) for name, value in ms.items()}
+
+    def trace_events(self, **args):
+        pid = os.getpid()
+        begin = {'name': 'analysis', 'ph': 'X', 'pid': pid, 'tid': self.thread_id, 'args': args,
+                 'ts': round(self.wall_start * 1e6), 'dur': round((self.total or 0) * 1e6)}
+        events = [begin]
+        for name, start, seconds in self.events:
+            events.append({
+                'name': name, 'ph': 'X', 'pid': pid, 'tid': self.thread_id,
+                'ts': round((self.wall_start + start - self.start) * 1e6), 'dur': round(seconds * 1e6),
+            })
+        return events
+
+
+def stage(name):
+    """Context manager timing `name` into the current recording, if any."""
+    recording = _current.get()
+    return _NOOP if recording is None else _Stage(recording, name)
+
+
+@contextmanager
+def recording(enabled=True, trace_path=None, **trace_args):
+    """
+    Record the stages run inside the block; yields the Recording (None when
+    disabled).  `trace_args` label the analysis in the trace file.
+    """
+    if not enabled:
+        yield None
+        return
+    rec = Recording()
+    token = _current.set(rec)
+    try:
+        yield rec
+    finally:
+        _current.reset(token)
+        rec.total = time.perf_counter() - rec.start
+        _aggregate(rec)
+        if trace_path:
+            write_trace(trace_path, rec.trace_events(**trace_args))
+
+
+def _aggregate(rec):
+    with _lock:
+        for name, ms in rec.timings().items():
+            entry = _summary.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+
+
+def summary():
+    """Per-stage count, total, mean and max milliseconds over this process's recordings."""
+    with _lock:
+        return {
+            name: {**entry, 'mean_ms': entry['total_ms'] / entry['count']}
+            for name, entry in sorted(_summary.items())
+        }
+
+
+def reset():
+    with _lock:
+        _summary.clear()
+
+
+def write_trace(path, events):
+    """Append trace events to `path`, starting the JSON array when the file is new."""
+    data = ''.join(json.dumps(event) + ',\n' for event in events)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+        data = '[\n' + data
+    except FileExistsError:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        # One write per analysis, so concurrent workers do not interleave events
+        os.write(fd, data.encode())
+    finally:
+        os.close(fd)
@@ -10,11 +10,16 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.core.mail import send_mail, EmailMessage
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.db.models import Count, Avg
-from .models import Fort, FortImage, StructuralAnalysis, FortDamageReport, ReportImage, PasswordResetToken
+from .models import Fort, FortImage, StructuralAnalysis, AnalysisJob, FortDamageReport, ReportImage, PasswordResetToken
 from .serializers import FortSerializer, FortImageSerializer, StructuralAnalysisSerializer, FortDamageReportSerializer, ReportImageSerializer
-from .structural_detector import StructuralChangeDetector
-from .detector_singleton import detector_instance
+from .analysis_jobs import enqueue_analysis, run_structural_analysis
+from .detection_profiles import resolve_profile
+from .image_hashes import content_hash
+from .detector_singleton import get_detector
+from .metrics import REPORT_JOBS
 from .report_generator import generate_pdf_report
 from datetime import datetime
 import hmac
@@ -39,6 +44,7 @@ def send_ai_report_email(analysis, user_notes, user_email):
     logger.debug("Starting send_ai_report_email for email=%s", user_email)
     if not user_email or not user_email.strip():
         logger.debug("No user_email provided or email is empty, aborting.")
+        REPORT_JOBS.labels('email', 'skipped').inc()
         return
         
     try:
@@ -100,15 +106,19 @@ def send_ai_report_email(analysis, user_notes, user_email):
             safe_fort_name = analysis.fort.name.replace(" ", "_")
             email_msg.attach(f'Structural_Analysis_{safe_fort_name}.pdf', pdf_bytes, 'application/pdf')
             logger.debug("PDF gracefully attached for %s", safe_fort_name)
+            REPORT_JOBS.labels('pdf', 'success').inc()
         except Exception as e:
             logger.error("Failed to generate PDF attachment: %s", e)
+            REPORT_JOBS.labels('pdf', 'failure').inc()
             
         logger.debug("Sending email via SMTP...")
         email_msg.send(fail_silently=False)
         logger.info("AI Email sent with PDF to %s for fort %s", user_email, analysis.fort.name)
+        REPORT_JOBS.labels('email', 'success').inc()
             
     except Exception as e:
         logger.error("Failed to generate or send AI email: %s", e, exc_info=True)
+        REPORT_JOBS.labels('email', 'failure').inc()
 
 # --- Authentication Views ---
 
@@ -522,7 +532,7 @@ class StructuralAnalysisViewSet(viewsets.ModelViewSet):
     def analyze(self, request):
         """
         Analyze structural changes by uploading an image
-        POST data: fort_id, image (file)
+        POST data: fort_id, image (file), optional profile (fast/balanced/accurate)
         """
         try:
             fort_id = request.data.get('fort_id')
@@ -542,13 +552,35 @@ class StructuralAnalysisViewSet(viewsets.ModelViewSet):
                     {'error': 'Fort not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            
-            # Save new image
-            current_image = FortImage.objects.create(
-                fort=fort,
-                image=uploaded_image,
-                description=f"Uploaded on {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            )
+
+            # Speed/accuracy profile: request, then the fort's, then the site default
+            try:
+                profile = resolve_profile(request.data.get('profile'), fort)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Save new image, or reuse the stored one when the same file is uploaded again
+            current_image, image_reused = None, False
+            stored_file, hashes = uploaded_image, {}
+            if settings.UPLOAD_DEDUPLICATION:
+                hashes = {'content_hash': content_hash(uploaded_image)}
+                latest = fort.images.order_by('-uploaded_at', '-id').first()
+                if latest is not None and latest.content_hash == hashes['content_hash']:
+                    # A retry of the latest upload: same image, same pair to analyse
+                    current_image, image_reused = latest, True
+                else:
+                    # A re-upload of an older photo is a new survey; it shares the stored
+                    # file but gets its own row so it is compared with the latest upload.
+                    match = FortImage.objects.filter(fort=fort, **hashes).first()
+                    if match is not None:
+                        stored_file, image_reused = match.image.name, True
+            if current_image is None:
+                current_image = FortImage.objects.create(
+                    fort=fort,
+                    image=stored_file,
+                    description=f"Uploaded on {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+                    **hashes,
+                )
             
             # Get previous image (latest before current)
             previous_image = FortImage.objects.filter(
@@ -562,92 +594,50 @@ class StructuralAnalysisViewSet(viewsets.ModelViewSet):
                 return Response({
                     'message': 'First image uploaded successfully',
                     'is_first_upload': True,
+                    'image_reused': image_reused,
                     'fort_id': fort.id,
                     'fort_name': fort.name,
                     'image_id': current_image.id,
                     'image_url': request.build_absolute_uri(current_image.image.url)
                 }, status=status.HTTP_201_CREATED)
             
-            # Perform analysis — use the pre-loaded singleton detector to avoid
-            # reloading ResNet50 weights on every request.
-            logger.info(f"Starting structural analysis for fort {fort.name}")
-            detector = detector_instance or StructuralChangeDetector()
-            
-            # --- Auto-Training / ML Feedback Loop ---
-            if request.user.is_authenticated:
-                history_qs = StructuralAnalysis.objects.filter(fort=fort, is_verified=True, verified_by=request.user.username)
-            else:
-                history_qs = StructuralAnalysis.objects.filter(fort=fort, is_verified=True)
-                
-            total_verifications = history_qs.count()
-            false_positives = history_qs.filter(is_false_positive=True).count()
-            
-            fp_rate = 0.0
-            if total_verifications > 0:
-                fp_rate = false_positives / total_verifications
-                
-            detector.update_thresholds_from_history(fp_rate)
-            
-            # Load images
-            past_img = detector.load_image_from_file(previous_image.image)
-            current_img = detector.load_image_from_file(current_image.image)
-            
-            # Extract environmental data from request
-            temp = request.data.get('temperature')
-            humidity = request.data.get('humidity')
-            wind_speed = request.data.get('wind_speed')
-            
-            # Detect changes & evaluate Climate Stress Index (CSI)
-            results = detector.detect_structural_changes(past_img, current_img, temp, humidity, wind_speed)
-            
-            # Create annotated image
-            annotated_img = detector.visualize_results(current_img, results)
-            annotated_file = detector.save_annotated_image(annotated_img)
-            
-            # Calculate total area
-            total_area = sum(d['area'] for d in results['detections']) if results['detections'] else 0
-            
-            # Save analysis with Phase 3 Environmental tracking
-            analysis = StructuralAnalysis.objects.create(
-                fort=fort,
-                previous_image=previous_image,
-                current_image=current_image,
-                cnn_distance=results['cnn_distance'],
-                ssim_score=results['ssim_score'],
-                risk_level=results['risk_assessment']['level'],
-                risk_score=results['risk_assessment']['score'],
-                changes_detected=results['total_changes'],
-                total_area_affected=total_area,
-                analysis_results=results,
-                temperature=temp,
-                humidity=humidity,
-                wind_speed=wind_speed,
-                climate_stress_index=results.get('environmental_data', {}).get('climate_stress_index', 0.0),
-                final_heritage_risk_score=results.get('environmental_data', {}).get('final_heritage_risk_score', 0.0)
-            )
-            
-            # Save annotated image
-            analysis.annotated_image.save(
-                f'analysis_{fort.id}_{analysis.id}.png',
-                annotated_file,
-                save=True
+            user = request.user if request.user.is_authenticated else None
+            parameters = {
+                # Environmental data from the request (Phase 3 Climate Stress Index)
+                'temperature': request.data.get('temperature'),
+                'humidity': request.data.get('humidity'),
+                'wind_speed': request.data.get('wind_speed'),
+                'profile': profile,
+            }
+
+            if settings.ANALYSIS_ASYNC:
+                # Heavy lifting happens in `manage.py run_analysis_worker`
+                job = enqueue_analysis(fort, previous_image, current_image, user=user, parameters=parameters)
+                return Response({
+                    'message': 'Analysis queued',
+                    'is_first_upload': False,
+                    'image_reused': image_reused,
+                    'fort_id': fort.id,
+                    'fort_name': fort.name,
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'status_url': request.build_absolute_uri(
+                        reverse('structuralanalysis-job-status', kwargs={'job_id': str(job.id)})
+                    ),
+                }, status=status.HTTP_202_ACCEPTED)
+
+            # Synchronous path — use the shared detector (loaded on first use) to
+            # avoid reloading ResNet50 weights on every request.
+            analysis = run_structural_analysis(
+                get_detector(profile), fort, previous_image, current_image, user=user, parameters=parameters
             )
             
-            logger.info(f"Analysis complete: {results['risk_assessment']['level']} risk detected")
-            
-            # --- Auto-send Email upon scan generation ---
-            user_email_for_scan = request.user.email if request.user.is_authenticated and request.user.email else None
-            threading.Thread(
-                target=send_ai_report_email,
-                args=(analysis, "Automated scan completed on new image upload.", user_email_for_scan),
-                daemon=True,
-            ).start()
-            
             # Return full analysis
             serializer = self.get_serializer(analysis, context={'request': request})
             return Response({
                 'message': 'Analysis completed successfully',
                 'is_first_upload': False,
+                'image_reused': image_reused,
                 'fort_id': fort.id,
                 'fort_name': fort.name,
                 'analysis': serializer.data
@@ -660,6 +650,34 @@ class StructuralAnalysisViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-fA-F-]+)')
+    def job_status(self, request, job_id=None):
+        """
+        Poll a queued analysis.
+        Returns status queued/running/done/failed and, once done, the analysis.
+        """
+        jobs = AnalysisJob.objects.select_related('fort', 'analysis')
+        if not request.user.is_staff:
+            jobs = jobs.filter(requested_by=request.user)
+        try:
+            job = jobs.get(id=job_id)
+        except (AnalysisJob.DoesNotExist, ValueError, ValidationError):
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            'job_id': str(job.id),
+            'status': job.status,
+            'fort_id': job.fort_id,
+            'fort_name': job.fort.name,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+        if job.status == AnalysisJob.DONE and job.analysis:
+            data['analysis'] = self.get_serializer(job.analysis, context={'request': request}).data
+        elif job.status == AnalysisJob.FAILED:
+            data['error'] = f'Analysis failed: {job.error}'
+        return Response(data)
 
 # ─────────────────────────────────────────────
 # Role-Based Damage Reports
@@ -11,6 +11,54 @@ python manage.py collectstatic --noinput
 echo "Setting up Admin User..."
 python setup_admin.py
 
+echo "Preparing Metrics Directory..."
+# Web and analysis worker processes share their Prometheus samples here
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/durgsetu-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# From here on a failing process is handled by the supervision below
+set +o errexit
+
+echo "Starting Analysis Workers..."
+# Polls the database job queue filled by the analyze endpoint.  If the
+# worker dies it is restarted, waiting 1, 2, 4 ... up to 60 s between
+# attempts while it keeps failing quickly; gunicorn keeps serving meanwhile
+# and queued jobs wait for the next worker.
+run_worker() {
+    local delay=1 child started status
+    trap 'kill -TERM "$child" 2>/dev/null; wait "$child"; exit 0' TERM INT
+    while true; do
+        started=$SECONDS
+        PROCESS_ROLE=inference python manage.py run_analysis_worker &
+        child=$!
+        wait "$child"
+        status=$?
+        if (( SECONDS - started > 60 )); then
+            delay=1
+        fi
+        echo "Analysis worker exited with status $status; restarting in ${delay}s."
+        sleep "$delay" &
+        child=$!
+        wait "$child"
+        delay=$(( delay * 2 > 60 ? 60 : delay * 2 ))
+    done
+}
+run_worker &
+worker_pid=$!
+
 echo "Starting Gunicorn server..."
 # The PORT environment variable is automatically provided by Render
-gunicorn backend.wsgi:application --bind 0.0.0.0:${PORT:-8000}
+gunicorn backend.wsgi:application --bind 0.0.0.0:${PORT:-8000} &
+web_pid=$!
+
+# Shutdown signals go to both.  The service lives as long as gunicorn does:
+# when it exits the worker is stopped and the script exits with its status,
+# so the platform restarts the service.
+trap 'kill -TERM "$worker_pid" "$web_pid" 2>/dev/null' TERM INT
+wait "$web_pid"
+status=$?
+echo "Gunicorn exited with status $status; stopping the service."
+kill -TERM "$worker_pid" "$web_pid" 2>/dev/null
+wait
+exit "$status"
@@ -1,13 +1,24 @@
+import json
+import sys
+
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 
-# Data
-runs = ['Run 1', 'Run 2', 'Run 3', 'Average']
-accuracy = [0.7750, 0.6000, 0.6500, 0.6750]
-precision = [0.6897, 0.5667, 0.6000, 0.6188]
-recall = [1.0000, 0.8500, 0.9000, 0.9167]
-f1_score = [0.8163, 0.6800, 0.7200, 0.7388]
+# Data: the report of `python manage.py evaluate_detector <pairs_dir>` (backend/)
+report_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'backend', 'evaluation.json')
+if not os.path.exists(report_path):
+    sys.exit(f"No evaluation report at {report_path}; run `python manage.py evaluate_detector <pairs_dir>` "
+             f"in backend/ first, or pass the report path.")
+with open(report_path) as f:
+    report = json.load(f)
+
+rows = report['k_factors']
+runs = [f"k={row['k_factor']:g}" for row in rows]
+accuracy = [row['accuracy'] for row in rows]
+precision = [row['precision'] for row in rows]
+recall = [row['recall'] for row in rows]
+f1_score = [row['f1'] for row in rows]
 
 # Set up the figure
 plt.figure(figsize=(10, 6))
@@ -19,8 +30,8 @@ plt.plot(runs, recall, marker='^', label='Recall', linewidth=2, markersize=8)
 plt.plot(runs, f1_score, marker='D', label='F1-Score', linewidth=2, markersize=8)
 
 # Add title and labels
-plt.title('DurgSetu AI Evaluation Metrics Across Runs', fontsize=16, fontweight='bold', pad=20)
-plt.xlabel('Evaluation Runs', fontsize=12)
+plt.title(f"DurgSetu AI Evaluation Metrics by k_factor ({report['pairs']} pairs, {report['profile']})", fontsize=16, fontweight='bold', pad=20)
+plt.xlabel('Adaptive threshold k_factor', fontsize=12)
 plt.ylabel('Score (0.0 to 1.0)', fontsize=12)
 plt.ylim(0, 1.1)
 plt.grid(True, linestyle='--', alpha=0.7)
@@ -41,10 +52,10 @@ plt.close()
 # Generate second plot for Confusion Matrix elements (TP, TN, FP, FN)
 plt.figure(figsize=(10, 6))
 
-tp = [20, 17, 18, 18.33]
-tn = [11, 7, 8, 8.67]
-fp = [9, 13, 12, 11.33]
-fn = [0, 3, 2, 1.67]
+tp = [row['confusion']['tp'] for row in rows]
+tn = [row['confusion']['tn'] for row in rows]
+fp = [row['confusion']['fp'] for row in rows]
+fn = [row['confusion']['fn'] for row in rows]
 
 # Define bar width and positions
 bar_width = 0.2
@@ -55,7 +66,7 @@ plt.bar(index + bar_width, tn, bar_width, label='True Negatives (TN)', color='bl
 plt.bar(index + 2*bar_width, fp, bar_width, label='False Positives (FP)', color='orange', alpha=0.7)
 plt.bar(index + 3*bar_width, fn, bar_width, label='False Negatives (FN)', color='red', alpha=0.7)
 
-plt.xlabel('Evaluation Runs', fontsize=12)
+plt.xlabel('Adaptive threshold k_factor', fontsize=12)
 plt.ylabel('Count', fontsize=12)
 plt.title('DurgSetu AI Confusion Matrix Metrics', fontsize=16, fontweight='bold', pad=20)
 plt.xticks(index + bar_width * 1.5, runs)
@@ -67,3 +78,24 @@ plt.tight_layout()
 plt.savefig(confusion_plot_path, dpi=300, bbox_inches='tight')
 print(f"Confusion matrix graph saved successfully to: {confusion_plot_path}")
 plt.close()
+
+# Third plot: per-analysis latency
+plt.figure(figsize=(10, 6))
+
+latencies = [run['latency_ms'] for pair in report['results'] for run in pair['runs']]
+plt.hist(latencies, bins=30, color='steelblue', alpha=0.8)
+for label, value, style in (('p50', report['latency_ms']['p50'], '--'), ('p95', report['latency_ms']['p95'], ':')):
+    plt.axvline(value, color='black', linestyle=style, label=f'{label}: {value:.0f} ms')
+
+plt.xlabel('Analysis latency (ms)', fontsize=12)
+plt.ylabel('Analyses', fontsize=12)
+plt.title(f"DurgSetu AI Latency ({report['analyses_per_second']:.2f} analyses/s on {report['processes']} processes)",
+          fontsize=16, fontweight='bold', pad=20)
+plt.legend(loc='upper right', fontsize=10)
+plt.grid(True, axis='y', linestyle='--', alpha=0.7)
+
+latency_plot_path = os.path.join(os.path.dirname(__file__), 'latency_graph.png')
+plt.tight_layout()
+plt.savefig(latency_plot_path, dpi=300, bbox_inches='tight')
+print(f"Latency graph saved successfully to: {latency_plot_path}")
+plt.close()